@@ -0,0 +1,105 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per call cost of the old text scraping helpers against the typed reads.
+#
+#   (gdb) scubench 0x7a1c2e4010 2000
+#
+# addr should point at a scudo chunk header; every variant reads the same
+# 8 bytes, the word at addr, and evaluates the same symbol.
+
+from __future__ import print_function
+import time
+import gdb
+import gdb_common
+import utils
+
+
+def text_header(addr):
+    out = gdb.execute("x/8xb {}".format(addr), to_string=True)
+    data = "".join(b[2:] for b in out.split(":")[1].split())
+    return int("".join(reversed([data[i:i + 2]
+                                 for i in range(0, 16, 2)])), 16)
+
+
+def typed_header(addr, cached):
+    return gdb_common.read_u64(addr, cached)
+
+
+def text_bits(addr):
+    out = gdb.execute("x/t {}".format(addr), to_string=True)
+    number = out.split("\t")[-1].rstrip("\n")
+    return int(number[len(number) - 8:], 2)
+
+
+def typed_bits(addr):
+    return gdb_common.read_u32(addr, cached=False) & 0xff
+
+
+def text_value(expr):
+    value = str(gdb.parse_and_eval(expr)).split(" ")[-1]
+    return int(value, 16) if value.startswith('0x') else int(value)
+
+
+def typed_value(expr):
+    return int(gdb.parse_and_eval(expr))
+
+
+def measure(func, count, *args):
+    start = time.time()
+    for _ in range(count):
+        func(*args)
+    return (time.time() - start) * 1e6 / count
+
+
+def run(addr, count=1000, expr="Allocator.Primary.NumClasses"):
+    cases = [
+        ("chunk header", "x/8xb + split",
+         lambda: text_header(addr),
+         "read_u64 uncached", lambda: typed_header(addr, False)),
+        ("chunk header", "x/8xb + split",
+         lambda: text_header(addr),
+         "read_u64 page cache", lambda: typed_header(addr, True)),
+        ("register bits", "x/t + split",
+         lambda: text_bits(addr),
+         "read_u32 uncached", lambda: typed_bits(addr)),
+        ("value", "str(gdb.Value)",
+         lambda: text_value(expr),
+         "int(gdb.Value)", lambda: typed_value(expr)),
+    ]
+    table = [("call site", "old", "old_us", "new", "new_us", "speedup")]
+    for name, old_name, old, new_name, new in cases:
+        if old() != new():
+            print("[bench] {}: results differ".format(name))
+        old_us = measure(old, count)
+        new_us = measure(new, count)
+        table.append((name, old_name, "{:.2f}".format(old_us), new_name,
+                      "{:.2f}".format(new_us),
+                      "{:.1f}x".format(old_us / max(new_us, 1e-9))))
+    print(utils.assemble_table(table))
+
+
+def command(arg):
+    '''scubench <chunk header addr> [count] [expr]'''
+
+    args = arg.split()
+    if not args:
+        print(command.__doc__)
+        return
+    addr = int(args[0], 16)
+    count = int(args[1]) if len(args) > 1 else 1000
+    if len(args) > 2:
+        run(addr, count, args[2])
+    else:
+        run(addr, count)
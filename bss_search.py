@@ -16,6 +16,7 @@ import threading
 import time
 import gdb
 import gdb_common as dbg
+import symbolizer
 import datetime
 
 g_exit_flag = False
@@ -85,7 +86,7 @@ def process_data(gdb_output):
 
 
 def find_libc_bss():
-    raw_out = gdb.execute('info files', to_string=True)
+    raw_out = dbg.gdb_execute('info files')
     for line in raw_out.split('\n'):
         if line.find("libc.so") != -1 and line.find(".bss") != -1:
             try:
@@ -109,9 +110,8 @@ def parse_libc_bss(start_addr, bss_size):
             for j in range(0, 16/word_size):
                 start_scan_addr = int(start_addr, 16) + \
                     j * word_size + i * per_bss_scan_size
-                gdb_output = gdb.execute(
-                    'x/{}a {}'.format(per_bss_scan_size/8, start_scan_addr),
-                    to_string=True)
+                gdb_output = dbg.gdb_execute(
+                    'x/{}a {}'.format(per_bss_scan_size/8, start_scan_addr))
                 if process_data(gdb_output):
                     return True
     return False
@@ -120,6 +120,9 @@ def parse_libc_bss(start_addr, bss_size):
 def get_g_thread_list():
     global g_search_result
     g_search_result = None
+    addr = symbolizer.get_symbolizer().address_of("g_thread_list")
+    if addr:
+        return dbg.read_ptr(addr)
     result = find_libc_bss()
     if not result:
         return None
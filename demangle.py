@@ -0,0 +1,186 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# C++ demangling without a c++filt process per name. Names are demangled
+# in process with the cxxfilt module when it is installed, otherwise by one
+# c++filt co-process fed a line per name. Results are kept in a bounded
+# LRU cache that is saved next to the layout caches.
+
+import os
+import json
+import time
+import logging
+import subprocess
+from collections import OrderedDict
+import gdb_common
+import profiler
+try:
+    import cxxfilt
+except ImportError:
+    cxxfilt = None
+
+CACHE_MAX_ENTRIES = 100000
+CACHE_FILE = os.path.join(gdb_common.LAYOUT_CACHE_DIR, "demangle.json")
+CXXFILT = "c++filt"
+# names written to c++filt before its answers are read back
+PIPE_BATCH = 32
+
+cache = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0}
+cache_loaded = False
+cache_dirty = False
+coprocess = None
+
+
+class CxxFilt:
+    """c++filt reading names from stdin, one output line per input line."""
+
+    def __init__(self, path=CXXFILT):
+        self.proc = subprocess.Popen([path], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     universal_newlines=True, bufsize=1)
+
+    def demangle_all(self, names):
+        result = []
+        # small batches, so neither pipe fills up while the other waits
+        for i in range(0, len(names), PIPE_BATCH):
+            batch = names[i:i + PIPE_BATCH]
+            self.proc.stdin.write("".join(name + "\n" for name in batch))
+            self.proc.stdin.flush()
+            for _ in batch:
+                line = self.proc.stdout.readline()
+                if not line:
+                    raise IOError("c++filt exited")
+                result.append(line.rstrip("\n"))
+        return result
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def demangle_names(names):
+    """demangled names, None when c++filt could not run"""
+    global coprocess
+    if cxxfilt is not None:
+        result = []
+        for name in names:
+            try:
+                result.append(cxxfilt.demangle(name))
+            except Exception:
+                result.append(name)
+        return result
+    try:
+        if coprocess is None:
+            coprocess = CxxFilt()
+        return coprocess.demangle_all(names)
+    except (IOError, OSError, ValueError) as e:
+        # c++filt died, start a new one for the next batch
+        close()
+        logging.warning("[parser] c++filt failed: {}".format(e))
+        return None
+
+
+def demangle_all(names):
+    """{mangled: demangled} for names, running the demangler only for the
+    names not cached yet"""
+    global cache_dirty
+    load_cache()
+    result = {}
+    missing = []
+    for name in set(names):
+        if name in cache:
+            cache_stats["hits"] += 1
+            value = cache.pop(name)
+            cache[name] = value
+            result[name] = value
+        else:
+            cache_stats["misses"] += 1
+            missing.append(name)
+    if missing:
+        # a name on a line of its own, a newline would desync the pipe
+        missing = [name for name in missing if "\n" not in name]
+        start = time.time()
+        demangled = demangle_names(missing)
+        profiler.record("demangle", time.time() - start, len(missing))
+        if demangled is None:
+            # mangled for now, not cached so a later call tries again
+            for name in missing:
+                result[name] = name
+            return result
+        for name, value in zip(missing, demangled):
+            result[name] = value
+            cache[name] = value
+        while len(cache) > CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+        cache_dirty = True
+    return result
+
+
+def demangle(name):
+    return demangle_all([name]).get(name, name)
+
+
+def load_cache(path=None):
+    global cache_loaded
+    if cache_loaded:
+        return
+    cache_loaded = True
+    path = path or CACHE_FILE
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path) as f:
+            for name, value in json.load(f):
+                cache[name] = value
+    except (IOError, OSError, ValueError) as e:
+        logging.warning("[parser] ignore demangle cache {}: {}".format(path, e))
+
+
+def save_cache(path=None):
+    global cache_dirty
+    if not cache_dirty:
+        return
+    path = path or CACHE_FILE
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + ".tmp", "w") as f:
+            # oldest first, so loading keeps the LRU order
+            json.dump(list(cache.items()), f)
+        os.rename(path + ".tmp", path)
+        cache_dirty = False
+    except (IOError, OSError) as e:
+        logging.warning("[parser] cannot save demangle cache {}: {}".format(path, e))
+
+
+def cache_info():
+    info = dict(cache_stats)
+    info["entries"] = len(cache)
+    info["max_entries"] = CACHE_MAX_ENTRIES
+    info["backend"] = "cxxfilt" if cxxfilt is not None else CXXFILT
+    return info
+
+
+def close():
+    global coprocess
+    if coprocess is not None:
+        try:
+            coprocess.close()
+        except (IOError, OSError, ValueError):
+            pass
+        coprocess = None
+
+
+profiler.add_counters("demangle", cache_info)
@@ -6,6 +6,9 @@ from gdb_common import *
 import sys
 import subprocess
 import os
+import time
+import profiler
+import symbolizer
 
 # TARGET_ELF_FILE = "/home/liguang/work_space/siflower/freertos/FreeRTOS-MIPS/FreeRTOS/Demo/MIPS32_GCC/RTOSDemo.elf"
 TARGET_ELF_FILE = "/home/liguang/work_space/benji/splfdl_evb/objs_spl/SPL.elf"
@@ -26,8 +29,11 @@ def Run(args, verbose=None, **kwargs):
   return subprocess.Popen(args, **kwargs)
 
 def RunAndCheckOutput(args, verbose=None, **kwargs):
+  start = time.time()
   proc = Run(args, verbose=verbose, **kwargs)
   output, _ = proc.communicate()
+  profiler.record("subprocess " + os.path.basename(args[0]),
+                  time.time() - start, len(output or ""))
   # Don't log any if caller explicitly says so.
   if verbose != False and output:
     print(output.decode('utf-8'))
@@ -72,9 +78,23 @@ mode = CS_MODE_MIPS32 + CS_MODE_LITTLE_ENDIAN
 md = Cs(arch, mode)
 md.detail = True
 
+target_symbols = None
+
+def target_symbolizer():
+    # the firmware image is linked at its load address, no bias
+    global target_symbols
+    if target_symbols is None:
+        target_symbols = symbolizer.Symbolizer()
+        if os.path.isfile(TARGET_ELF_FILE):
+            target_symbols.add_elf(TARGET_ELF_FILE)
+    return target_symbols
+
 def parse_symbol(addr):
+    resolver = target_symbolizer()
+    if resolver.modules:
+        return resolver.lookup(addr)
     try:
-        gdb_out = gdb.execute('x {}'.format(addr), to_string=True)
+        gdb_out = gdb_execute('x {}'.format(addr))
         # print(gdb_out)
         line_list = gdb_out.split()
         if line_list[1].startswith('<'):
@@ -6,40 +6,55 @@ from capstone import *
 from capstone.mips import *
 import dump_stack
 from freertos_cfg import *
+import profiler
 
-def parse_task(task_item_str, stats, sub_item_index=0xffff):
+TCB_MEMBERS = ["pcTaskName[]", "uxPriority", "xCoreID", "rCoreID",
+               "uxBasePriority", "uxCriticalNesting", "pxTopOfStack",
+               "ulRunTimeCounter", "pxStack"]
+LIST_MEMBERS = ["uxNumberOfItems", "pxIndex"]
+LIST_ITEM_MEMBERS = ["xItemValue", "pxNext", "pxPrevious", "pvOwner"]
+LIST_END_ITEM_VALUE = 0xffffffff
+
+
+def pointer_value(symbol):
+    return convert2int(get_value(symbol))
+
+
+def list_addr(list_name):
+    # pxDelayedTaskList and friends are pointers to the List_t
+    if get_value(list_name).type.strip_typedefs().code == gdb.TYPE_CODE_PTR:
+        return pointer_value(list_name)
+    return symbol_address(list_name)
+
+
+def task_name_of(tcb):
+    task_name = tcb["pcTaskName"].split(b"\0")[0]
+    if not isinstance(task_name, str):
+        task_name = task_name.decode("utf-8", "replace")
+    return task_name
+
+
+def parse_task(task_addr, stats, sub_item_index=0xffff):
     global total_ticks
-    task_addr = hex(int(str(get_value(task_item_str)).split(" ")[0], 16))
-    task_name_str = "(*(TCB_t*){})->pcTaskName".format(task_item_str)
-    task_priority_str = "(*(TCB_t*){})->uxPriority".format(task_item_str)
-    task_core_id_str = "(*(TCB_t*){})->xCoreID".format(task_item_str)
-    task_rcore_id_str = "(*(TCB_t*){})->rCoreID".format(task_item_str)
-    task_base_priority_str = "(*(TCB_t*){})->uxBasePriority".format(task_item_str)
-    task_uxCriticalNesting_str = "(*(TCB_t*){})->uxCriticalNesting".format(task_item_str)
-    task_pxTopOfStack_str = "(*(TCB_t*){})->pxTopOfStack".format(task_item_str)
-    task_ulRunTimeCounter_str = "(*(TCB_t*){})->ulRunTimeCounter".format(task_item_str)
-    task_stackend_str = "(*(TCB_t*){})->pxStack".format(task_item_str)
-
-    # print(task_name_str)
-    task_name_complex = str(get_value(task_name_str)).split(",")[0].lstrip("\"")
-    task_name = task_name_complex[:task_name_complex.find('\\000')]
+    tcb = struct_layout("TCB_t", TCB_MEMBERS).read(task_addr)
+
+    task_name = task_name_of(tcb)
     if sub_item_index == 0xffff:
-        task_priority = symbol_int_value(task_priority_str)
+        task_priority = tcb["uxPriority"]
     else:
         task_priority = sub_item_index
-    task_base_priority = symbol_int_value(task_base_priority_str)
-    task_uxCriticalNesting = symbol_int_value(task_uxCriticalNesting_str)
-    task_core_id = hex(symbol_int_value(task_core_id_str))
-    task_rcore_id = symbol_int_value(task_rcore_id_str)
-    task_pxTopOfStack = str(get_value(task_pxTopOfStack_str)).split(" ")[0]
-    task_epc = read_word(int(task_pxTopOfStack, 16) + EPC_OFFSET)
-    task_ra = read_word(int(task_pxTopOfStack, 16) + RA_OFFSET)
-    task_sp = int(task_pxTopOfStack, 16) + SP_OFFSET
-    task_stackend = str(get_value(task_stackend_str)).split(" ")[0]
-    task_free_space = int(task_pxTopOfStack, 16) - int(task_stackend, 16)
-    task_ulRunTimeCounter = symbol_int_value(task_ulRunTimeCounter_str)
+    task_base_priority = tcb["uxBasePriority"]
+    task_uxCriticalNesting = tcb["uxCriticalNesting"]
+    task_core_id = hex(tcb["xCoreID"])
+    task_rcore_id = tcb["rCoreID"]
+    task_pxTopOfStack = hex(tcb["pxTopOfStack"])
+    task_epc = read_word(tcb["pxTopOfStack"] + EPC_OFFSET)
+    task_ra = read_word(tcb["pxTopOfStack"] + RA_OFFSET)
+    task_sp = tcb["pxTopOfStack"] + SP_OFFSET
+    task_free_space = tcb["pxTopOfStack"] - tcb["pxStack"]
+    task_ulRunTimeCounter = tcb["ulRunTimeCounter"]
     task_cpu_percent = "{:4.1f}%".format(task_ulRunTimeCounter*100/float(total_ticks))
-    task = TASK(task_addr, task_name, task_core_id, task_rcore_id, task_priority, task_base_priority,
+    task = TASK(hex(task_addr), task_name, task_core_id, task_rcore_id, task_priority, task_base_priority,
         task_uxCriticalNesting, task_pxTopOfStack, hex(task_epc), hex(task_sp), hex(task_ra), 
         task_free_space, task_ulRunTimeCounter, task_cpu_percent, stats)
     return task
@@ -48,26 +63,19 @@ def parse_task(task_item_str, stats, sub_item_index=0xffff):
 def parse_task_list(list_name, stats, sub_item_index=0xffff):
     global taskstats
     task_dict = taskstats.task_dict
-    item_index = 0
     task_list = []
-    uxNumerofItems_str = list_name + ".uxNumberOfItems"
-    uxNumerofItems = symbol_int_value(uxNumerofItems_str)
+    list_head = struct_layout("List_t", LIST_MEMBERS).read(list_addr(list_name))
+    item_layout = struct_layout("ListItem_t", LIST_ITEM_MEMBERS)
+    uxNumerofItems = list_head["uxNumberOfItems"]
+    item_addr = list_head["pxIndex"]
     skip_end_flag = False
-    while item_index < uxNumerofItems:
-        # print(item_index, uxNumerofItems)
-        task_list_item_str = list_name + '.pxIndex' + item_index * '->pxPrevious'
-        list_item_value_str = task_list_item_str + '.xItemValue'
-        # print(list_item_value_str)
-        # print(symbol_int_value(list_item_value_str))
-        if symbol_int_value(list_item_value_str) == 0xffffffff and not skip_end_flag:
-            item_index = item_index + 1;
-            uxNumerofItems = uxNumerofItems + 1;
+    while len(task_list) < uxNumerofItems:
+        list_item = item_layout.read(item_addr)
+        item_addr = list_item["pxPrevious"]
+        if list_item["xItemValue"] == LIST_END_ITEM_VALUE and not skip_end_flag:
             skip_end_flag = True
-            # print(j, uxNumerofItems)
             continue
-        item_index = item_index + 1;
-        task_item_str = task_list_item_str + '.pvOwner'
-        task = parse_task(task_item_str, stats, sub_item_index)
+        task = parse_task(list_item["pvOwner"], stats, sub_item_index)
         task_list.append(task)
         task_dict[task.addr] = task
     # print("parse_task_list end", list_name)
@@ -79,7 +87,7 @@ def parse_ready_list():
     current_task_list = taskstats.current_task_list
     for i in range(CPU_NUMBERS):
         current_task_str = "pxCurrentTCB[{}]".format(i)
-        current_task_addr = hex(int(str(get_value(current_task_str)).split(" ")[0], 16))
+        current_task_addr = hex(pointer_value(current_task_str))
         current_task_list.append(current_task_addr)
     for i in range(configMAX_PRIORITIES):
         ready_lists_str = "pxReadyTasksLists[{}]".format(i)
@@ -103,11 +111,12 @@ def parse_current_tcb():
     task_dict = taskstats.task_dict
     for i in range(CPU_NUMBERS):
         item_str = "pxCurrentTCB[{}]".format(i)
-        task = parse_task(item_str, "RUNNING")
+        task = parse_task(pointer_value(item_str), "RUNNING")
         task_dict[task.addr] = task
     
 def parse():
     global taskstats, ready_lists, delay1_list, delay2_list, task_dict, total_ticks
+    load_layout_cache()
     total_ticks = symbol_int_value("xTotalTicks")
     ready_lists = []
     delay1_list = []
@@ -119,11 +128,15 @@ def parse():
     # # print("parse_current_tcb()")
     # parse_current_tcb()
     # print("parse_ready_list()")
-    parse_ready_list()
+    with profiler.phase("ready_list"):
+        parse_ready_list()
     # print("parse_delay_list()")
-    parse_delay_list()
+    with profiler.phase("delay_list"):
+        parse_delay_list()
     # print("parse_suspend_list()")
-    parse_suspend_list()
+    with profiler.phase("suspend_list"):
+        parse_suspend_list()
+    save_layout_cache()
     # print("end")
 
 def dump_tasks_clear_cache():
@@ -137,6 +150,20 @@ def dump_task_stack(arg):
     ra = int(arg.split(" ")[2], 16)
     print(dump_stack.dump_caller(sp, epc, ra))
 
+def value_cache(arg):
+    # dvcache [on|off] [expr]
+    args = arg.split(None, 1)
+    if args and args[0] in ("on", "off"):
+        symbol = args[1] if len(args) > 1 else None
+        set_value_cache(args[0] == "on", symbol)
+        return
+    table = [("key", "value")]
+    for k, v in sorted(value_cache_info().items()):
+        table.append((k, v))
+    print(utils.assemble_table(table))
+    if value_cache_skip:
+        print("not cached: " + " ".join(sorted(value_cache_skip)))
+
 def dump_tasks():
     global taskstats
     task_dict = taskstats.task_dict
@@ -177,16 +204,16 @@ def dump_task(arg):
 
 def dump_list(arg):
     # arg = "pxReadyTasksLists[1]"
-    uxNumerofItems_str =  arg + ".uxNumberOfItems"
-    uxNumerofItems = symbol_int_value(uxNumerofItems_str)
-    for i in range(uxNumerofItems + 1):
-        task_name_str = "(*(TCB_t*){}->pxIndex{}->pvOwner)->pcTaskName".format(arg, i*"->pxNext")
-        core_id_str = "(*(TCB_t*){}->pxIndex{}->pvOwner)->xCoreID".format(arg, i*"->pxNext")
-        handle_str = "{}->pxIndex{}->pvOwner".format(arg, i*"->pxNext")
-        task_addr = hex(int(str(get_value(handle_str)).split(" ")[0], 16))
-        
-        task_name_complex = str(gdb.parse_and_eval(task_name_str)).split(",")[0].lstrip("\"")
-        task_name = task_name_complex[:task_name_complex.find('\\000')]
-        core_id = hex(symbol_int_value(core_id_str))
-        print(i, task_name, core_id, task_addr)
-        
\ No newline at end of file
+    list_head = struct_layout("List_t", LIST_MEMBERS).read(list_addr(arg))
+    item_layout = struct_layout("ListItem_t", LIST_ITEM_MEMBERS)
+    tcb_layout = struct_layout("TCB_t", TCB_MEMBERS)
+    item_addr = list_head["pxIndex"]
+    for i in range(list_head["uxNumberOfItems"] + 1):
+        list_item = item_layout.read(item_addr)
+        item_addr = list_item["pxNext"]
+        if list_item["xItemValue"] == LIST_END_ITEM_VALUE:
+            continue
+        tcb = tcb_layout.read(list_item["pvOwner"])
+        task_name = task_name_of(tcb)
+        core_id = hex(tcb["xCoreID"])
+        print(i, task_name, core_id, hex(list_item["pvOwner"]))
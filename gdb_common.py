@@ -13,7 +13,22 @@
 # limitations under the License.
 
 
-import gdb
+import os
+import re
+import json
+import time
+import struct
+from collections import OrderedDict
+try:
+    import gdb
+except ImportError:
+    # offline mode, see set_memory_source() and load_layout()
+    gdb = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+import profiler
 
 
 # cache
@@ -21,70 +36,483 @@ cache_d = {}
 cache_d["offsets"] = {}
 cache_d["sizes"] = {}
 cache_d["values"] = {}
+cache_d["types"] = {}
+cache_d["symbols"] = {}
+cache_d["layouts"] = {}
+cache_d["constants"] = {}
+cache_d["exprs"] = {}
+
+# cache_d entries that only depend on the binary, they make up the
+# layout file used to parse without gdb
+LAYOUT_KEYS = ("offsets", "sizes", "types", "symbols", "constants",
+               "dword_size", "byte_order")
+# the part of them that survives clear_cache()
+TYPE_LAYOUT_KEYS = ("offsets", "sizes", "types", "layouts",
+                    "dword_size", "byte_order")
+
+# layouts are persisted per build-id of the ELF defining the types
+LAYOUT_CACHE_DIR = os.environ.get(
+    "GDB_PARSER_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "gdb_parser"))
+LAYOUT_OBJFILE = "libc.so"
+
+# struct codes of unsigned words by size
+INT_CODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+# page cache in front of inferior reads, every gdbserver round trip is
+# expensive so whole pages are fetched once and served from here until
+# the target runs again
+PAGE_SIZE = 0x1000
+PAGE_MASK = ~(PAGE_SIZE - 1)
+page_cache_max_pages = 4096
+page_cache = OrderedDict()
+page_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# ReadBatch merges requests closer than READ_MERGE_GAP bytes into one read
+# as long as the merged read stays below READ_MAX_SPAN
+READ_MERGE_GAP = 0x400
+READ_MAX_SPAN = 0x100000
+
+# get_value results, valid until the next stop/cont/new_objfile event
+value_cache_enabled = True
+value_cache_skip = set()
+value_cache_stats = {"hits": 0, "misses": 0}
+stop_epoch = 0
+
+
+class LayoutError(LookupError):
+    pass
+
+
+class MemoryAccessError(Exception):
+    pass
+
+
+def layout_lookup(section, key):
+    try:
+        return cache_d[section][key]
+    except KeyError:
+        raise LayoutError("{} '{}' not in layout".format(section, key))
 
 
 def symbol_int_value(symbol):
+    global cache_d
+    if symbol in cache_d["constants"]:
+        return cache_d["constants"][symbol]
+    size_key = "({})".format(symbol)
+    if gdb is None or (symbol in cache_d["symbols"] and
+                       size_key in cache_d["sizes"]):
+        size = type_size(size_key)
+        return bytes2num(read_bytes(symbol_address(symbol), size), size)
+    cache_d["exprs"][symbol] = None
     return convert2int(get_value(symbol))
 
 
+def gdb_execute(command):
+    return profiler.call("gdb.execute", gdb.execute, command, to_string=True)
+
+
+def parse_and_eval(expr):
+    return profiler.call("gdb.parse_and_eval", gdb.parse_and_eval, expr)
+
+
 def convert2int(val):
-    value = str(val).split(" ")[-1]
-    return int(value, 16) if value.startswith('0x') else int(value)
+    try:
+        # scalars, enums and pointers convert without printing the value
+        return int(val)
+    except (TypeError, ValueError, RuntimeError):
+        value = str(val).split(" ")[-1]
+        return int(value, 16) if value.startswith('0x') else int(value)
 
 
 def arch_dword_size():
     global cache_d
     if "dword_size" in cache_d:
         return cache_d["dword_size"]
+    if gdb is None:
+        raise LayoutError("dword_size not in layout")
     abi = gdb.selected_frame().architecture().name()
     # print(abi)
     cache_d["dword_size"] = 8
-    if abi is "aarch64":
+    if abi == "aarch64":
         cache_d["dword_size"] = 8
-    elif abi is "arm":
+    elif abi == "arm":
         cache_d["dword_size"] = 4
     elif abi.find("32") != -1:
         cache_d["dword_size"] = 4
     return cache_d["dword_size"]
 
 
+def arch_byte_order():
+    global cache_d
+    if "byte_order" in cache_d:
+        return cache_d["byte_order"]
+    if gdb is None:
+        raise LayoutError("byte_order not in layout")
+    cache_d["byte_order"] = "little"
+    endian = gdb_execute("show endian")
+    if endian.find("big endian") != -1:
+        cache_d["byte_order"] = "big"
+    return cache_d["byte_order"]
+
+
+def struct_prefix():
+    return ">" if arch_byte_order() == "big" else "<"
+
+
 def offset_of(s_name, m_name):
     global cache_d
     key = "{}.{}".format(s_name, m_name)
     if key not in cache_d["offsets"]:
+        if gdb is None:
+            return layout_lookup("offsets", key)
         expr = '(size_t)&((({} *)0)->{}) - (size_t)(({} *)0)'.format(
                s_name, m_name, s_name)
-        cache_d["offsets"][key] = convert2int(gdb.parse_and_eval(expr))
+        cache_d["offsets"][key] = convert2int(parse_and_eval(expr))
     return cache_d["offsets"][key]
 
 
 def type_size(type_name):
     global cache_d
     if type_name not in cache_d["sizes"]:
+        if gdb is None:
+            return layout_lookup("sizes", type_name)
         cache_d["sizes"][type_name] = convert2int(
-            gdb.parse_and_eval('sizeof({})'.format(type_name)))
+            parse_and_eval('sizeof({})'.format(type_name)))
     return cache_d["sizes"][type_name]
 
 
-def get_value(symbol):
-    return gdb.parse_and_eval(symbol)
-    # global cache_d
+def member_size(s_name, m_name):
+    return type_size("(({} *)0)->{}".format(s_name, m_name))
+
+
+def type_name_of(symbol):
+    global cache_d
+    if symbol not in cache_d["types"]:
+        if gdb is None:
+            return layout_lookup("types", symbol)
+        cache_d["types"][symbol] = str(
+            parse_and_eval(symbol).type.strip_typedefs())
+    return cache_d["types"][symbol]
+
+
+def symbol_address(symbol):
+    global cache_d
+    if symbol not in cache_d["symbols"]:
+        if gdb is None:
+            return layout_lookup("symbols", symbol)
+        cache_d["symbols"][symbol] = convert2int(
+            parse_and_eval('(unsigned long)&({})'.format(symbol)))
+    return cache_d["symbols"][symbol]
+
+
+def get_value(symbol, cached=True):
+    """gdb.Value of symbol, cached until the target stops or runs again"""
+    if gdb is None:
+        raise LayoutError("cannot evaluate '{}' without gdb".format(symbol))
+    if not cached or not value_cache_enabled or symbol in value_cache_skip:
+        return parse_and_eval(symbol)
+    values = cache_d["values"]
+    if symbol in values:
+        value_cache_stats["hits"] += 1
+        return values[symbol]
+    value_cache_stats["misses"] += 1
+    value = parse_and_eval(symbol)
+    if value.is_lazy:
+        # pin the contents of this stop, not of the first later access
+        value.fetch_lazy()
+    values[symbol] = value
+    return value
+
+
+def set_value_cache(enabled=True, symbol=None):
+    """turn the value cache on or off, for everything or one expression"""
+    global value_cache_enabled
+    if symbol is None:
+        value_cache_enabled = enabled
+        cache_d["values"] = {}
+    elif enabled:
+        value_cache_skip.discard(symbol)
+    else:
+        value_cache_skip.add(symbol)
+        cache_d["values"].pop(symbol, None)
+
+
+def value_cache_info():
+    info = dict(value_cache_stats)
+    info["values"] = len(cache_d["values"])
+    info["epoch"] = stop_epoch
+    total = info["hits"] + info["misses"]
+    info["hit_rate"] = float(info["hits"]) / total if total else 0.0
+    return info
+
+
+def read_memory(addr, size, cached=True):
+    return bytes2num(read_bytes(addr, size, cached), size)
+
+
+def read_u8(addr, cached=True):
+    return read_memory(addr, 1, cached)
+
+
+def read_u16(addr, cached=True):
+    return read_memory(addr, 2, cached)
+
+
+def read_u32(addr, cached=True):
+    return read_memory(addr, 4, cached)
+
+
+def read_u64(addr, cached=True):
+    return read_memory(addr, 8, cached)
+
+
+def read_ptr(addr, cached=True):
+    return read_memory(addr, arch_dword_size(), cached)
+
+
+class MemorySource:
+    """Where read_bytes gets target memory from."""
+
+    # whether reads should go through the page cache
+    cacheable = False
+    # False when there is no target memory at all
+    has_memory = True
+
+    def read(self, addr, size):
+        raise NotImplementedError
+
+    def present_ranges(self, addr, size):
+        """[(start, end)] of [addr, addr + size) backed by data, None when
+        the source cannot tell without trying to read"""
+        return None
+
+    def core_path(self):
+        """the core file memory comes from, None for a live process"""
+        return None
+
+
+class GdbMemorySource(MemorySource):
+    cacheable = True
+
+    def read(self, addr, size):
+        return bytearray(gdb.selected_inferior().read_memory(addr, size))
+
+    def core_path(self):
+        # Local core dump file:
+        #         `/data/vold_core_dump', file type elf64-littleaarch64.
+        m = re.search(r"core dump file:\s*`([^']+)'",
+                      gdb_execute("info target"))
+        return m.group(1) if m else None
+
+
+class NoMemory(MemorySource):
+    """Stands in for the target when only a heap snapshot is loaded."""
+
+    has_memory = False
+
+    def read(self, addr, size):
+        raise MemoryAccessError(
+            "no memory at {}, only a snapshot is loaded".format(hex(addr)))
+
+    def present_ranges(self, addr, size):
+        return []
+
+
+memory_source = GdbMemorySource() if gdb is not None else None
+
+
+def set_memory_source(source):
+    global memory_source
+    memory_source = source
+    clear_page_cache()
+
+
+def get_memory_source():
+    return memory_source
+
+
+def read_inferior(addr, size):
+    start = time.time()
+    try:
+        return memory_source.read(addr, size)
+    finally:
+        profiler.record("read_memory", time.time() - start, size)
+
+
+def read_bytes(addr, size, cached=True):
+    if size <= 0:
+        return bytearray()
+    if not memory_source.cacheable:
+        return memory_source.read(addr, size)
+    first_page = addr & PAGE_MASK
+    last_page = (addr + size - 1) & PAGE_MASK
+    npages = (last_page - first_page) // PAGE_SIZE + 1
+    if not cached or npages > page_cache_max_pages:
+        return read_inferior(addr, size)
+    try:
+        buf = read_pages(first_page, npages)
+    except Exception:
+        # some page of the span is not readable, let the exact range
+        # decide whether the read fails
+        return read_inferior(addr, size)
+    off = addr - first_page
+    return buf[off:off + size]
+
+
+class HoleMap:
+    """One flag per page of a sparse read, set when the page has a hole."""
+
+    def __init__(self, addr, size):
+        self.addr = addr
+        self.size = size
+        self.first_page = addr & PAGE_MASK
+        npages = ((addr + size - 1) & PAGE_MASK) - self.first_page
+        self.bits = bytearray(npages // PAGE_SIZE + 1 if size > 0 else 0)
+        self.holes = 0
+
+    def mark(self, start, end):
+        first = (start - self.first_page) // PAGE_SIZE
+        last = (end - 1 - self.first_page) // PAGE_SIZE
+        for i in range(first, last + 1):
+            if not self.bits[i]:
+                self.bits[i] = 1
+                self.holes += 1
 
-    # if symbol not in cache_d["values"]:
-    #     cache_d["values"][symbol] = gdb.parse_and_eval(symbol)
-    # return cache_d["values"][symbol]
+    def missing(self, addr, size):
+        if not self.holes:
+            return False
+        first = max((addr - self.first_page) // PAGE_SIZE, 0)
+        last = min((addr + size - 1 - self.first_page) // PAGE_SIZE,
+                   len(self.bits) - 1)
+        return any(self.bits[first:last + 1])
 
+    def missing_bytes(self):
+        return self.holes * PAGE_SIZE
 
-def read_memory(addr, size):
-    mem = gdb.selected_inferior().read_memory(addr, size)
-    le_mem = 0
-    for i, b in enumerate(mem):
-        le_mem |= (ord(b) << i * 8)
-    return le_mem
 
+def read_sparse(addr, size):
+    """Read whatever exists of [addr, addr + size): returns the buffer,
+    zero filled where memory is missing, and the HoleMap of the span."""
+    buf = bytearray(size)
+    holes = HoleMap(addr, size)
+    if size <= 0:
+        return buf, holes
+    ranges = memory_source.present_ranges(addr, size)
+    if ranges is None:
+        probe_range(addr, addr + size, addr, buf, holes)
+        return buf, holes
+    cur = addr
+    for start, end in ranges:
+        if start > cur:
+            holes.mark(cur, start)
+        buf[start - addr:end - addr] = read_bytes(start, end - start)
+        cur = end
+    if cur < addr + size:
+        holes.mark(cur, addr + size)
+    return buf, holes
 
-def read_bytes(addr, size):
-    return bytearray(gdb.selected_inferior().read_memory(addr, size))
+
+def probe_range(start, end, addr, buf, holes):
+    # read the span at once, split it at page boundaries only when the
+    # read fails, so present memory is fetched in maximal runs
+    try:
+        buf[start - addr:end - addr] = read_bytes(start, end - start)
+        return
+    except Exception:
+        pass
+    mid = (start + (end - start) // 2) & PAGE_MASK
+    if mid <= start:
+        mid = (start & PAGE_MASK) + PAGE_SIZE
+    if mid >= end:
+        holes.mark(start, end)
+        return
+    probe_range(start, mid, addr, buf, holes)
+    probe_range(mid, end, addr, buf, holes)
+
+
+def read_pages(first_page, npages):
+    buf = bytearray()
+    run_start = None
+    for i in range(npages + 1):
+        page = first_page + i * PAGE_SIZE
+        if i < npages and page not in page_cache:
+            page_cache_stats["misses"] += 1
+            if run_start is None:
+                run_start = page
+            continue
+        if run_start is not None:
+            # fetch consecutive missing pages with a single read
+            mem = read_inferior(run_start, page - run_start)
+            for off in range(0, len(mem), PAGE_SIZE):
+                cache_page(run_start + off, mem[off:off + PAGE_SIZE])
+            buf += mem
+            run_start = None
+        if i < npages:
+            page_cache_stats["hits"] += 1
+            data = page_cache.pop(page)
+            page_cache[page] = data
+            buf += data
+    return buf
+
+
+def cache_page(page, data):
+    page_cache[page] = data
+    while len(page_cache) > page_cache_max_pages:
+        page_cache.popitem(last=False)
+        page_cache_stats["evictions"] += 1
+
+
+def set_page_cache_size(max_pages):
+    global page_cache_max_pages
+    page_cache_max_pages = max(int(max_pages), 0)
+    while len(page_cache) > page_cache_max_pages:
+        page_cache.popitem(last=False)
+        page_cache_stats["evictions"] += 1
+
+
+def clear_page_cache():
+    page_cache.clear()
+
+
+def reset_page_cache_stats():
+    for k in page_cache_stats:
+        page_cache_stats[k] = 0
+
+
+def page_cache_info():
+    info = dict(page_cache_stats)
+    info["pages"] = len(page_cache)
+    info["max_pages"] = page_cache_max_pages
+    total = info["hits"] + info["misses"]
+    info["hit_rate"] = float(info["hits"]) / total if total else 0.0
+    return info
+
+
+def on_target_changed(event):
+    # memory may differ once the inferior ran or was written
+    global stop_epoch
+    stop_epoch += 1
+    cache_d["values"] = {}
+    clear_page_cache()
+
+
+def on_new_objfile(event):
+    global stop_epoch
+    stop_epoch += 1
+    reset_cache()
+    clear_page_cache()
+
+
+profiler.add_counters("page_cache", page_cache_info)
+profiler.add_counters("value_cache", value_cache_info)
+
+if gdb is not None and hasattr(gdb, "events"):
+    gdb.events.stop.connect(on_target_changed)
+    gdb.events.cont.connect(on_target_changed)
+    if hasattr(gdb.events, "memory_changed"):
+        gdb.events.memory_changed.connect(on_target_changed)
+    gdb.events.new_objfile.connect(on_new_objfile)
 
 
 def read_word(addr):
@@ -92,34 +520,357 @@ def read_word(addr):
     return dword_in_buf(mem)
 
 
+def read_words(addr, count, width=None):
+    width = width or arch_dword_size()
+    return unpack_words(read_bytes(addr, count * width), width, count)
+
+
 def dword_in_buf(buf, off=0):
-    return bytes2num(buf, arch_dword_size()+off, off)
+    return bytes2num(buf, arch_dword_size(), off)
 
 def clear_cache():
+    # type layouts stay valid until a new objfile is loaded
+    kept = dict((k, cache_d[k]) for k in TYPE_LAYOUT_KEYS if k in cache_d)
+    reset_cache()
+    cache_d.update(kept)
+    clear_page_cache()
+
+
+def reset_cache():
     cache_d.clear()
     cache_d["offsets"] = {}
     cache_d["sizes"] = {}
     cache_d["values"] = {}
+    cache_d["types"] = {}
+    cache_d["symbols"] = {}
+    cache_d["layouts"] = {}
+    cache_d["constants"] = {}
+    cache_d["exprs"] = {}
+
 
 def read_addr_width(addr, off, width):
-    if cache_d.has_key(addr):
-        gdb_out = cache_d[addr]
-    else:
-        gdb_out = gdb.execute("x/t {}".format(addr), to_string=True);
-    number = gdb_out.split("\t")[-1].rstrip("\n")
-    return number[len(number)-off-width:len(number)-off]
+    # registers change under us, never serve them from the page cache
+    word = read_u32(to_int(addr), cached=False)
+    return (word >> off) & ((1 << width) - 1)
+
+
+def to_int(addr):
+    if isinstance(addr, str):
+        return int(addr, 16) if addr.startswith("0x") else int(addr, 0)
+    return int(addr)
 
 def bytes2num(vbytes, nbytes, off=0):
-    buf = vbytes[off:]
+    if nbytes in INT_CODES:
+        return struct.unpack_from(struct_prefix() + INT_CODES[nbytes],
+                                  vbytes, off)[0]
+    buf = bytearray(vbytes[off:off + nbytes])
+    if arch_byte_order() == "big":
+        buf.reverse()
     num = 0
-    for i in range(0, nbytes):
-        num |= (buf[i] << i * 8)
+    for i, b in enumerate(buf):
+        num |= (b << i * 8)
     return num
 
 
+def unpack_words(buf, width, count=None, off=0):
+    """Decode count unsigned width byte words of buf in target order."""
+    if count is None:
+        count = (len(buf) - off) // width
+    return struct.unpack_from("{}{}{}".format(
+        struct_prefix(), count, INT_CODES[width]), buf, off)
+
+
+def words_array(buf, width, count=None, off=0):
+    """Like unpack_words, but a numpy array when numpy is available."""
+    if numpy is None:
+        return unpack_words(buf, width, count, off)
+    if count is None:
+        count = (len(buf) - off) // width
+    return numpy.frombuffer(buf, dtype="{}u{}".format(struct_prefix(), width),
+                            count=count, offset=off)
+
+
 def read_struct_member_value(buf, s_name, m_name, size):
     if size > arch_dword_size():
         return None
     offset = offset_of(s_name, m_name)
     val = bytes2num(buf, size, offset)
     return val
+
+
+class StructLayout:
+    """Decode a set of members of a C struct from one memory read.
+
+    members are member paths of s_name as accepted by offset_of, e.g.
+    "Count" or "Cache.MaxEntrySize.ValDoNotUse". A trailing "[]" reads
+    the whole array member, char arrays come back as a byte string.
+    """
+
+    def __init__(self, s_name, members):
+        self.s_name = s_name
+        self.size = type_size(s_name)
+        fields = []
+        for member in members:
+            is_array = member.endswith("[]")
+            name = member[:-2] if is_array else member
+            size = member_size(s_name, name)
+            count = 1
+            if is_array:
+                elem_size = member_size(s_name, name + "[0]")
+                count = size // elem_size
+                size = elem_size
+            fields.append((offset_of(s_name, name), name, size,
+                           count, is_array))
+        fields.sort()
+
+        fmt = struct_prefix()
+        pos = 0
+        index = 0
+        self.fields = []
+        for offset, name, size, count, is_array in fields:
+            if offset < pos:
+                raise ValueError("member {} overlaps in {}".format(
+                    name, s_name))
+            if offset > pos:
+                fmt += "{}x".format(offset - pos)
+            if is_array and size == 1:
+                fmt += "{}s".format(count)
+                nvalues = 1
+            elif size in INT_CODES:
+                fmt += "{}{}".format(count, INT_CODES[size])
+                nvalues = count
+            else:
+                fmt += "{}s".format(size * count)
+                nvalues = 1
+            single = nvalues == 1 and not (is_array and size != 1)
+            self.fields.append((name, index, index + nvalues, single))
+            index += nvalues
+            pos = offset + size * count
+        self.struct = struct.Struct(fmt)
+
+    def unpack(self, buf, off=0):
+        values = self.struct.unpack_from(buf, off)
+        result = {}
+        for name, begin, end, single in self.fields:
+            result[name] = values[begin] if single else values[begin:end]
+        return result
+
+    def read(self, addr):
+        return self.unpack(read_bytes(addr, self.struct.size))
+
+    def unpack_array(self, buf, off, count, stride=None):
+        stride = stride or self.size
+        return [self.unpack(buf, off + i * stride) for i in range(count)]
+
+    def read_array(self, addr, count, stride=None):
+        if count <= 0:
+            return []
+        stride = stride or self.size
+        buf = read_bytes(addr, stride * (count - 1) + self.struct.size)
+        return self.unpack_array(buf, 0, count, stride)
+
+
+def struct_layout(s_name, members):
+    global cache_d
+    key = (s_name, tuple(members))
+    if key not in cache_d["layouts"]:
+        cache_d["layouts"][key] = StructLayout(s_name, members)
+    return cache_d["layouts"][key]
+
+
+def collect_layout():
+    global cache_d
+    arch_dword_size()
+    arch_byte_order()
+    for expr in list(cache_d["exprs"]):
+        try:
+            symbol_address(expr)
+        except Exception:
+            # no address in memory, e.g. static constexpr members
+            cache_d["symbols"].pop(expr, None)
+            cache_d["constants"][expr] = symbol_int_value(expr)
+            continue
+        # read from memory every time, even if the value read back differs
+        # from gdb's (signed, or changed since): a constant would be applied
+        # to every later core of the build
+        try:
+            type_size("({})".format(expr))
+        except Exception:
+            pass
+    cache_d["exprs"].clear()
+    return dict((k, cache_d[k]) for k in LAYOUT_KEYS if k in cache_d)
+
+
+def dump_layout(path):
+    """Save everything parsing needed from gdb so it can run offline."""
+    layout = collect_layout()
+    with open(path, "w") as f:
+        json.dump(layout, f, indent=1, sort_keys=True)
+
+
+def load_layout(path):
+    global cache_d
+    with open(path) as f:
+        apply_layout(json.load(f))
+
+
+def apply_layout(layout, symbol_base=0):
+    global cache_d
+    for k in LAYOUT_KEYS:
+        if k not in layout:
+            continue
+        if k == "symbols":
+            for symbol, addr in layout[k].items():
+                cache_d[k][symbol] = addr + symbol_base
+        elif isinstance(layout[k], dict):
+            cache_d[k].update(layout[k])
+        else:
+            cache_d[k] = layout[k]
+
+
+def layout_objfile():
+    objfiles = gdb.objfiles()
+    for objfile in objfiles:
+        if os.path.basename(objfile.filename or "") \
+                .startswith(LAYOUT_OBJFILE):
+            return objfile
+    return objfiles[0] if objfiles else None
+
+
+def objfile_build_id(objfile):
+    build_id = getattr(objfile, "build_id", None)
+    if build_id is None and objfile.filename and \
+            os.path.isfile(objfile.filename):
+        import gdb_elf
+        build_id = gdb_elf.read_build_id(objfile.filename)
+    return build_id
+
+
+def objfile_base(objfile):
+    # global symbols move with the load address of shared libraries
+    raw_out = gdb_execute("info sharedlibrary")
+    for line in raw_out.split("\n"):
+        items = line.split()
+        if items and items[0].startswith("0x") and \
+                items[-1] == objfile.filename:
+            return int(items[0], 16)
+    return 0
+
+
+def layout_cache_path(build_id):
+    return os.path.join(LAYOUT_CACHE_DIR, "{}.json".format(build_id))
+
+
+def load_layout_cache():
+    """Preload offsets, sizes and symbols saved by an earlier session."""
+    global cache_d
+    if gdb is None or "layout_build_id" in cache_d:
+        return
+    objfile = layout_objfile()
+    if objfile is None:
+        return
+    build_id = objfile_build_id(objfile)
+    cache_d["layout_build_id"] = build_id
+    cache_d["layout_objfile"] = objfile.filename
+    if not build_id or not os.path.isfile(layout_cache_path(build_id)):
+        return
+    try:
+        with open(layout_cache_path(build_id)) as f:
+            layout = json.load(f)
+        apply_layout(layout, objfile_base(objfile))
+    except (IOError, OSError, ValueError) as e:
+        print("[parser] ignore layout cache {}: {}".format(build_id, e))
+
+
+def save_layout_cache():
+    global cache_d
+    build_id = cache_d.get("layout_build_id")
+    if gdb is None or not build_id:
+        return
+    layout = collect_layout()
+    objfile_name = cache_d["layout_objfile"]
+    base = 0
+    for objfile in gdb.objfiles():
+        if objfile.filename == objfile_name:
+            base = objfile_base(objfile)
+    symbols = {}
+    for symbol, addr in layout.get("symbols", {}).items():
+        # only symbols of the keyed objfile can be relocated next time
+        solib = gdb.solib_name(addr)
+        if solib == objfile_name or (solib is None and base == 0):
+            symbols[symbol] = addr - base
+    layout["symbols"] = symbols
+    path = layout_cache_path(build_id)
+    try:
+        if not os.path.isdir(LAYOUT_CACHE_DIR):
+            os.makedirs(LAYOUT_CACHE_DIR)
+        with open(path + ".tmp", "w") as f:
+            json.dump(layout, f, indent=1, sort_keys=True)
+        os.rename(path + ".tmp", path)
+    except (IOError, OSError) as e:
+        print("[parser] cannot save layout cache {}: {}".format(path, e))
+
+
+class ReadBatch:
+    """Collect many small reads and fetch them with few large ones.
+
+    batch = ReadBatch()
+    for ptr in pointers:
+        batch.add(ptr, 8)
+    batch.execute()
+    mem = batch.get(ptr, 8)
+    """
+
+    def __init__(self, max_gap=READ_MERGE_GAP, max_span=READ_MAX_SPAN):
+        self.max_gap = max_gap
+        self.max_span = max_span
+        self.requests = set()
+        self.results = {}
+        self.reads = 0
+
+    def add(self, addr, size):
+        if size > 0:
+            self.requests.add((addr, size))
+
+    def spans(self):
+        spans = []
+        for addr, size in sorted(self.requests):
+            if spans:
+                span_beg, span_end, members = spans[-1]
+                end = max(span_end, addr + size)
+                if addr <= span_end + self.max_gap and \
+                        end - span_beg <= self.max_span:
+                    spans[-1] = (span_beg, end, members)
+                    members.append((addr, size))
+                    continue
+            spans.append((addr, addr + size, [(addr, size)]))
+        return spans
+
+    def execute(self):
+        for span_beg, span_end, members in self.spans():
+            self.reads += 1
+            try:
+                mem = read_bytes(span_beg, span_end - span_beg)
+            except Exception:
+                # something in the gap or a member is unreadable
+                for addr, size in members:
+                    self.reads += 1
+                    try:
+                        self.results[(addr, size)] = read_bytes(addr, size)
+                    except Exception as e:
+                        self.results[(addr, size)] = e
+                continue
+            for addr, size in members:
+                off = addr - span_beg
+                self.results[(addr, size)] = mem[off:off + size]
+        self.requests.clear()
+        return self
+
+    def get(self, addr, size):
+        result = self.results.get((addr, size))
+        if result is None:
+            result = read_bytes(addr, size)
+            self.results[(addr, size)] = result
+        if isinstance(result, Exception):
+            raise result
+        return result
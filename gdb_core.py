@@ -0,0 +1,173 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import struct
+from bisect import bisect_right
+import gdb_common
+from gdb_common import MemoryAccessError, MemorySource
+
+PT_LOAD = 1
+PT_NOTE = 4
+# "FILE", the file backed mappings of the dumped process
+NT_FILE = 0x46494c45
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2MSB = 2
+
+
+class CoreSegment:
+    def __init__(self, vaddr, memsz, offset, filesz, flags):
+        self.vaddr = vaddr
+        self.memsz = memsz
+        self.offset = offset
+        self.filesz = filesz
+        self.flags = flags
+        self.end = vaddr + memsz
+
+
+class CoreFile(MemorySource):
+    """Serve target memory straight from the PT_LOAD segments of a core."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        self.segments = []
+        self.notes = []
+        self.parse_headers()
+        self.starts = [seg.vaddr for seg in self.segments]
+
+    def parse_headers(self):
+        if self.mm[:4] != b"\x7fELF":
+            raise ValueError("{} is not an ELF file".format(self.path))
+        ei_class = bytearray(self.mm[4:5])[0]
+        ei_data = bytearray(self.mm[5:6])[0]
+        self.byte_order = "big" if ei_data == ELFDATA2MSB else "little"
+        self.dword_size = 8 if ei_class == ELFCLASS64 else 4
+        prefix = ">" if self.byte_order == "big" else "<"
+        self.prefix = prefix
+        if ei_class == ELFCLASS64:
+            e_phoff, = struct.unpack_from(prefix + "Q", self.mm, 0x20)
+            e_phentsize, e_phnum = struct.unpack_from(
+                prefix + "HH", self.mm, 0x36)
+            # p_type p_flags p_offset p_vaddr p_paddr p_filesz p_memsz
+            phdr = struct.Struct(prefix + "IIQQQQQ")
+        else:
+            e_phoff, = struct.unpack_from(prefix + "I", self.mm, 0x1c)
+            e_phentsize, e_phnum = struct.unpack_from(
+                prefix + "HH", self.mm, 0x2a)
+            # p_type p_offset p_vaddr p_paddr p_filesz p_memsz p_flags
+            phdr = struct.Struct(prefix + "IIIIIII")
+
+        for i in range(e_phnum):
+            fields = phdr.unpack_from(self.mm, e_phoff + i * e_phentsize)
+            if ei_class == ELFCLASS64:
+                p_type, p_flags, p_offset, p_vaddr, _, p_filesz, p_memsz = \
+                    fields
+            else:
+                p_type, p_offset, p_vaddr, _, p_filesz, p_memsz, p_flags = \
+                    fields
+            if p_type == PT_LOAD and p_memsz:
+                self.segments.append(CoreSegment(p_vaddr, p_memsz, p_offset,
+                                                 p_filesz, p_flags))
+            elif p_type == PT_NOTE:
+                self.notes.append((p_offset, p_filesz))
+        self.segments.sort(key=lambda seg: seg.vaddr)
+
+    def find_segment(self, addr):
+        i = bisect_right(self.starts, addr) - 1
+        if i < 0 or addr >= self.segments[i].end:
+            return None
+        return self.segments[i]
+
+    def read(self, addr, size):
+        seg = self.find_segment(addr)
+        if seg and addr + size <= seg.vaddr + seg.filesz:
+            off = seg.offset + addr - seg.vaddr
+            return self.view[off:off + size]
+        # crosses a segment boundary or hits a part missing from the dump
+        buf = bytearray()
+        cur = addr
+        while cur < addr + size:
+            seg = self.find_segment(cur)
+            if seg is None or cur >= seg.vaddr + seg.filesz:
+                raise MemoryAccessError(
+                    "Cannot access memory at address {}".format(hex(cur)))
+            chunk = min(addr + size, seg.vaddr + seg.filesz) - cur
+            off = seg.offset + cur - seg.vaddr
+            buf += self.view[off:off + chunk]
+            cur += chunk
+        return buf
+
+    def present_ranges(self, addr, size):
+        ranges = []
+        end = addr + size
+        i = max(bisect_right(self.starts, addr) - 1, 0)
+        for seg in self.segments[i:]:
+            if seg.vaddr >= end:
+                break
+            start = max(seg.vaddr, addr)
+            stop = min(seg.vaddr + seg.filesz, end)
+            if start < stop:
+                ranges.append((start, stop))
+        return ranges
+
+    def file_mappings(self):
+        """(start, end, offset, path) from the NT_FILE note"""
+        word = self.prefix + ("Q" if self.dword_size == 8 else "I")
+        word_size = self.dword_size
+        for offset, size in self.notes:
+            off = offset
+            while off + 12 <= offset + size:
+                namesz, descsz, n_type = struct.unpack_from(
+                    self.prefix + "III", self.mm, off)
+                desc = off + 12 + ((namesz + 3) & ~3)
+                off = desc + ((descsz + 3) & ~3)
+                if n_type != NT_FILE:
+                    continue
+                count, page_size = struct.unpack_from(word + word[-1],
+                                                      self.mm, desc)
+                entries = desc + 2 * word_size
+                names = bytes(self.mm[entries + 3 * word_size * count:
+                                      desc + descsz]).split(b"\0")
+                mappings = []
+                for i in range(count):
+                    start, end, page_offset = struct.unpack_from(
+                        word + word[-1] * 2, self.mm,
+                        entries + 3 * word_size * i)
+                    mappings.append((start, end, page_offset * page_size,
+                                     names[i].decode("utf-8", "replace")))
+                return mappings
+        return []
+
+    def core_path(self):
+        return self.path
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+        self.f.close()
+
+
+def open_core(core_path, layout_path=None):
+    core = CoreFile(core_path)
+    if layout_path:
+        gdb_common.load_layout(layout_path)
+    gdb_common.cache_d.setdefault("dword_size", core.dword_size)
+    gdb_common.cache_d.setdefault("byte_order", core.byte_order)
+    gdb_common.set_memory_source(core)
+    return core
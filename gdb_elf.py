@@ -23,7 +23,18 @@ import datetime
 import copy
 import tempfile
 from collections import defaultdict
+import struct
+import binascii
 import subprocess
+import profiler
+
+SHT_NOTE = 7
+NT_GNU_BUILD_ID = 3
+
+# sysroot with the unstripped target libraries, same as gdb's sysroot
+SYMBOL_ROOT = os.environ.get(
+    "GDB_PARSER_SYMBOLS",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "symbols"))
 
 
 class ExternalError(RuntimeError):
@@ -42,8 +53,11 @@ def Run(args, verbose=None, **kwargs):
 
 
 def RunAndCheckOutput(args, verbose=None, **kwargs):
+    start = time.time()
     proc = Run(args, verbose=verbose, **kwargs)
     output, _ = proc.communicate()
+    profiler.record("subprocess " + os.path.basename(args[0]),
+                    time.time() - start, len(output or ""))
     # Don't log any if caller explicitly says so.
     if verbose is not False and output:
         print("%s", output.rstrip())
@@ -54,6 +68,46 @@ def RunAndCheckOutput(args, verbose=None, **kwargs):
     return output
 
 
+def read_build_id(f):
+    with open(f, "rb") as elf:
+        ident = elf.read(16)
+        if ident[:4] != b"\x7fELF":
+            return None
+        is_64 = bytearray(ident)[4] == 2
+        prefix = ">" if bytearray(ident)[5] == 2 else "<"
+        if is_64:
+            elf.seek(0x28)
+            e_shoff, = struct.unpack(prefix + "Q", elf.read(8))
+            elf.seek(0x3a)
+            shdr = struct.Struct(prefix + "IIQQQQIIQQ")
+        else:
+            elf.seek(0x20)
+            e_shoff, = struct.unpack(prefix + "I", elf.read(4))
+            elf.seek(0x2e)
+            shdr = struct.Struct(prefix + "IIIIIIIIII")
+        e_shentsize, e_shnum = struct.unpack(prefix + "HH", elf.read(4))
+        for i in range(e_shnum):
+            elf.seek(e_shoff + i * e_shentsize)
+            sh = shdr.unpack(elf.read(shdr.size))
+            sh_type, sh_offset, sh_size = sh[1], sh[4], sh[5]
+            if sh_type != SHT_NOTE:
+                continue
+            elf.seek(sh_offset)
+            notes = elf.read(sh_size)
+            off = 0
+            while off + 12 <= len(notes):
+                namesz, descsz, n_type = struct.unpack_from(
+                    prefix + "III", notes, off)
+                name_off = off + 12
+                desc_off = name_off + ((namesz + 3) & ~3)
+                if n_type == NT_GNU_BUILD_ID and \
+                        notes[name_off:name_off + 3] == b"GNU":
+                    desc = notes[desc_off:desc_off + descsz]
+                    return binascii.hexlify(desc).decode("ascii")
+                off = desc_off + ((descsz + 3) & ~3)
+    return None
+
+
 def parse_mapping(raw_out):
     lines = raw_out.split("\n")
     map_items = []
@@ -81,7 +135,7 @@ def parse_mapping_elf(map_items):
     d = defaultdict(list)
     for sub_items in map_items:
         if len(sub_items) == 5:
-            elf_f = SYMBOL_ROOT + sub_items[-1]
+            elf_f = os.path.join(SYMBOL_ROOT, sub_items[-1].lstrip("/"))
             if sub_items[3] == '0x0':
                 continue
             if os.path.isfile(elf_f):
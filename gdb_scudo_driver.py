@@ -28,6 +28,8 @@ import tempfile
 global_path = "/home/mi/workspace/register_parser"
 sys.path.append(global_path)
 import scudo_parser
+import profiler
+import bench_typed_access
 
 
 class scudo_help(gdb.Command):
@@ -147,6 +149,42 @@ class scudo_data_search(gdb.Command):
             traceback.print_exc()
 
 
+class scudo_value_index(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scuindex', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            scudo_parser.dump_value_index(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+
+class scudo_snapshot(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scusnapshot', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            scudo_parser.snapshot_command(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+
+class scudo_heap_diff(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scudiff', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            scudo_parser.heap_diff(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+
 class scudo_region_info(gdb.Command):
     def __init__(self):
         gdb.Command.__init__(self, 'scuregioninfo', gdb.COMMAND_OBSCURE)
@@ -159,6 +197,30 @@ class scudo_region_info(gdb.Command):
             traceback.print_exc()
 
 
+class scudo_fragmentation(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scufrag', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            scudo_parser.dump_fragmentation()
+        except Exception as e:
+            traceback.print_exc()
+
+
+class scudo_check(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scucheck', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            scudo_parser.check_headers(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+
 class scudo_addr_info(gdb.Command):
     def __init__(self):
         gdb.Command.__init__(self, 'scuaddrinfo', gdb.COMMAND_OBSCURE)
@@ -195,6 +257,42 @@ class scudo_classid(gdb.Command):
             traceback.print_exc()
 
 
+class scudo_dump_layout(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scudumplayout', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            scudo_parser.dump_layout(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+
+class scudo_profile(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scuprofile', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            profiler.command(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+
+class scudo_bench(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'scubench', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            bench_typed_access.command(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+
 scudo_help()
 scudo_version()
 scudo_parse()
@@ -206,6 +304,14 @@ scudo_secondary()
 scudo_all_chunks()
 scudo_chunk_search()
 scudo_region_info()
+scudo_fragmentation()
+scudo_check()
 scudo_statistics()
 scudo_classid()
 scudo_data_search()
+scudo_value_index()
+scudo_snapshot()
+scudo_heap_diff()
+scudo_dump_layout()
+scudo_profile()
+scudo_bench()
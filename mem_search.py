@@ -0,0 +1,172 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Search memory for several patterns in one pass over it. Each window of
+# memory is read once and every pattern runs over it at C speed: a byte
+# pattern is a regular expression (plain bytes run as fast as bytes.find),
+# a pointer range compares all aligned words at once with numpy (struct
+# without it). The windows overlap by the longest pattern, so memory use
+# does not grow with the span.
+
+import re
+import gdb_common
+from gdb_common import numpy
+
+WINDOW_SIZE = 16 << 20
+
+
+def hex_digits(text):
+    if text[:2].lower() == "0x":
+        text = text[2:]
+    if not text:
+        raise ValueError("empty pattern")
+    if len(text) % 2:
+        text = "0" + text
+    return text
+
+
+class SearchPattern:
+    """One search term:
+
+    0x12345678      the number, in target byte order
+    0x12??5678      a '?' nibble matches anything
+    0x1234/0xff00   only the bits set in the mask have to match
+    0x7000-0x8000   an aligned pointer sized word in [0x7000, 0x8000)
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.low = None
+        self.high = None
+        # (value, mask) of every byte, in memory order
+        self.values = None
+        if "-" in text:
+            low, high = text.split("-", 1)
+            self.low = int(low, 16)
+            self.high = int(high, 16)
+            if self.low >= self.high:
+                raise ValueError("empty range")
+            self.size = gdb_common.arch_dword_size()
+            return
+        value, mask = text, None
+        if "/" in text:
+            value, mask = text.split("/", 1)
+        digits = hex_digits(value)
+        values = []
+        for i in range(0, len(digits), 2):
+            byte, byte_mask = 0, 0
+            for nibble in digits[i:i + 2]:
+                byte <<= 4
+                byte_mask <<= 4
+                if nibble != "?":
+                    byte |= int(nibble, 16)
+                    byte_mask |= 0xf
+            values.append((byte, byte_mask))
+        if mask is not None:
+            mask_digits = hex_digits(mask)
+            masks = [int(mask_digits[i:i + 2], 16)
+                     for i in range(0, len(mask_digits), 2)]
+            if len(masks) > len(values):
+                values = [(0, 0xff)] * (len(masks) - len(values)) + values
+            masks = [0xff] * (len(values) - len(masks)) + masks
+            values = [(v & m & m2, m & m2)
+                      for (v, m), m2 in zip(values, masks)]
+        if gdb_common.arch_byte_order() != "big":
+            values.reverse()
+        self.values = values
+        self.size = len(values)
+        self.regex = re.compile(self.expression(), re.DOTALL)
+
+    def is_range(self):
+        return self.low is not None
+
+    def expression(self):
+        parts = []
+        for value, mask in self.values:
+            if mask == 0xff:
+                parts.append(b"\\x%02x" % value)
+            elif mask == 0:
+                parts.append(b".")
+            else:
+                parts.append(b"[" + b"".join(
+                    b"\\x%02x" % v for v in range(256)
+                    if v & mask == value) + b"]")
+        return b"".join(parts)
+
+
+def parse_patterns(arg):
+    """SearchPatterns of the whitespace separated terms of arg"""
+    patterns = [SearchPattern(text) for text in arg.split()]
+    if not patterns:
+        raise ValueError("no pattern")
+    return patterns
+
+
+class Searcher:
+    """Run every pattern over a buffer, keeping where each byte pattern
+    may match next so windows do not report overlapping matches."""
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.longest = max(p.size for p in patterns)
+        self.next_addr = {}
+
+    def scan(self, buf, addr, limit, holes=None):
+        """(pattern, found_addr) of the matches that start before
+        buf[limit]"""
+        hits = []
+        for p in self.patterns:
+            if p.is_range():
+                hits.extend((p, addr + off)
+                            for off in self.range_offsets(p, buf, addr,
+                                                          limit))
+                continue
+            # like before, a pattern restarts after its own match
+            start = max(self.next_addr.get(p, 0) - addr, 0)
+            for m in p.regex.finditer(buf, start):
+                off = m.start()
+                if off >= limit:
+                    break
+                self.next_addr[p] = addr + off + p.size
+                hits.append((p, addr + off))
+        if holes is not None and holes.holes:
+            # zero filled pages of a partial dump
+            hits = [(p, found) for p, found in hits
+                    if not holes.missing(found, p.size)]
+        return hits
+
+    def range_offsets(self, p, buf, addr, limit):
+        first = -addr % p.size
+        count = (min(len(buf), limit + p.size - 1) - first) // p.size
+        if count <= 0:
+            return []
+        words = gdb_common.words_array(buf, p.size, count, first)
+        if numpy is None:
+            return [first + i * p.size for i, w in enumerate(words)
+                    if p.low <= w < p.high]
+        found = numpy.flatnonzero((words >= p.low) & (words < p.high))
+        return (found * p.size + first).tolist()
+
+    def search(self, addr, size, window=WINDOW_SIZE):
+        """(pattern, found_addr) of the matches in [addr, addr + size),
+        read window bytes at a time"""
+        hits = []
+        self.next_addr = {}
+        overlap = self.longest - 1
+        for off in range(0, size, window):
+            owned = min(window, size - off)
+            buf, holes = gdb_common.read_sparse(
+                addr + off, min(owned + overlap, size - off))
+            hits.extend(self.scan(buf, addr + off, owned, holes))
+        return hits
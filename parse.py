@@ -27,6 +27,7 @@ import tempfile
 from collections import defaultdict
 import subprocess
 from utils import *
+import demangle
 
 
 STATE_AVAILABLE = 0
@@ -188,8 +189,7 @@ def parse_symbol(gdb_out):
         if ln != -1:
             symbol = symbol[:ln]
             lino = symbol[ln+1:]
-        cmd = ['c++filt', symbol]
-        return RunAndCheckOutput(cmd, verbose=False)
+        return demangle.demangle(symbol)
 
 
 def compare(x, y):
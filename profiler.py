@@ -0,0 +1,188 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Counters for the expensive calls of the parsers: gdb.execute,
+# gdb.parse_and_eval, memory reads and external tools. Every call is
+# accounted to the parser function it came from and the current phase.
+
+from __future__ import print_function
+import os
+import sys
+import time
+import json
+import utils
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# helper modules are skipped when looking for the call site
+INTERNAL_FILES = set(["profiler.py", "gdb_common.py", "gdb_core.py",
+                      "gdb_elf.py", "demangle.py"])
+
+enabled = True
+# (category, site, phase) -> [calls, seconds, bytes]
+stats = {}
+phase_stack = ["-"]
+# phase -> seconds
+phase_times = {}
+# name -> function returning a dict of cache counters
+counters = {}
+
+
+def call_site():
+    frame = sys._getframe(2)
+    while frame is not None and \
+            os.path.basename(frame.f_code.co_filename) in INTERNAL_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return "-"
+    return "{}:{}".format(os.path.basename(frame.f_code.co_filename),
+                          frame.f_code.co_name)
+
+
+def record(category, seconds, nbytes=0):
+    if not enabled:
+        return
+    key = (category, call_site(), phase_stack[-1])
+    item = stats.get(key)
+    if item is None:
+        item = stats[key] = [0, 0.0, 0]
+    item[0] += 1
+    item[1] += seconds
+    item[2] += nbytes
+
+
+def call(category, func, *args, **kwargs):
+    if not enabled:
+        return func(*args, **kwargs)
+    start = time.time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        record(category, time.time() - start)
+
+
+class phase:
+    """with profiler.phase("perclass"): account calls to that phase"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        phase_stack.append(self.name)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        phase_times[self.name] = phase_times.get(self.name, 0.0) + \
+            time.time() - self.start
+        phase_stack.pop()
+        return False
+
+
+def add_counters(name, func):
+    counters[name] = func
+
+
+def reset():
+    stats.clear()
+    phase_times.clear()
+    if tracemalloc and tracemalloc.is_tracing():
+        tracemalloc.clear_traces()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+
+def peak_memory():
+    peak = {}
+    if resource is not None:
+        # kilobytes on linux
+        peak["max_rss_kb"] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+    if tracemalloc and tracemalloc.is_tracing():
+        peak["python_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    return peak
+
+
+def report():
+    rows = []
+    for (category, site, phase_name), (calls, seconds, nbytes) in \
+            stats.items():
+        rows.append({"category": category, "site": site,
+                     "phase": phase_name, "calls": calls,
+                     "seconds": seconds, "bytes": nbytes})
+    rows.sort(key=lambda row: row["seconds"], reverse=True)
+    return {"calls": rows, "phases": dict(phase_times),
+            "counters": dict((name, func()) for name, func in
+                             counters.items()),
+            "memory": peak_memory()}
+
+
+def dump_report(limit=40):
+    result = report()
+    table = [("category", "site", "phase", "calls",
+              "total_ms", "avg_ms", "bytes")]
+    for row in result["calls"][:limit]:
+        table.append((row["category"], row["site"], row["phase"],
+                      row["calls"], "{:.1f}".format(row["seconds"] * 1000),
+                      "{:.3f}".format(row["seconds"] * 1000 / row["calls"]),
+                      row["bytes"]))
+    if len(table) > 1:
+        print(utils.assemble_table(table))
+    table = [("phase", "total_ms")]
+    for name, seconds in sorted(result["phases"].items(),
+                                key=lambda x: x[1], reverse=True):
+        table.append((name, "{:.1f}".format(seconds * 1000)))
+    if len(table) > 1:
+        print(utils.assemble_table(table))
+    table = [("counters", "key", "value")]
+    for name, values in sorted(result["counters"].items()):
+        for k, v in sorted(values.items()):
+            if isinstance(v, float):
+                v = "{:.3f}".format(v)
+            table.append((name, k, v))
+    if len(table) > 1:
+        print(utils.assemble_table(table))
+    for k, v in sorted(result["memory"].items()):
+        print("{} {}".format(k, v))
+
+
+def command(arg):
+    '''scuprofile [reset|on|off|mem|json <file>]'''
+
+    global enabled
+    args = arg.split()
+    if not args:
+        dump_report()
+    elif args[0] == "reset":
+        reset()
+    elif args[0] == "on":
+        enabled = True
+    elif args[0] == "off":
+        enabled = False
+    elif args[0] == "mem":
+        if tracemalloc is None:
+            print("tracemalloc needs python3")
+        elif not tracemalloc.is_tracing():
+            tracemalloc.start()
+    elif args[0] == "json" and len(args) == 2:
+        with open(args[1], "w") as f:
+            json.dump(report(), f, indent=1)
+    else:
+        print(command.__doc__)
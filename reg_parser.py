@@ -15,11 +15,11 @@ def parse_update(name):
     for u in reg_info.unit_list:
         if name is None:
             val = gdb_common.read_addr_width(u.addr, int(u.offset)%32, int(u.width))
-            u.update(int(val,2))
+            u.update(val)
         else:
             if(u.ip_name == name):
                 val = gdb_common.read_addr_width(u.addr, int(u.offset)%32, int(u.width))
-                u.update(int(val,2))
+                u.update(val)
 
 def dump_info(ip_name, g_name, tofile):
     parse_update(ip_name)
@@ -79,5 +79,5 @@ def dump_memory(arg):
         print("tmp_addr {}".format(hex(tmp_addr)))
         dump_var = "dump binary memory dump_test/dump_{} {} {}".format(hex(tmp_addr), hex(tmp_addr), hex(tmp_addr+0x200))
         print(dump_var)
-        gdb.execute(dump_var)
+        gdb_common.gdb_execute(dump_var)
         tmp_addr = tmp_addr + 0x200
\ No newline at end of file
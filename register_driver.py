@@ -30,6 +30,7 @@ import reg_parser
 import freertos_parser
 import freertos_class
 import reg_class
+import profiler
 
 class reg_help(gdb.Command):
 
@@ -136,6 +137,28 @@ class dump_list(gdb.Command):
         except Exception as e:
             traceback.print_exc()
 
+class dump_value_cache(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'dvcache', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            freertos_parser.value_cache(arg)
+        except Exception as e:
+            traceback.print_exc()
+
+class dump_profile(gdb.Command):
+    def __init__(self):
+        gdb.Command.__init__(self, 'dprofile', gdb.COMMAND_OBSCURE)
+        self.proc = gdb.inferiors()[0]
+
+    def invoke(self, arg, from_tty):
+        try:
+            profiler.command(arg)
+        except Exception as e:
+            traceback.print_exc()
+
 reg_help()
 reg_version()
 reg_dump_ip()
@@ -146,4 +169,6 @@ dump_all_task_clear_cache()
 dump_task_stack()
 dump_list()
 dump_memory()
+dump_value_cache()
+dump_profile()
 reg_parser.parse_cfg()
@@ -0,0 +1,189 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Scudo's chunk header checksum, for a whole region at once. The checksum
+# hashes the Allocator cookie, the user pointer and the header with its
+# checksum field cleared, a byte at a time from the low byte: CRC32C
+# (what the crc32c instructions compute, without inversion) folded to 16
+# bits, or the BSD sum when the CPU has no CRC32. Both are table or shift
+# steps over the bytes, done on every chunk of the arrays together.
+
+import scudo_parser
+from gdb_common import numpy
+
+CRC32 = "crc32"
+BSD = "bsd"
+ALGORITHMS = (CRC32, BSD)
+CRC32C_POLY = 0x82f63b78
+# scudo::Chunk::BlockMarker, written at the block start of an aligned chunk
+BLOCK_MARKER = 0x44554353
+HEADER_WIDTH = 8
+
+
+def crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ (CRC32C_POLY if crc & 1 else 0)
+        table.append(crc)
+    return table
+
+
+CRC32C_TABLE = crc32c_table()
+CRC32C_ARRAY = None if numpy is None else \
+    numpy.array(CRC32C_TABLE, dtype=numpy.uint64)
+
+
+def clear_checksum(word):
+    return word & ~(scudo_parser.CHECKSUM_MASK << scudo_parser.CHECKSUM_SHIFT)
+
+
+def checksum(cookie, user_addr, word, algorithm, dword_size):
+    """checksum scudo stores in the header word of the chunk at
+    user_addr"""
+    word = clear_checksum(word)
+    if algorithm == CRC32:
+        crc = cookie & 0xffffffff
+        for value, width in ((user_addr, dword_size), (word, HEADER_WIDTH)):
+            for _ in range(width):
+                crc = CRC32C_TABLE[(crc ^ value) & 0xff] ^ (crc >> 8)
+                value >>= 8
+        return (crc ^ (crc >> 16)) & 0xffff
+    total = cookie & 0xffff
+    for value, width in ((user_addr, dword_size), (word, HEADER_WIDTH)):
+        for _ in range(width):
+            total = ((total >> 1) | ((total & 1) << 15)) + (value & 0xff)
+            total &= 0xffff
+            value >>= 8
+    return total
+
+
+def checksums(cookie, user_addrs, words, algorithm, dword_size):
+    """checksum of every chunk, a numpy array when numpy is available"""
+    if numpy is None:
+        return [checksum(cookie, a, w, algorithm, dword_size)
+                for a, w in zip(user_addrs, words)]
+    u64 = numpy.uint64
+    byte = u64(0xff)
+    eight = u64(8)
+    words = numpy.asarray(words, dtype=u64) & u64(clear_checksum(
+        0xffffffffffffffff))
+    steps = ((numpy.asarray(user_addrs, dtype=u64), dword_size),
+             (words, HEADER_WIDTH))
+    if algorithm == CRC32:
+        crc = numpy.full(len(words), cookie & 0xffffffff, dtype=u64)
+        for value, width in steps:
+            for k in range(width):
+                crc = CRC32C_ARRAY[((crc ^ (value >> u64(8 * k))) &
+                                    byte).astype(numpy.intp)] ^ (crc >> eight)
+        return (crc ^ (crc >> u64(16))) & u64(0xffff)
+    total = numpy.full(len(words), cookie & 0xffff, dtype=u64)
+    for value, width in steps:
+        for k in range(width):
+            total = ((total >> u64(1)) | ((total & u64(1)) << u64(15))) + \
+                ((value >> u64(8 * k)) & byte)
+            total &= u64(0xffff)
+    return total
+
+
+# problems of a header found by problems()
+CHECKSUM_BAD = 1
+CLASS_ID_BAD = 2
+STRIDE_BAD = 4
+STATE_BAD = 8
+PROBLEMS = ((CHECKSUM_BAD, "checksum"), (CLASS_ID_BAD, "class_id"),
+            (STRIDE_BAD, "stride"), (STATE_BAD, "state"))
+
+
+def header_size(dword_size):
+    """Chunk::getHeaderSize(), the header rounded up to MinAlignment"""
+    return 16 if dword_size == 8 else 8
+
+
+def min_alignment_log(dword_size):
+    return 4 if dword_size == 8 else 3
+
+
+def problem_names(flags):
+    return ",".join(name for bit, name in PROBLEMS if flags & bit)
+
+
+def detect(cookie, user_addrs, words, dword_size):
+    """the algorithm whose checksums match the most headers"""
+    def matches(algorithm):
+        expected = checksums(cookie, user_addrs, words, algorithm, dword_size)
+        stored = [(w >> scudo_parser.CHECKSUM_SHIFT) &
+                  scudo_parser.CHECKSUM_MASK for w in words]
+        return sum(1 for a, b in zip(expected, stored) if a == b)
+    return max(ALGORITHMS, key=matches)
+
+
+def problems(class_id, class_size, words, block_offsets, expected,
+             dword_size):
+    """problem flags of every header word, 0 for an empty one.
+    block_offsets is how far each header is from its block start, expected
+    its checksums() or None when the cookie is unknown, class_size None
+    for secondary blocks"""
+    log = min_alignment_log(dword_size)
+    limit = None
+    if class_size:
+        limit = class_size - header_size(dword_size)
+    if numpy is None:
+        flags = []
+        for i, word in enumerate(words):
+            bits = 0
+            stored = (word >> scudo_parser.CHECKSUM_SHIFT) & \
+                scudo_parser.CHECKSUM_MASK
+            if expected is not None and stored != expected[i]:
+                bits |= CHECKSUM_BAD
+            if (word & scudo_parser.CLASS_ID_MASK) != class_id:
+                bits |= CLASS_ID_BAD
+            if ((word >> scudo_parser.STATE_ORIGIN_SHIFT) &
+                    scudo_parser.STATE_MASK) > scudo_parser.STATE_QUARANTINED:
+                bits |= STATE_BAD
+            if limit is not None:
+                offset = (word >> scudo_parser.OFFSET_SHIFT) & \
+                    scudo_parser.OFFSET_MASK
+                size = (word >> scudo_parser.SIZE_OR_UNUSED_SHIFT) & \
+                    scudo_parser.SIZE_OR_UNUSED_MASK
+                if offset << log != block_offsets[i] or \
+                        block_offsets[i] + size > limit:
+                    bits |= STRIDE_BAD
+            flags.append(bits if word else 0)
+        return flags
+
+    u64 = numpy.uint64
+    words = numpy.asarray(words, dtype=u64)
+
+    def field(shift, mask):
+        return (words >> u64(shift)) & u64(mask)
+
+    flags = numpy.zeros(len(words), dtype=numpy.uint8)
+    if expected is not None:
+        flags[field(scudo_parser.CHECKSUM_SHIFT,
+                    scudo_parser.CHECKSUM_MASK) != expected] |= CHECKSUM_BAD
+    flags[field(0, scudo_parser.CLASS_ID_MASK) != u64(class_id)] |= \
+        CLASS_ID_BAD
+    flags[field(scudo_parser.STATE_ORIGIN_SHIFT, scudo_parser.STATE_MASK) >
+          u64(scudo_parser.STATE_QUARANTINED)] |= STATE_BAD
+    if limit is not None:
+        block_offsets = numpy.asarray(block_offsets, dtype=u64)
+        offset = field(scudo_parser.OFFSET_SHIFT, scudo_parser.OFFSET_MASK)
+        size = field(scudo_parser.SIZE_OR_UNUSED_SHIFT,
+                     scudo_parser.SIZE_OR_UNUSED_MASK)
+        flags[((offset << u64(log)) != block_offsets) |
+              (block_offsets + size > u64(limit))] |= STRIDE_BAD
+    flags[words == 0] = 0
+    return flags
@@ -18,6 +18,13 @@ import gdb_common
 HeaderSize = 16
 
 
+def large_block_header_offset():
+    # sizeof(LargeBlock::Header) rounded up, the chunk header follows
+    if gdb_common.arch_dword_size() == 8:
+        return 48
+    return 32
+
+
 class ScuMalloc:
     def __init__(self, path=None):
         self.perclass_array = list()
@@ -27,6 +34,13 @@ class ScuMalloc:
         self.region_info_array = list()
         self.chunk_header_size = HeaderSize
         self.tsdinfo = None
+        # Allocator.Cookie, the seed of the header checksums
+        self.cookie = None
+        self.chunk_index = None
+        self.value_index = None
+        # where the heap was saved, and how many symbols it had then
+        self.snapshot_path = None
+        self.snapshot_symbols = 0
 
         if(gdb_common.arch_dword_size() == 8):
             self.pointer_len = 8
@@ -68,34 +82,39 @@ class PerClass:
 
 
 class LargeBlock:
-    def __init__(self, BlockAddr, BlockEnd, MapBase, MapSize):
+    def __init__(self, BlockAddr, BlockEnd, MapBase, MapSize,
+                 HeaderMem=None):
         self.block_addr = BlockAddr
-        dword_size = gdb_common.arch_dword_size()
-        if dword_size == 8:
-            self.chunk_header_addr = hex(int(BlockAddr, 16) + 48)
-            self.user_start_addr = hex(int(BlockAddr, 16) + 64)
-        else:
-            self.chunk_header_addr = hex(int(BlockAddr, 16) + 32)
-            self.user_start_addr = hex(int(BlockAddr, 16) + 48)
+        header_offset = large_block_header_offset()
+        self.chunk_header_addr = hex(int(BlockAddr, 16) + header_offset)
+        self.user_start_addr = hex(int(BlockAddr, 16) + header_offset + 16)
         self.block_end = BlockEnd
         self.map_base = MapBase
         self.map_size = MapSize
         self.use_size = int(self.block_end, 16) - int(self.user_start_addr, 16)
-        self.chunk_header = scudo_parser.parse_chunk_header(
-            self.chunk_header_addr, self.use_size)
+        if HeaderMem is not None:
+            self.chunk_header = scudo_parser.parse_chunk_header_mem(
+                int(self.chunk_header_addr, 16), HeaderMem, self.use_size)
+        else:
+            self.chunk_header = scudo_parser.parse_chunk_header(
+                self.chunk_header_addr, self.use_size)
 
 
 class SecondaryCacheEntry:
-    def __init__(self, BlockAddr, BlockEnd, MapBase, MapSize):
-        self.large_block = LargeBlock(BlockAddr, BlockEnd, MapBase, MapSize)
+    def __init__(self, BlockAddr, BlockEnd, MapBase, MapSize,
+                 HeaderMem=None):
+        self.large_block = LargeBlock(BlockAddr, BlockEnd, MapBase, MapSize,
+                                      HeaderMem)
 
 
 class SecondaryInUseBlocksPtr:
-    def __init__(self, BlockAddr, Prev, Next, BlockEnd, MapBase, MapSize):
+    def __init__(self, BlockAddr, Prev, Next, BlockEnd, MapBase, MapSize,
+                 HeaderMem=None):
         self.block_addr = BlockAddr
         self.l_prev = Prev
         self.l_next = Next
-        self.large_block = LargeBlock(BlockAddr, BlockEnd, MapBase, MapSize)
+        self.large_block = LargeBlock(BlockAddr, BlockEnd, MapBase, MapSize,
+                                      HeaderMem)
 
 
 class Secondary:
@@ -121,7 +140,7 @@ class Chunk:
 
 class ChunkHeader:
     def __init__(self, classid, addr, state, origi,
-                 used_bytes, offset, check_sum):
+                 used_bytes, offset, check_sum, first_word=None, word=None):
         self.class_id = classid
         self.addr = addr
         self.user_addr = hex(int(addr, 16)+16)
@@ -130,14 +149,32 @@ class ChunkHeader:
         self.used_bytes = used_bytes
         self.offset = offset
         self.check_sum = check_sum
-        self.symbol_addr = None
-        self.symbol_info = None
-
-        if self.state == "Allocated" or self.state == "Quarantined":
-            dword_size = gdb_common.arch_dword_size()
-            self.symbol_addr = scudo_parser.read_addr_bytes_hex(
-                self.user_addr, dword_size)
-            self.symbol_info = scudo_parser.parse_symbol(self.symbol_addr)
+        # word at user_addr, read when the symbol is first asked for
+        self.first_word = first_word
+        # the packed header the fields were decoded from
+        self.word = word
+
+    def in_use(self):
+        return self.state == "Allocated" or self.state == "Quarantined"
+
+    def user_word(self):
+        if self.first_word is None and self.in_use():
+            try:
+                self.first_word = gdb_common.read_ptr(
+                    int(self.user_addr, 16))
+            except Exception:
+                return None
+        return self.first_word
+
+    @property
+    def symbol_addr(self):
+        word = self.user_word()
+        return hex(word) if word is not None else None
+
+    @property
+    def symbol_info(self):
+        word = self.user_word()
+        return scudo_parser.symbol_of(word) if word is not None else None
 
 
 class ChunkHeaderT:
@@ -161,6 +198,7 @@ class RegionInfo:
         self.release_info = ReleaseInfo
         self.stats = Stats
         self.chunk_list = Chunk_List
+        self.columns = None
 
     def fill_chunk_list(self, ChunkList):
         self.chunk_list = ChunkList
@@ -0,0 +1,145 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Decode every chunk header of a primary region at once. The region buffer
+# is viewed as 64-bit words, every class_size / 8th word is a header and
+# the fields come out as one array per field instead of ChunkHeader
+# objects. Without numpy the same columns are plain lists.
+
+from bisect import bisect_right
+import gdb_common
+import scudo_parser
+from gdb_common import numpy
+
+# the user pointer, and the word attributed to a symbol, follows the header
+USER_WORD_OFFSET = 16
+
+
+def known_word(word):
+    """first word of a column, None for the 0 of a word that was not read"""
+    word = int(word)
+    return word if word else None
+
+
+def field(words, shift, mask):
+    if numpy is None:
+        return [(w >> shift) & mask for w in words]
+    return (words >> numpy.uint64(shift)) & numpy.uint64(mask)
+
+
+class ChunkColumns:
+    """Chunk headers of one region, one array per header field."""
+
+    def __init__(self, class_id, class_size, addrs, words, first_words=None):
+        self.class_id = class_id
+        self.class_size = class_size
+        self.addr = addrs
+        self.words = words
+        # word at the user pointer of every chunk, for symbol attribution
+        self.first_word = first_words
+        self.header_class_id = field(words, 0, scudo_parser.CLASS_ID_MASK)
+        self.state = field(words, scudo_parser.STATE_ORIGIN_SHIFT,
+                           scudo_parser.STATE_MASK)
+        # same encoding as the ORIGI_DICT keys
+        self.origin = field(words, scudo_parser.STATE_ORIGIN_SHIFT,
+                            scudo_parser.ORIGIN_MASK)
+        self.size_or_unused = field(words, scudo_parser.SIZE_OR_UNUSED_SHIFT,
+                                    scudo_parser.SIZE_OR_UNUSED_MASK)
+        self.offset = field(words, scudo_parser.OFFSET_SHIFT,
+                            scudo_parser.OFFSET_MASK)
+        self.checksum = field(words, scudo_parser.CHECKSUM_SHIFT,
+                              scudo_parser.CHECKSUM_MASK)
+
+    def __len__(self):
+        return len(self.addr)
+
+    def in_use(self):
+        """indices of the Allocated and Quarantined chunks"""
+        if numpy is None:
+            return [i for i, s in enumerate(self.state)
+                    if s in (scudo_parser.STATE_ALLOCATED,
+                             scudo_parser.STATE_QUARANTINED)]
+        return numpy.flatnonzero(
+            (self.state == scudo_parser.STATE_ALLOCATED) |
+            (self.state == scudo_parser.STATE_QUARANTINED))
+
+    def index_of(self, addr):
+        """index of the chunk whose block holds addr, -1 if none"""
+        # chunks in holes are left out, so search rather than divide
+        if numpy is None:
+            i = bisect_right(self.addr, addr) - 1
+        else:
+            i = int(numpy.searchsorted(self.addr, numpy.uint64(addr),
+                                       side="right")) - 1
+        if i < 0 or addr >= int(self.addr[i]) + self.class_size:
+            return -1
+        return i
+
+    def header(self, i, use_size=None):
+        first_word = None
+        if self.first_word is not None:
+            first_word = known_word(self.first_word[i])
+        return scudo_parser.parse_chunk_header_word(
+            hex(int(self.addr[i])), int(self.words[i]), use_size, first_word)
+
+    def headers(self, indices=None):
+        if indices is None:
+            indices = range(len(self.addr))
+        return [self.header(i) for i in indices]
+
+
+def decode_region(class_id, class_size, region_beg, allocated_user):
+    """ChunkColumns of the chunks in [region_beg, region_beg +
+    allocated_user); chunks whose header is not in memory are left out"""
+    header_size = scudo_parser.CHUNK_HEADER_SIZE
+    mem, holes = gdb_common.read_sparse(region_beg, allocated_user)
+    count = allocated_user // class_size
+    stride = class_size // header_size
+    all_words = gdb_common.words_array(mem, header_size)
+    words = all_words[::stride][:count]
+    first_words = None
+    if gdb_common.arch_dword_size() == 8 and \
+            class_size >= USER_WORD_OFFSET + 8:
+        first_words = all_words[USER_WORD_OFFSET // 8::stride][:len(words)]
+    if numpy is None:
+        addrs = [region_beg + i * class_size for i in range(len(words))]
+        keep = range(len(words))
+        if holes.holes:
+            keep = [i for i, a in enumerate(addrs)
+                    if not holes.missing(a, header_size)]
+            # a first word in a hole is read again when asked for
+            first_words = None
+        addrs = [addrs[i] for i in keep]
+        words = [words[i] for i in keep]
+        if first_words is not None:
+            first_words = [first_words[i] for i in keep]
+        return ChunkColumns(class_id, class_size, addrs, words,
+                            first_words), holes
+
+    addrs = numpy.arange(len(words), dtype=numpy.uint64) * \
+        numpy.uint64(class_size) + numpy.uint64(region_beg)
+    words = words.astype(numpy.uint64)
+    if first_words is not None:
+        first_words = first_words.astype(numpy.uint64)
+    if holes.holes:
+        # a header never straddles a page, one flag lookup per chunk
+        pages = (addrs - numpy.uint64(holes.first_page)) // \
+            numpy.uint64(gdb_common.PAGE_SIZE)
+        bits = numpy.frombuffer(bytes(holes.bits), dtype=numpy.uint8)
+        keep = bits[pages.astype(numpy.intp)] == 0
+        addrs = addrs[keep]
+        words = words[keep]
+        first_words = None
+    return ChunkColumns(class_id, class_size, addrs, words,
+                        first_words), holes
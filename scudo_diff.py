@@ -0,0 +1,198 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compare two parsed heaps, e.g. two cores of a daemon taken hours apart.
+# The chunks in use of each heap are columns sorted by user address, so one
+# merge of the two address arrays tells the chunks that appeared,
+# disappeared and persisted (same address, same header). Counts and bytes
+# are then summed per symbol, class size or origin with bincount. Needs
+# numpy, like the snapshots the older heap usually comes from.
+
+import scudo_columns
+import scudo_parser
+from gdb_common import numpy
+
+GROUPS = ("symbol", "size", "origin")
+# chunks whose first word is not a known symbol
+NO_SYMBOL = "-"
+
+
+class Labels:
+    """Group names of both heaps, numbered in the order they are seen."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def codes(self, values, name_of):
+        """group id of every value, name_of called once per distinct
+        value"""
+        uniq, inverse = numpy.unique(values, return_inverse=True)
+        ids = numpy.array([self.id(name_of(int(v))) for v in uniq],
+                          dtype=numpy.intp)
+        return ids[inverse]
+
+
+class HeapChunks:
+    """Chunks in use of one heap, sorted by user address. class_size is
+    0 for a secondary block."""
+
+    def __init__(self, addr, word, used_bytes, class_size, first_word,
+                 symbols):
+        order = numpy.argsort(addr)
+        self.addr = addr[order]
+        self.word = word[order]
+        self.used_bytes = used_bytes[order]
+        self.class_size = class_size[order]
+        self.first_word = first_word[order]
+        # first word -> symbol_info, like scudo_parser.symbol_cache
+        self.symbols = symbols
+
+    def __len__(self):
+        return len(self.addr)
+
+    def codes(self, group, labels):
+        if group == "size":
+            return labels.codes(self.class_size, lambda size:
+                                str(size) if size else "secondary")
+        if group == "origin":
+            origin = (self.word >> numpy.uint64(
+                scudo_parser.STATE_ORIGIN_SHIFT)) & \
+                numpy.uint64(scudo_parser.ORIGIN_MASK)
+            return labels.codes(origin, scudo_parser.ORIGI_DICT.get)
+        # 0 is a first word that was not read, as in the snapshots
+        return labels.codes(self.first_word, lambda word:
+                            scudo_columns.known_word(word) and
+                            self.symbols.get(word) or NO_SYMBOL)
+
+
+def u64(values):
+    return numpy.array(values, dtype=numpy.uint64)
+
+
+def collect(scuheap, symbols):
+    """HeapChunks of a ScuMalloc whose regions are decoded with their
+    first words"""
+    parts = []
+    for region_info in scuheap.region_info_array:
+        columns = region_info.columns
+        if columns is None:
+            continue
+        in_use = columns.in_use()
+        first_word = numpy.zeros(len(in_use), dtype=numpy.uint64)
+        if columns.first_word is not None:
+            first_word = columns.first_word[in_use]
+        parts.append((columns.addr[in_use] +
+                      numpy.uint64(scudo_columns.USER_WORD_OFFSET),
+                      columns.words[in_use],
+                      columns.size_or_unused[in_use],
+                      numpy.full(len(in_use), columns.class_size,
+                                 dtype=numpy.uint64),
+                      first_word))
+    headers = []
+    if scuheap.secondary:
+        headers = [item.large_block.chunk_header for item in
+                   scuheap.secondary.in_use_blocks_list +
+                   scuheap.secondary.cache_entry_list
+                   if item.large_block.chunk_header.in_use()]
+    parts.append((u64([int(h.user_addr, 16) for h in headers]),
+                  u64([h.word for h in headers]),
+                  u64([h.used_bytes for h in headers]),
+                  u64([0] * len(headers)),
+                  u64([h.first_word or 0 for h in headers])))
+    columns = [numpy.concatenate([u64(part[i]) for part in parts])
+               for i in range(5)]
+    return HeapChunks(*(columns + [symbols]))
+
+
+def persisted(old, new):
+    """masks of the chunks of old and of new that are in both heaps: same
+    address and same header word"""
+    kept_old = numpy.zeros(len(old), dtype=bool)
+    kept_new = numpy.zeros(len(new), dtype=bool)
+    if len(old) and len(new):
+        pos = numpy.searchsorted(old.addr, new.addr)
+        pos = numpy.minimum(pos, len(old) - 1)
+        kept_new = (old.addr[pos] == new.addr) & (old.word[pos] == new.word)
+        kept_old[pos[kept_new]] = True
+    return kept_old, kept_new
+
+
+class HeapDiff:
+    """Chunks that appeared, disappeared and persisted between two
+    HeapChunks."""
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.kept_old, self.kept_new = persisted(old, new)
+
+    def totals(self):
+        gone = ~self.kept_old
+        appeared = ~self.kept_new
+        return {
+            "old": len(self.old),
+            "old_bytes": int(self.old.used_bytes.sum()),
+            "new": len(self.new),
+            "new_bytes": int(self.new.used_bytes.sum()),
+            "appeared": int(appeared.sum()),
+            "appeared_bytes": int(self.new.used_bytes[appeared].sum()),
+            "gone": int(gone.sum()),
+            "gone_bytes": int(self.old.used_bytes[gone].sum()),
+            "persisted": int(self.kept_new.sum()),
+        }
+
+    def by(self, group):
+        """[(name, old, new, appeared, appeared_bytes, gone, gone_bytes,
+        persisted, delta_bytes)] of the groups that changed, largest
+        growth first"""
+        labels = Labels()
+        old_codes = self.old.codes(group, labels)
+        new_codes = self.new.codes(group, labels)
+        n = len(labels)
+
+        def count(codes, mask=None, weights=None):
+            if mask is not None:
+                codes = codes[mask]
+                if weights is not None:
+                    weights = weights[mask]
+            if weights is not None:
+                weights = weights.astype(numpy.float64)
+            return numpy.bincount(codes, weights, minlength=n) \
+                .astype(numpy.int64)
+
+        old_count = count(old_codes)
+        new_count = count(new_codes)
+        appeared = count(new_codes, ~self.kept_new)
+        appeared_bytes = count(new_codes, ~self.kept_new,
+                               self.new.used_bytes)
+        gone = count(old_codes, ~self.kept_old)
+        gone_bytes = count(old_codes, ~self.kept_old, self.old.used_bytes)
+        kept = count(new_codes, self.kept_new)
+        delta = appeared_bytes - gone_bytes
+        rows = [(labels.names[i], int(old_count[i]), int(new_count[i]),
+                 int(appeared[i]), int(appeared_bytes[i]), int(gone[i]),
+                 int(gone_bytes[i]), int(kept[i]), int(delta[i]))
+                for i in range(n) if appeared[i] or gone[i]]
+        rows.sort(key=lambda row: (row[8], row[4]), reverse=True)
+        return rows
@@ -0,0 +1,127 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where the heap memory goes, for scufrag. Every primary region is counted
+# from its decoded header columns: the chunk slots mapped, how many are
+# allocated, quarantined and available, and for the chunks in use the
+# bytes requested against the class_size bytes they take. Secondary blocks
+# compare the used size with the MapSize of their mapping.
+
+import scudo_parser
+from gdb_common import numpy
+
+
+def percent(part, whole):
+    if not whole:
+        return "-"
+    return "{:.1f}%".format(100.0 * part / whole)
+
+
+class ClassUsage:
+    """Slots and bytes of one primary region."""
+
+    def __init__(self, class_id, class_size, slots):
+        self.class_id = class_id
+        self.class_size = class_size
+        self.slots = slots
+        self.allocated = 0
+        self.quarantined = 0
+        self.available = 0
+        # bytes asked for by the chunks in use
+        self.requested = 0
+
+    def unknown(self):
+        """slots not decoded or in no valid state"""
+        return self.slots - self.allocated - self.quarantined - self.available
+
+    def in_use(self):
+        return self.allocated + self.quarantined
+
+    def consumed(self):
+        return self.in_use() * self.class_size
+
+    def waste(self):
+        return self.consumed() - self.requested
+
+    def add(self, other):
+        self.slots += other.slots
+        self.allocated += other.allocated
+        self.quarantined += other.quarantined
+        self.available += other.available
+        self.requested += other.requested
+
+
+class Total(ClassUsage):
+    """Sum of ClassUsages, whose class sizes differ."""
+
+    def __init__(self):
+        ClassUsage.__init__(self, "total", "", 0)
+        self.consumed_bytes = 0
+
+    def consumed(self):
+        return self.consumed_bytes
+
+    def add(self, other):
+        ClassUsage.add(self, other)
+        self.consumed_bytes += other.consumed()
+
+
+def class_usage(class_id, class_size, allocated_user, columns):
+    """ClassUsage of a region of allocated_user bytes, columns its
+    scudo_columns.ChunkColumns or None when it could not be decoded"""
+    usage = ClassUsage(class_id, class_size, allocated_user // class_size)
+    if columns is None or not len(columns):
+        return usage
+    if numpy is None:
+        counts = [0] * (scudo_parser.STATE_MASK + 1)
+        for i, state in enumerate(columns.state):
+            counts[state] += 1
+            if state in (scudo_parser.STATE_ALLOCATED,
+                         scudo_parser.STATE_QUARANTINED):
+                usage.requested += columns.size_or_unused[i]
+    else:
+        counts = numpy.bincount(columns.state.astype(numpy.intp),
+                                minlength=scudo_parser.STATE_MASK + 1)
+        counts = [int(n) for n in counts]
+        usage.requested = int(columns.size_or_unused[columns.in_use()].sum())
+    usage.allocated = counts[scudo_parser.STATE_ALLOCATED]
+    usage.quarantined = counts[scudo_parser.STATE_QUARANTINED]
+    usage.available = counts[scudo_parser.STATE_AVAILABLE]
+    return usage
+
+
+class BlockUsage:
+    """Secondary blocks of one list: their mappings against their use."""
+
+    def __init__(self, name, items):
+        self.name = name
+        self.blocks = len(items)
+        self.in_use = 0
+        self.map_bytes = 0
+        self.used_bytes = 0
+        for item in items:
+            block = item.large_block
+            self.map_bytes += int(block.map_size, 16)
+            if block.chunk_header.in_use():
+                self.in_use += 1
+                self.used_bytes += block.chunk_header.used_bytes
+
+    def waste(self):
+        return self.map_bytes - self.used_bytes
+
+    def add(self, other):
+        self.blocks += other.blocks
+        self.in_use += other.in_use
+        self.map_bytes += other.map_bytes
+        self.used_bytes += other.used_bytes
@@ -0,0 +1,162 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Address to chunk lookup. Primary regions and secondary blocks become
+# sorted, non overlapping intervals; a primary chunk is found by dividing
+# the offset into its region by the class size, so no chunk headers are
+# read. Chunks cached in a TSD are looked up by their start afterwards.
+
+from bisect import bisect_right
+from gdb_common import numpy
+
+PRIMARY = "primary"
+PERCLASS = "perclass"
+SECONDARY = "secondary"
+CACHE = "cache"
+
+
+class ChunkRef:
+    """Where a chunk lives: kind, its start and the structure it was found
+    in (RegionInfo, PerClass, SecondaryInUseBlocksPtr or
+    SecondaryCacheEntry). index is the chunk number in the region or the
+    slot in PerClass.chunk_list."""
+
+    def __init__(self, kind, chunk_addr, class_id, class_size, index, owner):
+        self.kind = kind
+        self.chunk_addr = chunk_addr
+        self.class_id = class_id
+        self.class_size = class_size
+        self.index = index
+        self.owner = owner
+
+
+class ChunkIndex:
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        # class size of a primary region, 0 for a secondary block
+        self.strides = []
+        self.kinds = []
+        self.class_ids = []
+        self.owners = []
+        # chunk start -> (PerClass, slot) of the chunks cached in a TSD
+        self.cached = {}
+        self.arrays = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end, stride, kind, class_id, owner):
+        if end > start:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.strides.append(stride)
+            self.kinds.append(kind)
+            self.class_ids.append(class_id)
+            self.owners.append(owner)
+
+    def add_cached(self, chunk_addr, perclass, slot):
+        self.cached[chunk_addr] = (perclass, slot)
+
+    def finish(self):
+        order = sorted(range(len(self.starts)), key=self.starts.__getitem__)
+        for name in ("starts", "ends", "strides", "kinds", "class_ids",
+                     "owners"):
+            values = getattr(self, name)
+            setattr(self, name, [values[i] for i in order])
+        if numpy is not None:
+            self.arrays = (numpy.array(self.starts, dtype=numpy.uint64),
+                           numpy.array(self.ends, dtype=numpy.uint64),
+                           numpy.array(self.strides, dtype=numpy.uint64))
+
+    def ref(self, i, addr):
+        stride = self.strides[i]
+        start = self.starts[i]
+        if not stride:
+            return ChunkRef(self.kinds[i], start, self.class_ids[i],
+                            self.ends[i] - start, 0, self.owners[i])
+        index = (addr - start) // stride
+        return self.chunk_ref(i, index, start + index * stride)
+
+    def chunk_ref(self, i, index, chunk_addr):
+        stride = self.strides[i]
+        if chunk_addr in self.cached:
+            perclass, slot = self.cached[chunk_addr]
+            return ChunkRef(PERCLASS, chunk_addr, self.class_ids[i], stride,
+                            slot, perclass)
+        return ChunkRef(self.kinds[i], chunk_addr, self.class_ids[i], stride,
+                        index, self.owners[i])
+
+    def find(self, addr):
+        """ChunkRef of the chunk whose block holds addr, None if none"""
+        i = bisect_right(self.starts, addr) - 1
+        if i < 0 or addr >= self.ends[i]:
+            return None
+        return self.ref(i, addr)
+
+    def find_many(self, addrs):
+        """find() for every address of addrs, in the same order"""
+        if numpy is None or not self.starts:
+            return [self.find(addr) for addr in addrs]
+        starts, ends, strides = self.arrays
+        addrs = numpy.asarray(addrs, dtype=numpy.uint64)
+        pos = numpy.searchsorted(starts, addrs, side="right") - 1
+        hit = pos >= 0
+        pos = numpy.where(hit, pos, 0)
+        hit &= addrs < ends[pos]
+        stride = strides[pos]
+        index = numpy.zeros(len(addrs), dtype=numpy.uint64)
+        primary = hit & (stride > 0)
+        index[primary] = (addrs[primary] - starts[pos[primary]]) // \
+            stride[primary]
+        chunk = starts[pos] + index * stride
+        result = []
+        for k in range(len(addrs)):
+            if not hit[k]:
+                result.append(None)
+            elif primary[k]:
+                result.append(self.chunk_ref(int(pos[k]), int(index[k]),
+                                             int(chunk[k])))
+            else:
+                result.append(self.ref(int(pos[k]), int(addrs[k])))
+        return result
+
+
+def build(scuheap):
+    """ChunkIndex over the regions, secondary blocks and TSD caches of a
+    parsed ScuMalloc"""
+    index = ChunkIndex()
+    for region_info in scuheap.region_info_array:
+        class_id = region_info.class_id
+        class_size = scuheap.perclass_array[class_id].class_size
+        region_beg = int(region_info.region_beg, 16)
+        allocated_user = int(region_info.allocated_user, 16)
+        if not (region_beg and class_size):
+            continue
+        end = region_beg + allocated_user // class_size * class_size
+        index.add(region_beg, end, class_size, PRIMARY, class_id,
+                  region_info)
+    if scuheap.secondary:
+        for kind, blocks in ((SECONDARY, scuheap.secondary.in_use_blocks_list),
+                             (CACHE, scuheap.secondary.cache_entry_list)):
+            for item in blocks:
+                block = item.large_block
+                index.add(int(block.chunk_header_addr, 16),
+                          int(block.block_end, 16), 0, kind, None, item)
+    for perclass in scuheap.perclass_array:
+        for slot, chunk_header in enumerate(perclass.chunk_list):
+            if chunk_header:
+                index.add_cached(int(chunk_header.addr, 16), perclass, slot)
+    index.finish()
+    return index
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Run the scudo commands on a core dump without gdb.
+#
+# The layout file comes from a gdb session on the same core:
+#   (gdb) scuparse
+#   (gdb) scudumplayout vold.layout.json
+# afterwards:
+#   ./scudo_offline.py -c vold_core_dump -l vold.layout.json stat h
+#
+# The first run saves a snapshot of the parsed heap, later runs on the same
+# core load it instead of parsing again and need no layout. A snapshot can
+# also be used alone, for the commands that do not read memory:
+#   ./scudo_offline.py -s ~/.cache/gdb_parser/snapshots/<hash>.npz stat h
+#
+# Growth between two cores of one process, the older parsed before:
+#   ./scudo_offline.py -c vold_core_dump.2 -l vold.layout.json diff \
+#       vold_core_dump.1
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+import gdb_common
+import gdb_core
+import scudo_parser
+import scudo_snapshot
+
+
+COMMANDS = {
+    "perclass":   lambda arg: scudo_parser.dump_perclasses(),
+    "chunks":     lambda arg: scudo_parser.dump_chunks(arg),
+    "achunks":    lambda arg: scudo_parser.dump_all_chunks(int(arg)),
+    "search":     lambda arg: scudo_parser.chunk_search(arg),
+    "dsearch":    lambda arg: scudo_parser.data_search(arg),
+    "index":      lambda arg: scudo_parser.dump_value_index(arg),
+    "secondary":  lambda arg: scudo_parser.dump_secondary(),
+    "regioninfo": lambda arg: scudo_parser.dump_region_infos(),
+    "frag":       lambda arg: scudo_parser.dump_fragmentation(),
+    "check":      lambda arg: scudo_parser.check_headers(arg),
+    "addrinfo":   lambda arg: scudo_parser.dump_chunk_info(
+        arg, start_from_header=False),
+    "chunkinfo":  lambda arg: scudo_parser.dump_chunk_info(arg),
+    "stat":       lambda arg: scudo_parser.dump_all_chunk_hit_stat(arg),
+    "diff":       lambda arg: scudo_parser.heap_diff(arg),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="scudo heap parser for core dumps, no gdb needed")
+    parser.add_argument("-c", "--core", help="core file")
+    parser.add_argument("-l", "--layout",
+                        help="layout file written by scudumplayout")
+    parser.add_argument("-s", "--snapshot",
+                        help="heap snapshot, by default the one of the core")
+    parser.add_argument("--reparse", action="store_true",
+                        help="parse the core even if it has a snapshot")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="processes decoding the regions when parsing, "
+                        "0 for one per cpu")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("args", nargs="*")
+    args = parser.parse_args(argv)
+
+    if args.core:
+        gdb_core.open_core(args.core, args.layout)
+    else:
+        gdb_common.set_memory_source(gdb_common.NoMemory())
+    snapshot = args.snapshot
+    if snapshot is None and args.core and not args.reparse:
+        snapshot = scudo_snapshot.snapshot_path(args.core)
+    loaded = snapshot and os.path.isfile(snapshot) and \
+        scudo_parser.load_snapshot(snapshot)
+    if not loaded:
+        if not (args.core and args.layout):
+            parser.error("give a core and its layout, or a snapshot")
+        scudo_parser.parse(args.jobs)
+    COMMANDS[args.command](" ".join(args.args))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
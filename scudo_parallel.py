@@ -0,0 +1,153 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Decode the primary regions of a core in a pool of processes, offline
+# only. Every worker maps the core read only by itself, so the pages are
+# shared through the page cache, and gets slices of whole chunks: it
+# decodes their headers, reads the first words of the chunks in use and
+# looks up their symbols. The slices come back in task order and are
+# joined per region, so the heap is the same as after a serial parse.
+# Demangling stays in the parent, with its cache and one c++filt.
+
+import os
+import time
+import multiprocessing
+import gdb_common
+import gdb_core
+import scudo_columns
+import scudo_parser
+import symbolizer
+from gdb_common import numpy
+
+# bytes of a region decoded by one task
+SLICE_SIZE = 64 << 20
+PHASES = ("decode", "first_words", "symbols")
+
+
+def region_tasks(class_id, class_size, region_beg, allocated_user):
+    """tasks covering the chunks of a region, SLICE_SIZE bytes each"""
+    step = max(SLICE_SIZE // class_size, 1) * class_size
+    end = region_beg + allocated_user // class_size * class_size
+    return [(class_id, class_size, beg, min(step, end - beg))
+            for beg in range(region_beg, end, step)]
+
+
+def init_worker(core_path, layout):
+    gdb_common.apply_layout(layout)
+    gdb_core.open_core(core_path)
+    # a forked worker must not reuse the parent's open files
+    symbolizer.reset()
+
+
+def decode_task(task):
+    """decode one slice; ChunkColumns does not pickle cheaply, so the raw
+    columns travel back"""
+    class_id, class_size, beg, size = task
+    seconds = []
+    start = time.time()
+    columns, holes = scudo_columns.decode_region(class_id, class_size,
+                                                 beg, size)
+    seconds.append(time.time() - start)
+
+    start = time.time()
+    first_word = scudo_parser.region_first_words(columns)
+    seconds.append(time.time() - start)
+
+    start = time.time()
+    in_use = columns.in_use()
+    if numpy is None:
+        words = set(first_word[i] for i in in_use)
+    else:
+        words = set(numpy.unique(first_word[in_use]).tolist())
+    words.discard(0)
+    raw = scudo_parser.raw_symbols(sorted(words))
+    seconds.append(time.time() - start)
+
+    skipped = size // class_size - len(columns)
+    return (class_id, columns.addr, columns.words, first_word, skipped,
+            bool(holes.holes), raw, os.getpid(), seconds)
+
+
+def join(parts):
+    if numpy is None:
+        return [v for part in parts for v in part]
+    return numpy.concatenate([numpy.asarray(part, dtype=numpy.uint64)
+                              for part in parts])
+
+
+def only_in_use(columns):
+    """keep the first words of the chunks in use only, as decoding a
+    whole region with holes does"""
+    if numpy is not None:
+        unused = numpy.ones(len(columns), dtype=bool)
+        unused[columns.in_use()] = False
+        columns.first_word[unused] = 0
+        return
+    in_use = set(columns.in_use())
+    for i in range(len(columns)):
+        if i not in in_use:
+            columns.first_word[i] = 0
+
+
+class WorkerStat:
+    def __init__(self, pid):
+        self.pid = pid
+        self.tasks = 0
+        self.chunks = 0
+        self.seconds = [0.0] * len(PHASES)
+
+
+def decode_regions(regions, jobs, core_path):
+    """regions: [(class_id, class_size, region_beg, allocated_user)].
+    Returns ({class_id: (ChunkColumns, skipped)}, {word: raw symbol},
+    [WorkerStat])"""
+    tasks = []
+    for region in regions:
+        tasks.extend(region_tasks(*region))
+    if not tasks:
+        return {}, {}, []
+    pool = multiprocessing.Pool(
+        min(jobs, len(tasks)), init_worker,
+        (core_path, gdb_common.collect_layout()))
+    try:
+        results = pool.map(decode_task, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    slices = {}
+    raw = {}
+    workers = {}
+    for (class_id, addrs, words, first_word, skipped, holes, symbols, pid,
+         seconds) in results:
+        slices.setdefault(class_id, []).append(
+            (addrs, words, first_word, skipped, holes))
+        raw.update(symbols)
+        worker = workers.setdefault(pid, WorkerStat(pid))
+        worker.tasks += 1
+        worker.chunks += len(addrs)
+        worker.seconds = [a + b for a, b in zip(worker.seconds, seconds)]
+
+    decoded = {}
+    for class_id, class_size, region_beg, allocated_user in regions:
+        parts = slices.get(class_id)
+        if not parts:
+            continue
+        columns = scudo_columns.ChunkColumns(
+            class_id, class_size, join(p[0] for p in parts),
+            join(p[1] for p in parts), join(p[2] for p in parts))
+        if any(p[4] for p in parts):
+            only_in_use(columns)
+        decoded[class_id] = (columns, sum(p[3] for p in parts))
+    return decoded, raw, sorted(workers.values(), key=lambda w: w.pid)
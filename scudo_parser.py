@@ -20,15 +20,30 @@ import time
 import datetime
 import copy
 import tempfile
+import multiprocessing
 import traceback
-import ConfigParser
 import logging
 from scudo_class import *
-import gdb
+try:
+    import gdb
+except ImportError:
+    gdb = None
 import gdb_elf
-from collections import defaultdict
+import gdb_common
 import utils
-import bss_search
+import profiler
+import scudo_columns
+import scudo_index
+import mem_search
+import value_index
+import scudo_snapshot
+import scudo_diff
+import scudo_stat
+import scudo_frag
+import scudo_checksum
+import scudo_parallel
+import demangle
+import symbolizer
 from gdb_common import *
 from utils import *
 
@@ -56,6 +71,30 @@ STATE_DICT = {
     STATE_QUARANTINED:  "Quarantined",
 }
 
+# packed chunk header: ClassId:8 State:2 Origin:2 SizeOrUnusedBytes:20
+# Offset:16 Checksum:16
+CHUNK_HEADER_SIZE = 8
+# TSDs parsed when the registry does not tell how many are in use
+DEFAULT_TSD_COUNT = 8
+# blocks followed at most on the secondary in-use list, against corrupted
+# links
+MAX_IN_USE_BLOCKS = int(os.environ.get("GDB_PARSER_MAX_IN_USE_BLOCKS",
+                                       1 << 20))
+# headers scucheck tells the checksum algorithm from
+CHECK_SAMPLE = 4096
+# corrupted chunks scucheck lists by default
+CHECK_LIST = 16
+CLASS_ID_MASK = 0xff
+STATE_ORIGIN_SHIFT = 8
+STATE_MASK = 0x3
+ORIGIN_MASK = 0xc
+SIZE_OR_UNUSED_SHIFT = 12
+SIZE_OR_UNUSED_MASK = 0xfffff
+OFFSET_SHIFT = 32
+OFFSET_MASK = 0xffff
+CHECKSUM_SHIFT = 48
+CHECKSUM_MASK = 0xffff
+
 global_file_path = os.path.dirname(os.path.realpath(__file__))
 LOG_FORMAT = ""
 # INFO DEBUG WARNING ERROR CRITICAL
@@ -83,16 +122,32 @@ def help():
         : dump info on all class_size in RegionInfo mapped area')
     print('[parser]   scusearch  <addr>       \
         : search addr in primary perclass regionInfo and secondary')
-    print('[parser]   scudsearch  <data>      \
+    print('[parser]   scudsearch  <data>...   \
         : search data in heap allocated chunks')
+    print('[parser]               0x12??5678 any nibble, \
+0x1234/0xff00 masked, 0x7000-0x8000 pointers in range')
+    print('[parser]   scuindex [build|drop]   \
+        : index heap words so scudsearch is a lookup')
+    print('[parser]   scusnapshot save|load [path] \
+        : save or load the parsed heap')
+    print('[parser]   scudiff <snapshot|core> [symbol|size|origin] [top] \
+        : chunks appeared and gone since an older heap')
     print('[parser]   scuparse                \
         : parse scudo structures from memory')
     print('[parser]   scusecondary            \
         : dump info of secondary structures')
+    print('[parser]   scufrag                 \
+        : slots and bytes used and wasted per class and secondary')
+    print('[parser]   scucheck [crc32|bsd] [N] \
+        : verify every chunk header, list the first N corrupted (16)')
     print('[parser]   scuaddrinfo <addr>      \
         : dump malloc addr state')
     print('[parser]   scuchunkinfo <addr>     \
         : dump chunk header state')
+    print('[parser]   scudumplayout <file>    \
+        : save symbols and offsets for scudo_offline.py')
+    print('[parser]   scuprofile [reset|on|off|mem|json <file>] \
+        : time spent in gdb, memory reads and tools per call site')
     print('[parser]   scustat                 \
         : dump allocated chunk statistic information')
     print('[parser]           h               \
@@ -101,6 +156,8 @@ def help():
         :     total size in descending order')
     print('[parser]              d            \
         :             in detail')
+    print('[parser]                 N         \
+        :             at most N chunks per symbol, 0 all (32)')
 
 
 def dump_chunks(classsize):
@@ -158,85 +215,203 @@ def dump_perclasses():
     print(assemble_table(table))
 
 
-def data_search(search_for):
+def search_spans():
+    """(addr, size) of the memory scudsearch looks at: the mapped part of
+    every region and the user part of every secondary block"""
+    global scuheap
+    spans = []
+    for region_info in scuheap.region_info_array[1:]:
+        spans.append((int(region_info.region_beg, 16),
+                       int(region_info.allocated_user, 16)))
+    for blocks in (scuheap.secondary.in_use_blocks_list,
+                   scuheap.secondary.cache_entry_list):
+        for block_item in blocks:
+            block = block_item.large_block
+            user_addr = int(block.user_start_addr, 16)
+            spans.append((user_addr, int(block.block_end, 16) - user_addr))
+    return sorted((addr, size) for addr, size in spans if addr and size > 0)
+
+
+def find_data(search_for):
+    """(pattern, found_addr, ChunkRef) of every match of the patterns of
+    search_for in the heap, see mem_search.SearchPattern for the syntax"""
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return []
+    patterns = mem_search.parse_patterns(search_for)
+    hits = []
+    if scuheap.value_index is not None:
+        scan = []
+        for p in patterns:
+            start = time.time()
+            found = scuheap.value_index.search(p)
+            if found is None:
+                scan.append(p)
+                continue
+            logging.warning("index: {} {} hits in {:.1f}ms".format(
+                p.text, len(found), (time.time() - start) * 1000))
+            hits.extend((p, addr) for addr in found)
+        patterns = scan
+    if patterns and not gdb_common.memory_source.has_memory:
+        logging.error("searching needs the core, only a snapshot is loaded")
+    elif patterns:
+        searcher = mem_search.Searcher(patterns)
+        for addr, size in search_spans():
+            hits.extend(searcher.search(addr, size))
+    hits.sort(key=lambda hit: hit[1])
+    refs = locate_chunks([found for _, found in hits])
+    return [(p.text, found, ref) for (p, found), ref in zip(hits, refs)]
+
+
+def chunk_header_of(ref):
+    if ref.kind == scudo_index.PERCLASS:
+        return ref.owner.chunk_list[ref.index]
+    if ref.kind in (scudo_index.SECONDARY, scudo_index.CACHE):
+        return ref.owner.large_block.chunk_header
+    return region_chunk_header(ref)
+
+
+def value_index_path():
+    core_path = gdb_common.memory_source.core_path()
+    if not core_path:
+        return None, None
+    return core_path, value_index.index_path(core_path)
+
+
+def load_value_index():
+    """the heap index saved next to the core, if it matches this heap"""
+    global scuheap
+    if numpy is None:
+        return None
+    core_path, path = value_index_path()
+    if not path:
+        return None
+    index = value_index.load(path, core_path)
+    if index is not None and not index.matches(
+            search_spans(), arch_dword_size()):
+        logging.warning("heap index {} is for other spans".format(path))
+        return None
+    return index
+
+
+def build_value_index():
     global scuheap
+    if numpy is None:
+        logging.error("the heap index needs numpy")
+        return
+    with profiler.phase("value_index"):
+        index = value_index.build(search_spans(), arch_dword_size())
+    scuheap.value_index = index
+    core_path, path = value_index_path()
+    if path:
+        try:
+            index.save(path, core_path)
+            logging.warning("heap index saved to {}".format(path))
+        except (IOError, OSError) as e:
+            logging.error("cannot save heap index {}: {}".format(path, e))
+    else:
+        logging.warning("live process, the heap index is not saved")
+
 
+def dump_value_index(arg):
+    """scuindex [build|drop]: build or drop the heap index of scudsearch,
+    without argument show its size"""
+    global scuheap
     if not scuheap:
         logging.error("pls run scuparse first")
         return
+    arg = arg.strip()
+    if arg == "build":
+        build_value_index()
+    elif arg == "drop":
+        scuheap.value_index = None
+        core_path, path = value_index_path()
+        if path and os.path.isfile(path):
+            os.remove(path)
+        return
+    elif arg:
+        logging.error("usage: scuindex [build|drop]")
+        return
+    if scuheap.value_index is None:
+        logging.error("no heap index, run scuindex build")
+        return
+    info = scuheap.value_index.info()
+    info.update(("query_" + k, v)
+                for k, v in value_index.query_stats.items())
+    table = [("key", "value")]
+    for k, v in sorted(info.items()):
+        table.append((k, v))
+    print(assemble_table(table))
 
-    search_for = search_for.lstrip('0x')
-    matches = []
+
+def data_search(search_for):
+    global scuheap
+
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return
 
     logging.warning("search for {}".format(search_for))
+    try:
+        matches = find_data(search_for)
+    except ValueError as e:
+        logging.error("invalid pattern {}: {}".format(search_for, e))
+        return
+    if not matches:
+        logging.error("{} not found".format(search_for))
+        return
 
-    search_for_hex = utils.to_lendian_ba(search_for)
-    search_for_bytes = bytearray(search_for_hex)
-    logging.warning("search for {}".format(search_for_bytes))
+    # many hits land in the same region, decode it once
+    for class_id in set(ref.class_id for _, _, ref in matches
+                        if ref and ref.kind == scudo_index.PRIMARY):
+        region_columns(class_id)
+    headers = [chunk_header_of(ref) if ref else None
+               for _, _, ref in matches]
+    resolve_symbols([header for header in headers if header])
+
+    table = [("pattern", "found_addr", "kind", "chunk_addr", "class_size",
+              "state", "origi", "used_bytes", "user_addr_start",
+              "check_sum", "symbol_addr", "symbol_info")]
+    for (text, found, ref), header in zip(matches, headers):
+        if header is None:
+            table.append((text, hex(found)) + ("-",) * 10)
+            continue
+        table.append((text, hex(found), ref.kind, header.addr,
+                      ref.class_size, header.state, header.origi,
+                      header.used_bytes, header.user_addr, header.check_sum,
+                      header.symbol_addr, header.symbol_info))
+    print(assemble_table(table))
+    logging.warning("{} matches".format(len(matches)))
 
-    perclas_array_size = symbol_int_value('Allocator.Primary.NumClasses')
-    for index in range(1, perclas_array_size):
-        RegionBeg = int(scuheap.region_info_array[index].region_beg, 16)
-        AllocatedUser = int(
-            scuheap.region_info_array[index].allocated_user, 16)
-        mem = read_bytes(RegionBeg, AllocatedUser)
-        matches.extend(utils.search_bytes(
-            mem, search_for_bytes,
-            RegionBeg, scuheap.perclass_array[index].class_size)
-        )
-
-    for use_block_item in scuheap.secondary.in_use_blocks_list:
-        use_block = use_block_item.large_block
-        user_addr = int(use_block.user_start_addr, 16)
-        map_user_size = int(use_block.block_end, 16) - user_addr - 1
-        mem = read_bytes(user_addr, map_user_size)
-        matches.extend(utils.search_bytes(mem, search_for_bytes, user_addr))
-
-    for cache_block_item in scuheap.secondary.cache_entry_list:
-        cache_block = cache_block_item.large_block
-        user_addr = int(cache_block.user_start_addr, 16)
-        map_user_size = int(cache_block.block_end, 16) - user_addr - 1
-        mem = read_bytes(user_addr, map_user_size)
-        matches.extend(utils.search_bytes(mem, search_for_bytes, user_addr))
-
-    for found_addr, addr_begin in matches:
-        if addr_begin in scuheap.user_addr_map:
-            try:
-                large_block = scuheap.user_addr_map[addr_begin].large_block
-                table = [("found_addr", "BlockEnd", "MapBase", "MapSize",
-                          "state", "origi", "used_bytes", "chunkaddr",
-                          "user_addr_start", "check_sum",
-                          "symbol_addr", "symbol_info")]
-                table.append((hex(found_addr), large_block.block_end,
-                              large_block.map_base, large_block.map_size,
-                              large_block.chunk_header.state,
-                              large_block.chunk_header.origi,
-                              large_block.chunk_header.used_bytes,
-                              large_block.chunk_header.addr,
-                              large_block.chunk_header.user_addr,
-                              large_block.chunk_header.check_sum,
-                              large_block.chunk_header.symbol_addr,
-                              large_block.chunk_header.symbol_info))
-                print(assemble_table(table))
-            except Exception as e:
-                header = scuheap.user_addr_map[addr_begin]
-                table = [("found_addr", "chunk_addr", "class_size", "class_id",
-                          "state", "origi", "used_bytes", "user_addr_start",
-                          "check_sum", "symbol_addr", "symbol_info")]
-                table.append((hex(found_addr), header.addr,
-                              scuheap.perclass_array[header.class_id]
-                              .class_size,
-                              header.class_id,
-                              header.state,
-                              header.origi,
-                              header.used_bytes,
-                              header.user_addr,
-                              header.check_sum,
-                              header.symbol_addr,
-                              header.symbol_info))
-                print(assemble_table(table))
-        else:
-            chunk_search(hex(found_addr))
+
+def locate_chunks(addrs):
+    """ChunkRef (see scudo_index) of the chunk holding every address of
+    addrs, None for an address outside the heap"""
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return None
+    return scuheap.chunk_index.find_many(addrs)
+
+
+def locate_chunk(address):
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return None
+    return scuheap.chunk_index.find(address)
+
+
+def region_chunk_header(ref):
+    """ChunkHeader of a primary chunk found by the index, from the decoded
+    region if there is one, else from its header alone"""
+    columns = ref.owner.columns
+    if columns is not None:
+        i = columns.index_of(ref.chunk_addr)
+        if i >= 0 and int(columns.addr[i]) == ref.chunk_addr:
+            return columns.header(i)
+    return parse_chunk_header(hex(ref.chunk_addr))
 
 
 def chunk_search(addr):
@@ -252,110 +427,80 @@ def chunk_search(addr):
 
     address = int(chunk_start_hex, 16)
 
-    logging.warning("search in primary perclass...")
-    for pc in scuheap.perclass_array:
-        for index, chunk_header in enumerate(pc.chunk_list):
-            if not chunk_header:
-                continue
-            if address < int(chunk_header.addr, 16) + pc.class_size and \
-                    address >= int(chunk_header.addr, 16):
-                table = [("index", "tid", "chunk_addr", "class_size",
-                          "class_id", "state", "origi", "used_bytes",
-                          "user_addr_start", "check_sum",
-                          "symbol_addr", "symbol_info")]
-                table.append((index, pc.tid, chunk_header.addr, pc.class_size,
-                              chunk_header.class_id,
-                              chunk_header.state,
-                              chunk_header.origi,
-                              chunk_header.used_bytes,
-                              chunk_header.user_addr,
-                              chunk_header.check_sum,
-                              chunk_header.symbol_addr,
-                              chunk_header.symbol_info))
-                print(assemble_table(table))
-                return
-
-    logging.warning("search in secondary used...")
-    for use_block_item in scuheap.secondary.in_use_blocks_list:
-        use_block = use_block_item.large_block
-        if address <= int(hexadd(use_block.block_end, -header_size), 16) and \
-                address >= int(use_block.chunk_header.addr, 16):
-            table = [("Prev", "Next", "BlockEnd", "MapBase", "MapSize",
-                      "state", "origi", "used_bytes",
-                      "chunkaddr", "user_addr_start", "check_sum",
-                      "symbol_addr", "symbol_info")]
-            table.append((use_block_item.l_prev,
-                          use_block_item.l_next,
-                          use_block.block_end,
-                          use_block.map_base,
-                          use_block.map_size,
-                          use_block.chunk_header.state,
-                          use_block.chunk_header.origi,
-                          use_block.chunk_header.used_bytes,
-                          use_block.chunk_header.addr,
-                          use_block.chunk_header.user_addr,
-                          use_block.chunk_header.check_sum,
-                          use_block.chunk_header.symbol_addr,
-                          use_block.chunk_header.symbol_info))
-            print(assemble_table(table))
-            return
-
-    logging.warning("search in secondary cache...")
-    for cache_entry_item in scuheap.secondary.cache_entry_list:
-        cache_entry = cache_entry_item.large_block
-        if address <= int(hexadd(cache_entry.block_end, -header_size), 16) \
-                and address >= int(cache_entry.chunk_header_addr, 16):
-            header = parse_chunk_header(cache_entry.chunk_header_addr)
-            table = [("BlockAddr", "BlockEnd", "MapBase", "MapSize",
-                      "state", "origi", "used_bytes", "user_addr_start",
-                      "check_sum", "symbol_addr", "symbol_info")]
-            table.append((cache_entry.block_addr,
-                          cache_entry.block_end,
-                          cache_entry.map_base,
-                          cache_entry.map_size,
-                          cache_entry.chunk_header.state,
-                          cache_entry.chunk_header.origi,
-                          cache_entry.chunk_header.used_bytes,
-                          cache_entry.chunk_header.user_addr,
-                          cache_entry.chunk_header.check_sum,
-                          cache_entry.chunk_header.symbol_addr,
-                          cache_entry.chunk_header.symbol_info))
-            print(assemble_table(table))
-            return
+    ref = locate_chunk(address)
+    if ref is None:
+        logging.error("{} not a valid pointer".format(addr))
+        return
 
-    logging.warning("search in primary RegionInfo mapped user...")
-    perclas_array_size = symbol_int_value('Allocator.Primary.NumClasses')
-    class_id = -1
-    for index in range(perclas_array_size):
-        RegionBeg = int(scuheap.region_info_array[index].region_beg, 16)
-        RegionEnd = RegionBeg + \
-            int(scuheap.region_info_array[index].allocated_user,
-                16) - header_size
-        if address >= RegionBeg and address < RegionEnd:
-            class_id = index
-            break
-    if class_id != -1:
-        index = class_id
-        logging.warning("locate region...")
-        dump_region_info(class_id)
-        class_size = scuheap.perclass_array[index].class_size
-        header_list = parse_allocated_chunks(class_size)
-        for header_index, header in enumerate(header_list):
-            if (address < int(header.addr, 16) + (class_size - header_size)) \
-                    and (address >= int(header.addr, 16)):
-                table = [("index", "chunk_addr", "class_size",
-                          "class_id", "state", "origi",
-                          "used_bytes", "user_addr_start",
-                          "check_sum", "symbol_addr", "symbol_info")]
-                table.append((header_index, header.addr, class_size,
-                              header.class_id, header.state,
-                              header.origi, header.used_bytes,
-                              header.user_addr, header.check_sum,
-                              header.symbol_addr, header.symbol_info))
-                print(assemble_table(table))
-                return
-
-    logging.error("{} not a valid pointer".format(addr))
+    logging.warning("found in {}...".format(ref.kind))
+    if ref.kind == scudo_index.PERCLASS:
+        pc = ref.owner
+        chunk_header = pc.chunk_list[ref.index]
+        table = [("index", "tid", "chunk_addr", "class_size",
+                  "class_id", "state", "origi", "used_bytes",
+                  "user_addr_start", "check_sum",
+                  "symbol_addr", "symbol_info")]
+        table.append((ref.index, pc.tid, chunk_header.addr, pc.class_size,
+                      chunk_header.class_id,
+                      chunk_header.state,
+                      chunk_header.origi,
+                      chunk_header.used_bytes,
+                      chunk_header.user_addr,
+                      chunk_header.check_sum,
+                      chunk_header.symbol_addr,
+                      chunk_header.symbol_info))
+        print(assemble_table(table))
+    elif ref.kind == scudo_index.SECONDARY:
+        use_block_item = ref.owner
+        use_block = use_block_item.large_block
+        table = [("Prev", "Next", "BlockEnd", "MapBase", "MapSize",
+                  "state", "origi", "used_bytes",
+                  "chunkaddr", "user_addr_start", "check_sum",
+                  "symbol_addr", "symbol_info")]
+        table.append((use_block_item.l_prev,
+                      use_block_item.l_next,
+                      use_block.block_end,
+                      use_block.map_base,
+                      use_block.map_size,
+                      use_block.chunk_header.state,
+                      use_block.chunk_header.origi,
+                      use_block.chunk_header.used_bytes,
+                      use_block.chunk_header.addr,
+                      use_block.chunk_header.user_addr,
+                      use_block.chunk_header.check_sum,
+                      use_block.chunk_header.symbol_addr,
+                      use_block.chunk_header.symbol_info))
+        print(assemble_table(table))
+    elif ref.kind == scudo_index.CACHE:
+        cache_entry = ref.owner.large_block
+        table = [("BlockAddr", "BlockEnd", "MapBase", "MapSize",
+                  "state", "origi", "used_bytes", "user_addr_start",
+                  "check_sum", "symbol_addr", "symbol_info")]
+        table.append((cache_entry.block_addr,
+                      cache_entry.block_end,
+                      cache_entry.map_base,
+                      cache_entry.map_size,
+                      cache_entry.chunk_header.state,
+                      cache_entry.chunk_header.origi,
+                      cache_entry.chunk_header.used_bytes,
+                      cache_entry.chunk_header.user_addr,
+                      cache_entry.chunk_header.check_sum,
+                      cache_entry.chunk_header.symbol_addr,
+                      cache_entry.chunk_header.symbol_info))
+        print(assemble_table(table))
+    else:
+        dump_region_info(ref.class_id)
+        header = region_chunk_header(ref)
+        table = [("index", "chunk_addr", "class_size",
+                  "class_id", "state", "origi",
+                  "used_bytes", "user_addr_start",
+                  "check_sum", "symbol_addr", "symbol_info")]
+        table.append((ref.index, header.addr, ref.class_size,
+                      header.class_id, header.state,
+                      header.origi, header.used_bytes,
+                      header.user_addr, header.check_sum,
+                      header.symbol_addr, header.symbol_info))
+        print(assemble_table(table))
 
 
 def dump_chunk_info(chunk_addr, start_from_header=True):
@@ -366,90 +511,59 @@ def dump_chunk_info(chunk_addr, start_from_header=True):
 
     header_size = scuheap.chunk_header_size
     if start_from_header:
-        chunk_start_hex = chunk_addr
+        chunk_start_hex = hexadd(chunk_addr, 0)
     else:
         chunk_start_hex = hexadd(chunk_addr, -header_size)
 
-    logging.warning("from perclass...")
-    FOUND = False
-    for pc in scuheap.perclass_array:
-        for index, chunk_header in enumerate(pc.chunk_list):
-            if not chunk_header:
-                continue
-            if chunk_header.addr == chunk_start_hex:
-                table = [("index", "tid", "chunk_addr", "class_size")]
-                table.append((index, pc.tid, chunk_header.addr, pc.class_size))
-                print(assemble_table(table))
-                FOUND = True
-                break
+    ref = locate_chunk(int(chunk_start_hex, 16))
+    if ref is None or ref.chunk_addr != int(chunk_start_hex, 16):
+        logging.error("{} not a valid chunk".format(chunk_start_hex))
+        return
 
-    if not FOUND:
-        logging.warning("from secondary used...")
-        for use_block_item in scuheap.secondary.in_use_blocks_list:
-            use_block = use_block_item.large_block
-            if use_block.chunk_header.addr == chunk_start_hex:
-                table = [("BlockAddr", "Prev", "Next",
-                          "BlockEnd", "MapBase", "MapSize")]
-                table.append((use_block.block_addr, use_block.l_prev,
-                              use_block.l_next,
-                              use_block.block_end,
-                              use_block.map_base,
-                              use_block.map_size))
-                print(assemble_table(table))
-                FOUND = True
-                break
+    logging.warning("from {}...".format(ref.kind))
+    if ref.kind == scudo_index.PERCLASS:
+        table = [("index", "tid", "chunk_addr", "class_size")]
+        table.append((ref.index, ref.owner.tid, chunk_start_hex,
+                      ref.owner.class_size))
+    elif ref.kind == scudo_index.SECONDARY:
+        use_block_item = ref.owner
+        use_block = use_block_item.large_block
+        table = [("BlockAddr", "Prev", "Next",
+                  "BlockEnd", "MapBase", "MapSize")]
+        table.append((use_block.block_addr, use_block_item.l_prev,
+                      use_block_item.l_next,
+                      use_block.block_end,
+                      use_block.map_base,
+                      use_block.map_size))
+    elif ref.kind == scudo_index.CACHE:
+        cache_entry = ref.owner.large_block
+        table = [("BlockAddr", "BlockEnd", "MapBase", "MapSize")]
+        table.append((cache_entry.block_addr, cache_entry.block_end,
+                      cache_entry.map_base, cache_entry.map_size))
+    else:
+        table = [("index", "chunk_addr", "class_size")]
+        table.append((ref.index, chunk_start_hex, ref.class_size))
+    print(assemble_table(table))
 
-    if not FOUND:
-        logging.warning("from secondary cached...")
-        for cache_entry_item in scuheap.secondary.cache_entry_list:
-            cache_entry = cache_entry_item.large_block
-            if cache_entry.chunk_header.addr == chunk_start_hex:
-                table = [("BlockAddr", "BlockEnd", "MapBase", "MapSize")]
-                table.append((cache_entry.block_addr, cache_entry.block_end,
-                              cache_entry.map_base, cache_entry.map_size))
-                print(assemble_table(table))
-                FOUND = True
-                break
+    header = chunk_header_of(ref)
+    logging.warning("dump chunk info {}".format(chunk_start_hex))
 
-    if not FOUND:
-        logging.warning("search in primary RegionInfo mapped user...")
-        perclas_array_size = symbol_int_value('Allocator.Primary.NumClasses')
-        class_id = -1
-        address = int(chunk_start_hex, 16)
-        for index in range(perclas_array_size):
-            RegionBeg = int(scuheap.region_info_array[index].region_beg, 16)
-            RegionEnd = int(scuheap.region_info_array[index].region_beg, 16) \
-                - header_size + int(
-                scuheap.region_info_array[index].allocated_user, 16)
-            if address >= RegionBeg and address <= RegionEnd:
-                class_id = index
-                break
+    if header:
+        table = [("classid", "state", "origin", "user_addr",
+                  "used_bytes", "offset", "check_sum")]
+        table.append((header.class_id, header.state, header.origi,
+                      header.user_addr, header.used_bytes,
+                      header.offset, header.check_sum))
+        print(assemble_table(table))
 
-        if class_id != -1:
-            index = class_id
-            class_size = scuheap.perclass_array[index].class_size
-            header_list = parse_allocated_chunks(class_size)
-            for header_index, header in enumerate(header_list):
-                if address == int(header.addr, 16):
-                    table = [("index", "chunk_addr", "class_size")]
-                    table.append((header_index, header.addr, class_size))
-                    print(assemble_table(table))
-                    FOUND = True
-                    break
-
-    if FOUND:
-        header = parse_chunk_header(chunk_start_hex)
-        logging.warning("dump chunk info {}".format(chunk_start_hex))
-
-        if header:
-            table = [("classid", "state", "origin", "user_addr",
-                      "used_bytes", "offset", "check_sum")]
-            table.append((header.class_id, header.state, header.origi,
-                          header.user_addr, header.used_bytes,
-                          header.offset, header.check_sum))
-            print(assemble_table(table))
-    else:
-        logging.error("{} not a valid chunk".format(chunk_start_hex))
+
+def dump_layout(path):
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return
+    gdb_common.dump_layout(path)
+    logging.warning("layout saved to {}".format(path))
 
 
 def print_timestamp():
@@ -489,6 +603,225 @@ def dump_region_info(class_id):
     print(assemble_table(table))
 
 
+def dump_fragmentation():
+    """slots and bytes used per class and per secondary list"""
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return
+    table = [("ClassId", "ClassSize", "Slots", "Allocated", "Quarantined",
+              "Available", "Unknown", "InUse%", "Requested", "Consumed",
+              "Waste", "Waste%")]
+    total = scudo_frag.Total()
+    for region_info in scuheap.region_info_array[1:]:
+        class_id = region_info.class_id
+        class_size = scuheap.perclass_array[class_id].class_size
+        allocated_user = int(region_info.allocated_user, 16)
+        if not (class_size and allocated_user):
+            continue
+        usage = scudo_frag.class_usage(class_id, class_size, allocated_user,
+                                       region_columns(class_id))
+        total.add(usage)
+        table.append(frag_row(usage))
+    table.append(("--",))
+    table.append(frag_row(total))
+    print(assemble_table(table))
+
+    blocks = scudo_frag.BlockUsage("total", [])
+    if scuheap.secondary:
+        table = [("Secondary", "Blocks", "InUse", "MapBytes", "UsedBytes",
+                  "Waste", "Waste%")]
+        for usage in (scudo_frag.BlockUsage(
+                          "in_use", scuheap.secondary.in_use_blocks_list),
+                      scudo_frag.BlockUsage(
+                          "cache", scuheap.secondary.cache_entry_list)):
+            blocks.add(usage)
+            table.append(block_row(usage))
+        table.append(("--",))
+        table.append(block_row(blocks))
+        print(assemble_table(table))
+
+    logging.error("primary {} of {} slots in use, {} bytes requested in {} "
+                  "({} waste); secondary {} bytes used in {} mapped "
+                  "({} waste)".format(
+                      total.in_use(), total.slots, total.requested,
+                      total.consumed(),
+                      scudo_frag.percent(total.waste(), total.consumed()),
+                      blocks.used_bytes, blocks.map_bytes,
+                      scudo_frag.percent(blocks.waste(), blocks.map_bytes)))
+
+
+def frag_row(usage):
+    return (usage.class_id, usage.class_size, usage.slots, usage.allocated,
+            usage.quarantined, usage.available, usage.unknown(),
+            scudo_frag.percent(usage.in_use(), usage.slots),
+            usage.requested, usage.consumed(), usage.waste(),
+            scudo_frag.percent(usage.waste(), usage.consumed()))
+
+
+def block_row(usage):
+    return (usage.name, usage.blocks, usage.in_use, usage.map_bytes,
+            usage.used_bytes, usage.waste(),
+            scudo_frag.percent(usage.waste(), usage.map_bytes))
+
+
+def region_headers(columns):
+    """(addrs, words, block offsets, unread) of the chunk headers of a
+    region: a block that starts with a BlockMarker has its header further
+    in, unread counts those that could not be read"""
+    addrs = columns.addr
+    words = columns.words
+    marker = scudo_checksum.BLOCK_MARKER
+    if numpy is None:
+        offsets = [0] * len(words)
+        markers = [i for i, w in enumerate(words) if w & 0xffffffff == marker]
+    else:
+        offsets = numpy.zeros(len(words), dtype=numpy.uint64)
+        markers = numpy.flatnonzero(
+            (words & numpy.uint64(0xffffffff)) == numpy.uint64(marker))
+        markers = markers.tolist()
+    if not markers:
+        return addrs, words, offsets, 0
+    addrs = copy.copy(addrs)
+    words = copy.copy(words)
+    batch = ReadBatch()
+    for i in markers:
+        batch.add(int(addrs[i]) + (int(words[i]) >> 32), CHUNK_HEADER_SIZE)
+    batch.execute()
+    unread = 0
+    for i in markers:
+        offset = int(words[i]) >> 32
+        try:
+            mem = batch.get(int(addrs[i]) + offset, CHUNK_HEADER_SIZE)
+        except Exception as e:
+            logging.debug("header of block {}: {}".format(hex(int(addrs[i])),
+                                                          e))
+            words[i] = 0
+            unread += 1
+            continue
+        addrs[i] += offset
+        words[i] = bytes2num(mem, CHUNK_HEADER_SIZE)
+        offsets[i] = offset
+    return addrs, words, offsets, unread
+
+
+def count_flags(flags, bit=None):
+    """how many flags are set, or have bit set"""
+    if numpy is None or not hasattr(flags, "dtype"):
+        return sum(1 for f in flags if (f & bit if bit else f))
+    if bit is None:
+        return int(numpy.count_nonzero(flags))
+    return int(numpy.count_nonzero(flags & bit))
+
+
+def check_headers(arg):
+    """verify the checksum, class id and place of every chunk header and
+    list the first corrupted ones with their neighbors"""
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return
+    algorithm = None
+    limit = CHECK_LIST
+    for word in (arg or "").split():
+        if word in scudo_checksum.ALGORITHMS:
+            algorithm = word
+        else:
+            limit = int(word)
+    dword_size = arch_dword_size()
+    header_size = scudo_checksum.header_size(dword_size)
+    cookie = scuheap.cookie
+    if cookie is None:
+        logging.error("Allocator.Cookie unknown, checksums not verified")
+
+    regions = []
+    for region_info in scuheap.region_info_array[1:]:
+        class_id = region_info.class_id
+        class_size = scuheap.perclass_array[class_id].class_size
+        if not (class_size and int(region_info.allocated_user, 16)):
+            continue
+        columns = region_columns(class_id)
+        if columns is not None:
+            regions.append((class_id, class_size) + region_headers(columns))
+    blocks = []
+    if scuheap.secondary:
+        blocks = [item.large_block for item in
+                  scuheap.secondary.in_use_blocks_list +
+                  scuheap.secondary.cache_entry_list]
+    regions.append((0, None, [int(b.chunk_header_addr, 16) for b in blocks],
+                    [b.chunk_header.word for b in blocks], [0] * len(blocks),
+                    0))
+
+    def user_addrs(addrs):
+        if numpy is None or not len(addrs) or not hasattr(addrs, "dtype"):
+            return [int(a) + header_size for a in addrs]
+        return addrs + numpy.uint64(header_size)
+
+    if cookie is not None and algorithm is None:
+        sample_addrs = []
+        sample_words = []
+        for region in regions:
+            for addr, word in zip(region[2][:CHECK_SAMPLE],
+                                  region[3][:CHECK_SAMPLE]):
+                if word and len(sample_words) < CHECK_SAMPLE:
+                    sample_addrs.append(int(addr))
+                    sample_words.append(int(word))
+        algorithm = scudo_checksum.detect(cookie, user_addrs(sample_addrs),
+                                          sample_words, dword_size)
+        logging.warning("[parser] header checksums by {}".format(algorithm))
+
+    table = [("ClassId", "ClassSize", "Headers", "Empty", "Markers",
+              "Unread", "BadChecksum", "BadClassId", "BadStride",
+              "BadState", "Corrupted")]
+    listed = [("", "class_size", "addr", "user_addr", "classid", "state",
+               "origin", "used_bytes", "offset", "check_sum", "expected",
+               "problems")]
+    totals = [0] * (len(table[0]) - 2)
+    for class_id, class_size, addrs, words, offsets, unread in regions:
+        expected = None
+        if cookie is not None:
+            expected = scudo_checksum.checksums(
+                cookie, user_addrs(addrs), words, algorithm, dword_size)
+        flags = scudo_checksum.problems(class_id, class_size, words, offsets,
+                                        expected, dword_size)
+        row = [len(words), len(words) - count_flags(words) - unread,
+               count_flags(offsets) + unread, unread] + \
+            [count_flags(flags, bit)
+             for bit, name in scudo_checksum.PROBLEMS] + \
+            [count_flags(flags)]
+        totals = [a + b for a, b in zip(totals, row)]
+        table.append([class_id, class_size or "secondary"] + row)
+
+        bad = [i for i, f in enumerate(flags) if f] if numpy is None \
+            else numpy.flatnonzero(flags).tolist()
+        bad = bad[:max(limit - totals[-1] + row[-1], 0)]
+        if not bad:
+            continue
+        # the bad chunks with the chunk before and after, when in a region
+        reach = 1 if class_size else 0
+        shown = sorted(set(j for i in bad for j in range(
+            max(i - reach, 0), min(i + reach + 1, len(words)))))
+        for k, j in enumerate(shown):
+            if k and j != shown[k - 1] + 1 or not k and len(listed) > 1:
+                listed.append(("--",))
+            addr = int(addrs[j])
+            header = parse_chunk_header_word(hex(addr), int(words[j]))
+            listed.append((
+                "*" if flags[j] else "", class_size or "secondary",
+                header.addr, hex(addr + header_size), header.class_id,
+                header.state, header.origi, header.used_bytes,
+                header.offset, header.check_sum,
+                hex(int(expected[j])) if expected is not None else "-",
+                scudo_checksum.problem_names(int(flags[j]))))
+    table.append(("--",))
+    table.append(["total", ""] + totals)
+    print(assemble_table(table))
+    if len(listed) > 1:
+        print(assemble_table(listed))
+    logging.error("{} headers checked, {} corrupted".format(
+        totals[0] - totals[1] - totals[3], totals[-1]))
+
+
 def dump_all_chunks(class_size):
     print("dump_all_chunks ", class_size)
     header_list = parse_allocated_chunks(class_size)
@@ -531,24 +864,13 @@ def parse_allocated_chunks(class_size):
     logging.info("class_size {} class_id {}".format(class_size, class_id))
 
     if class_id != -1 and class_id:
-        RegionBeg = int(scuheap.region_info_array[class_id].region_beg, 16)
         if scuheap.region_info_array[class_id].chunk_list:
             return scuheap.region_info_array[class_id].chunk_list
-        AllocatedUser = int(
-            scuheap.region_info_array[class_id].allocated_user, 16)
-        logging.debug("RegionBeg {} AllocatedUser {} ".format(
-            RegionBeg, AllocatedUser))
-        if AllocatedUser and RegionBeg:
-            addr = RegionBeg
-            mem = read_bytes(RegionBeg, AllocatedUser)
-            while addr < (RegionBeg + AllocatedUser):
-                logging.info("RegionBeg {} AllocatedUser {} addr {}".format(
-                    RegionBeg, AllocatedUser, addr))
-                header_mem = mem[addr-RegionBeg:addr-RegionBeg+8]
-                header = parse_chunk_header_mem(addr, header_mem)
-                scuheap.user_addr_map[addr] = header
-                addr = addr + class_size
-                header_list.append(header)
+        columns = region_columns(class_id)
+        if columns is not None:
+            header_list = columns.headers()
+            for header in header_list:
+                scuheap.user_addr_map[int(header.addr, 16)] = header
             scuheap.region_info_array[class_id].fill_chunk_list(header_list)
         else:
             logging.debug('{} is invalid'.format(class_size))
@@ -556,73 +878,294 @@ def parse_allocated_chunks(class_size):
     return header_list
 
 
+def region_columns(class_id):
+    """all chunk headers of a primary region as scudo_columns arrays"""
+    global scuheap
+    region_info = scuheap.region_info_array[class_id]
+    if region_info.columns is not None:
+        return region_info.columns
+    RegionBeg = int(region_info.region_beg, 16)
+    AllocatedUser = int(region_info.allocated_user, 16)
+    class_size = scuheap.perclass_array[class_id].class_size
+    logging.debug("RegionBeg {} AllocatedUser {} ".format(
+        RegionBeg, AllocatedUser))
+    if not (AllocatedUser and RegionBeg and class_size):
+        return None
+    columns, holes = scudo_columns.decode_region(
+        class_id, class_size, RegionBeg, AllocatedUser)
+    skipped = AllocatedUser // class_size - len(columns)
+    if skipped:
+        logging.warning("class_size {}: skipped {} unreadable "
+                        "chunks".format(class_size, skipped))
+    region_info.columns = columns
+    return columns
+
+
+def snapshot_columns():
+    """decode every region and read the first words of its chunks in use,
+    all a snapshot needs from memory"""
+    global scuheap
+    for class_id in range(1, scuheap.num_classes):
+        columns = region_columns(class_id)
+        if columns is not None:
+            region_first_words(columns)
+    headers = [h for pc in scuheap.perclass_array for h in pc.chunk_list
+               if h]
+    if scuheap.secondary:
+        headers.extend(item.large_block.chunk_header for item in
+                       scuheap.secondary.in_use_blocks_list +
+                       scuheap.secondary.cache_entry_list)
+    read_first_words(headers)
+
+
+def save_snapshot(path=None):
+    """save scuheap to path, by default to the snapshot of the core"""
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return
+    if numpy is None:
+        logging.error("snapshots need numpy")
+        return
+    key = None
+    if path is None:
+        core_path = gdb_common.memory_source.core_path()
+        if not core_path:
+            logging.error("no core file, give the snapshot a path")
+            return
+        key = scudo_snapshot.core_key(core_path)
+        path = os.path.join(scudo_snapshot.SNAPSHOT_DIR, key + ".npz")
+    try:
+        with profiler.phase("snapshot"):
+            snapshot_columns()
+            scudo_snapshot.save(scuheap, path, symbol_cache, key)
+    except (IOError, OSError) as e:
+        logging.error("cannot save snapshot {}: {}".format(path, e))
+        return
+    scuheap.snapshot_path = path
+    scuheap.snapshot_symbols = len(symbol_cache)
+    logging.warning("[parser] snapshot saved to {}".format(path))
+
+
+def load_snapshot(path):
+    """make the heap saved at path the current one"""
+    global scuheap, chunk_stat
+    if numpy is None:
+        logging.error("snapshots need numpy")
+        return False
+    start = time.time()
+    symbol_cache.clear()
+    try:
+        scuheap, meta = scudo_snapshot.load(path, symbol_cache)
+    except (IOError, OSError, ValueError, KeyError) as e:
+        logging.error("cannot load snapshot {}: {}".format(path, e))
+        scuheap = None
+        return False
+    chunk_stat = None
+    scuheap.chunk_index = scudo_index.build(scuheap)
+    scuheap.snapshot_path = path
+    scuheap.snapshot_symbols = len(symbol_cache)
+    if gdb_common.memory_source.has_memory:
+        scuheap.value_index = load_value_index()
+    logging.warning("[parser] snapshot {} loaded in {:.2f}s".format(
+        path, time.time() - start))
+    return True
+
+
+def snapshot_command(arg):
+    """scusnapshot [save|load] [path]: without a path, the snapshot of the
+    core being debugged"""
+    args = arg.split()
+    if not args or args[0] not in ("save", "load") or len(args) > 2:
+        logging.error("usage: scusnapshot save|load [path]")
+        return
+    path = args[1] if len(args) == 2 else None
+    if args[0] == "save":
+        save_snapshot(path)
+        return
+    if path is None:
+        core_path = gdb_common.memory_source.core_path()
+        if not core_path:
+            logging.error("no core file, give the snapshot path")
+            return
+        path = scudo_snapshot.snapshot_path(core_path)
+    load_snapshot(path)
+
+
+def older_snapshot(path):
+    """the snapshot at path, or the one saved for the core at path"""
+    if path.endswith(".npz"):
+        return path
+    snapshot = scudo_snapshot.snapshot_path(path)
+    if not os.path.isfile(snapshot):
+        logging.error("no snapshot of {}, parse it once first".format(path))
+        return None
+    return snapshot
+
+
+def heap_diff(arg):
+    """scudiff <snapshot|core> [symbol|size|origin] [top]: what changed
+    from the heap saved in the snapshot to the current one, by default
+    the top 20 groups of each kind"""
+    global scuheap
+    if not scuheap:
+        logging.error("pls run scuparse first")
+        return
+    if numpy is None:
+        logging.error("scudiff needs numpy")
+        return
+    args = arg.split()
+    groups = scudo_diff.GROUPS
+    top = 20
+    if args and args[-1].isdigit():
+        top = int(args.pop())
+    if len(args) == 2 and args[1] in scudo_diff.GROUPS:
+        groups = (args.pop(),)
+    if len(args) != 1:
+        logging.error("usage: scudiff <snapshot|core> "
+                      "[symbol|size|origin] [top]")
+        return
+    path = older_snapshot(args[0])
+    if path is None:
+        return
+    old_symbols = {}
+    try:
+        old_heap, meta = scudo_snapshot.load(path, old_symbols, layout=False)
+    except (IOError, OSError, ValueError, KeyError) as e:
+        logging.error("cannot load snapshot {}: {}".format(path, e))
+        return
+    with profiler.phase("diff"):
+        snapshot_columns()
+        old = scudo_diff.collect(old_heap, old_symbols)
+        new = scudo_diff.collect(scuheap, symbol_cache)
+        if "symbol" in groups:
+            # words the older heap never resolved, same binaries assumed
+            resolve_words(old.first_word.tolist(), old_symbols)
+            resolve_words(new.first_word.tolist())
+        diff = scudo_diff.HeapDiff(old, new)
+        for group in groups:
+            rows = diff.by(group)
+            logging.error("======================= heap diff by {} "
+                          "=======================".format(group))
+            table = [(group, "old", "new", "appeared", "appeared_bytes",
+                      "gone", "gone_bytes", "persisted", "delta_bytes")]
+            if not rows:
+                logging.error("no change")
+                continue
+            table.extend(rows[:top] if top else rows)
+            print(assemble_table(table))
+            if top and len(rows) > top:
+                logging.error("{} more groups changed".format(
+                    len(rows) - top))
+    totals = diff.totals()
+    logging.error("old {old} chunks {old_bytes} bytes, new {new} chunks "
+                  "{new_bytes} bytes: {appeared} appeared "
+                  "({appeared_bytes} bytes), {gone} gone ({gone_bytes} "
+                  "bytes), {persisted} persisted".format(**totals))
+
+
+def parse_cookie(scuheap):
+    try:
+        scuheap.cookie = symbol_int_value('Allocator.Cookie')
+    except Exception as e:
+        logging.warning("Allocator.Cookie: {}, header checksums cannot be "
+                        "verified".format(e))
+
+
 def parse_region_infos(scuheap):
     perclas_array_size = symbol_int_value('Allocator.Primary.NumClasses')
     region_size = symbol_int_value('Allocator.Primary.RegionSize')
     scuheap.set_region_size(region_size)
 
-    region_infos = []
     if arch_dword_size() == 8:
         region_info_str = 'Allocator.Primary.RegionInfoArray'
-        for i in range(perclas_array_size):
-            RegionBeg = hex(symbol_int_value(
-                '{}[{}].RegionBeg'.format(region_info_str, i)))
-            AllocatedUser = hex(symbol_int_value(
-                '{}[{}].AllocatedUser'.format(region_info_str, i)))
-            # if AllocatedUser != '0x0':
-            region_info = RegionInfo(
-                i, None, 0, RegionBeg, AllocatedUser, None, None, None)
-            region_infos.append(region_info)
-
+        region_beg_str = 'RegionBeg'
+        allocated_user_str = 'AllocatedUser'
     else:
         region_info_str = 'Allocator.Primary.SizeClassInfoArray'
-        for i in range(perclas_array_size):
-            RegionBeg = hex(symbol_int_value(
-                '{}[{}].CurrentRegion'.format(region_info_str, i)))
-            AllocatedUser = hex(symbol_int_value(
-                '{}[{}].CurrentRegionAllocated'.format(region_info_str, i)))
+        region_beg_str = 'CurrentRegion'
+        allocated_user_str = 'CurrentRegionAllocated'
 
-            # if AllocatedUser != '0x0':
-            region_info = RegionInfo(
-                i, None, 0, RegionBeg, AllocatedUser, None, None, None)
-            region_infos.append(region_info)
+    layout = struct_layout(type_name_of('{}[0]'.format(region_info_str)),
+                           [region_beg_str, allocated_user_str])
+    region_infos = []
+    for i, item in enumerate(layout.read_array(
+            symbol_address(region_info_str), perclas_array_size)):
+        # if AllocatedUser != '0x0':
+        region_info = RegionInfo(
+            i, None, 0, hex(item[region_beg_str]),
+            hex(item[allocated_user_str]), None, None, None)
+        region_infos.append(region_info)
 
     scuheap.fill_region_info(region_infos)
 
 
+def tsd_count(tsd_str, tsd_size):
+    """NumberOfTSDs of the shared registry, within the TSDs array"""
+    capacity = None
+    try:
+        capacity = type_size("({})".format(tsd_str)) // tsd_size or None
+    except Exception as e:
+        logging.debug("size of {}: {}".format(tsd_str, e))
+    try:
+        count = symbol_int_value('Allocator.TSDRegistry.NumberOfTSDs')
+    except Exception as e:
+        logging.debug("NumberOfTSDs: {}".format(e))
+        count = None
+    if not count or (capacity and count > capacity):
+        fallback = capacity or DEFAULT_TSD_COUNT
+        logging.warning("NumberOfTSDs {}, parsing {} TSDs".format(
+            count, fallback))
+        count = fallback
+    return count
+
+
 def parse_general_perclass(scuheap):
     perclas_array_size = symbol_int_value('Allocator.Primary.NumClasses')
     scuheap.set_num_classes(perclas_array_size)
     logging.info("info array_size {}".format(perclas_array_size))
-    thread_size = 8
-    tsd_info = []
-    # symbol dump
-
-    for ti in range(thread_size):
-        tsd_str = '&Allocator.TSDRegistry.TSDs[{}]'.format(ti)
-        tsd_addr = str(gdb.parse_and_eval(tsd_str)).split()[0]
-        tsd_info.append(tsd_addr)
-
-        for i in range(perclas_array_size):
-            perclass_str = 'Allocator.TSDRegistry.TSDs[{}]. \
-                Cache.PerClassArray[{}]'.format(ti, i)
-            count = symbol_int_value('{}.Count'.format(perclass_str))
-            max_count = symbol_int_value('{}.MaxCount'.format(perclass_str))
-            class_size = symbol_int_value('{}.ClassSize'.format(perclass_str))
-            chunk_str = '{}.Chunks'.format(perclass_str)
+
+    tsd_str = 'Allocator.TSDRegistry.TSDs'
+    tsd_type = type_name_of('{}[0]'.format(tsd_str))
+    tsd_base = symbol_address(tsd_str)
+    tsd_size = type_size(tsd_type)
+    thread_size = tsd_count(tsd_str, tsd_size)
+    perclass_offset = offset_of(tsd_type, 'Cache.PerClassArray')
+    layout = struct_layout(
+        type_name_of('{}[0].Cache.PerClassArray[0]'.format(tsd_str)),
+        ['Count', 'MaxCount', 'ClassSize', 'Chunks[]'])
+
+    # all TSDs in one read, their PerClass arrays decoded from it
+    tsd_mem = read_bytes(tsd_base, thread_size * tsd_size)
+    tsd_info = [hex(tsd_base + ti * tsd_size) for ti in range(thread_size)]
+    tsd_perclass_items = [
+        layout.unpack_array(tsd_mem, ti * tsd_size + perclass_offset,
+                            perclas_array_size)
+        for ti in range(thread_size)]
+    batch = ReadBatch()
+    for perclass_items in tsd_perclass_items:
+        for item in perclass_items:
+            for chunk_addr in item['Chunks'][:item['MaxCount']]:
+                if chunk_addr:
+                    batch.add(chunk_addr, CHUNK_HEADER_SIZE)
+    # the cached chunks are spread over the regions, fetch all headers
+    # before decoding them
+    batch.execute()
+
+    for ti, perclass_items in enumerate(tsd_perclass_items):
+        for i, item in enumerate(perclass_items):
+            max_count = item['MaxCount']
             chunk_list = []
-            chunk_valid = False
-            for ci in range(max_count):
-                chunk_addr = str(gdb.parse_and_eval(
-                    '{}[{}]'.format(chunk_str, ci))).split()[0]
-                if chunk_addr != '0x0':
-                    chunk_header = parse_chunk_header(chunk_addr)
+            for chunk_addr in item['Chunks'][:max_count]:
+                if chunk_addr:
+                    chunk_header = parse_chunk_header_mem(
+                        chunk_addr, batch.get(chunk_addr, CHUNK_HEADER_SIZE))
                     chunk_list.append(chunk_header)
                 else:
                     chunk_list.append(None)
-                perclass = PerClass(i, ti, count, max_count,
-                                    class_size, chunk_list)
             if max_count:
+                perclass = PerClass(i, ti, item['Count'], max_count,
+                                    item['ClassSize'], chunk_list)
                 scuheap.fill_perclass(perclass)
     scuheap.set_tsd_info(tsd_info)
 
@@ -687,83 +1230,105 @@ def parse_cache_entry():
     secondary_str = 'Allocator.Secondary'
     CacheEntiesSize = symbol_int_value(
         '{}.{}'.format(secondary_str, "Cache.EntriesCount"))
-    cache_str = '{}.{}'.format(secondary_str, "Cache")
+    entries_str = '{}.{}'.format(secondary_str, "Cache.Entries")
+    layout = struct_layout(type_name_of('{}[0]'.format(entries_str)),
+                           ['Block', 'BlockEnd', 'MapBase', 'MapSize'])
+    entries = layout.read_array(symbol_address(entries_str), CacheEntiesSize)
+    header_offset = large_block_header_offset()
+    batch = ReadBatch()
+    for entry in entries:
+        batch.add(entry['Block'] + header_offset, CHUNK_HEADER_SIZE)
+    batch.execute()
     cache_entry_list = []
-    for i in range(CacheEntiesSize):
-        CacheEntryBlock = symbol_int_value(
-            '{}.Entries[{}].Block'.format(cache_str, i))
-        CacheBlockEnd = symbol_int_value(
-            '{}.Entries[{}].BlockEnd'.format(cache_str, i))
-        CacheMapBase = symbol_int_value(
-            '{}.Entries[{}].MapBase'.format(cache_str, i))
-        CacheMapSize = symbol_int_value(
-            '{}.Entries[{}].MapSize'.format(cache_str, i))
-        cache_entry = SecondaryCacheEntry(hex(CacheEntryBlock), hex(
-            CacheBlockEnd), hex(CacheMapBase), hex(CacheMapSize))
+    for entry in entries:
+        header_mem = batch.get(entry['Block'] + header_offset,
+                               CHUNK_HEADER_SIZE)
+        cache_entry = SecondaryCacheEntry(hex(entry['Block']),
+                                          hex(entry['BlockEnd']),
+                                          hex(entry['MapBase']),
+                                          hex(entry['MapSize']),
+                                          header_mem)
         cache_entry_list.append(cache_entry)
         scuheap.user_addr_map[int(
             cache_entry.large_block.user_start_addr, 16)] = cache_entry
     return cache_entry_list
 
 
-def parse_secondary_in_used_blocks():
+def parse_secondary_in_used_blocks(max_blocks=None):
+    """follow InUseBlocks from First; a link back to a block seen before,
+    an unreadable block or more than max_blocks blocks end the walk"""
     secondary_str = 'Allocator.Secondary'
-    first = hex(symbol_int_value('{}.InUseBlocks.First'.format(secondary_str)))
-    last = hex(symbol_int_value('{}.InUseBlocks.Last'.format(secondary_str)))
+    first = symbol_int_value('{}.InUseBlocks.First'.format(secondary_str))
+    last = symbol_int_value('{}.InUseBlocks.Last'.format(secondary_str))
+    if max_blocks is None:
+        max_blocks = MAX_IN_USE_BLOCKS
     in_use_blocks_list = []
-    if first == '0x0':
-        return in_use_blocks_list
-    header = parse_large_header(first)
-    if header.large_block.block_end is not '0x0':
-        scuheap.user_addr_map[int(
-            header.large_block.user_start_addr, 16)] = header
-        in_use_blocks_list.append(header)
-    while int(header.l_next, 16):
-        logging.debug("header_next", header.l_next)
-        header = parse_large_header(header.l_next)
+    visited = set()
+    block_addr = first
+    while block_addr:
+        if block_addr in visited:
+            logging.warning("secondary in-use list loops back to {}".format(
+                hex(block_addr)))
+            break
+        if len(in_use_blocks_list) >= max_blocks:
+            logging.warning("secondary in-use list longer than {} blocks, "
+                            "stopped at {}".format(max_blocks,
+                                                   hex(block_addr)))
+            break
+        visited.add(block_addr)
+        try:
+            header = parse_large_header(block_addr)
+        except Exception as e:
+            logging.warning("secondary in-use block {} unreadable: {}".format(
+                hex(block_addr), e))
+            break
         scuheap.user_addr_map[int(
             header.large_block.user_start_addr, 16)] = header
         in_use_blocks_list.append(header)
+        block_addr = int(header.l_next, 16)
+    else:
+        if in_use_blocks_list and \
+                int(in_use_blocks_list[-1].block_addr, 16) != last:
+            logging.warning("secondary in-use list ends at {}, Last is "
+                            "{}".format(in_use_blocks_list[-1].block_addr,
+                                        hex(last)))
     return in_use_blocks_list
 
 
 def parse_large_header(header_addr):
+    """in-use block at header_addr, its links and its chunk header come
+    from one read"""
+    addr = to_addr(header_addr)
     dword_size = arch_dword_size()
-    logging.info("parse_large_header word_size: {}".format(dword_size))
-    l_prev = read_addr_bytes_hex(header_addr, dword_size)
-    l_next = read_addr_bytes_hex(hexadd(header_addr, dword_size), dword_size)
-    block_end = read_addr_bytes_hex(
-        hexadd(header_addr, dword_size*2), dword_size)
-    map_base = read_addr_bytes_hex(
-        hexadd(header_addr, dword_size*3), dword_size)
-    map_size = read_addr_bytes_hex(
-        hexadd(header_addr, dword_size*4), dword_size)
-    return SecondaryInUseBlocksPtr(header_addr, l_prev, l_next,
-                                   block_end, map_base, map_size)
+    header_offset = large_block_header_offset()
+    mem = read_bytes(addr, header_offset + CHUNK_HEADER_SIZE)
+    l_prev, l_next, block_end, map_base, map_size = [
+        hex(word) for word in unpack_words(mem, dword_size, 5)]
+    return SecondaryInUseBlocksPtr(hex(addr), l_prev, l_next,
+                                   block_end, map_base, map_size,
+                                   mem[header_offset:])
 
 
 def parse_secondary(scuheap):
     secondary_str = 'Allocator.Secondary'
-    AllocatedBytes = '{}.{}'.format(secondary_str, "AllocatedBytes")
-    FreedBytes = '{}.{}'.format(secondary_str, "FreedBytes")
-    LargestSize = '{}.{}'.format(secondary_str, "LargestSize")
-    NumberOfAllocs = '{}.{}'.format(secondary_str, "NumberOfAllocs")
-    NumberOfFrees = '{}.{}'.format(secondary_str, "NumberOfFrees")
-    MaxEntrySize = '{}.{}'.format(
-        secondary_str, "Cache.MaxEntrySize.ValDoNotUse")
-    MaxEntiesCount = '{}.{}'.format(
-        secondary_str, "Cache.MaxEntriesCount.ValDoNotUse")
+    MaxEntrySize = "Cache.MaxEntrySize.ValDoNotUse"
+    MaxEntiesCount = "Cache.MaxEntriesCount.ValDoNotUse"
+    layout = struct_layout(type_name_of(secondary_str),
+                           ["AllocatedBytes", "FreedBytes", "LargestSize",
+                            "NumberOfAllocs", "NumberOfFrees",
+                            MaxEntrySize, MaxEntiesCount])
+    stats = layout.read(symbol_address(secondary_str))
     cache_entry_list = parse_cache_entry()
     in_use_blocks_list = parse_secondary_in_used_blocks()
 
     secondary = Secondary(cache_entry_list, in_use_blocks_list,
-                          symbol_int_value(AllocatedBytes),
-                          symbol_int_value(FreedBytes),
-                          symbol_int_value(LargestSize),
-                          symbol_int_value(NumberOfAllocs),
-                          symbol_int_value(NumberOfFrees),
-                          symbol_int_value(MaxEntrySize),
-                          symbol_int_value(MaxEntiesCount))
+                          stats["AllocatedBytes"],
+                          stats["FreedBytes"],
+                          stats["LargestSize"],
+                          stats["NumberOfAllocs"],
+                          stats["NumberOfFrees"],
+                          stats[MaxEntrySize],
+                          stats[MaxEntiesCount])
     scuheap.fill_secondary(secondary)
 
 
@@ -782,100 +1347,166 @@ def read_addr_half_byte_h(addr):
 
 
 def read_addr_bytes_hex(addr, size):
-    symbol_addr_byte_hex = read_addr_bytes(addr, size)
-    return hex(int(symbol_addr_byte_hex, 16))
+    return hex(read_memory(to_addr(addr), size))
 
 
 def read_addr_bytes(addr, size):
-    symbol_addr_var_str = None
-    raw_out = gdb.execute('x/{}xb {}'.format(size, addr), to_string=True)
-    for line in raw_out.split('\n'):
-        if not line:
-            continue
-        one_line = line.split('\t')
-        symbol_addr_byte_hex = "".join(
-            [i.replace('0x', '') for i in one_line[-1:0:-1]])
-
-    return symbol_addr_byte_hex
+    return "{:0{}x}".format(read_memory(to_addr(addr), size), size * 2)
 
 
 def read_proc_mappings():
-    raw_out = gdb.execute('i proc mappings', to_string=True)
+    raw_out = gdb_execute('i proc mappings')
     gdb_elf.parse_elf(raw_out)
 
 
-def parse_symbol(addr):
+def raw_symbol(addr):
+    """mangled name of the symbol holding addr, None if none is known"""
+    resolver = symbolizer.get_symbolizer()
+    if resolver.modules:
+        sym = resolver.lookup(to_addr(addr))
+        if sym:
+            return sym[0]
+    if gdb is None:
+        return None
+    return gdb_symbol(addr)
+
+
+def gdb_symbol(addr):
+    """symbol gdb prints for addr, for the modules not under symbols/"""
     try:
-        gdb_out = gdb.execute('x {}'.format(addr), to_string=True)
+        gdb_out = gdb_execute('x {}'.format(addr))
         line_list = gdb_out.split()
         if line_list[1].startswith('<'):
             symbol = line_list[1].lstrip('<').rstrip('>:')
             ln = symbol.find('+')
-            lino = 0
             if ln != -1:
-                sym = symbol[:ln]
-                lino = symbol[ln+1:]
-            cmd = ['c++filt', sym]
-            return gdb_elf.RunAndCheckOutput(cmd, verbose=False) \
-                .rstrip("\n").strip()
+                symbol = symbol[:ln]
+            return symbol
     except Exception as e:
         return None
 
 
-def hexadd(addr, offset):
-    return hex(int(addr, 16) + offset)
+def parse_symbol(addr):
+    symbol = raw_symbol(addr)
+    if symbol is None:
+        return None
+    return demangle.demangle(symbol)
+
+
+# first word of a chunk (mostly a vtable pointer) -> symbol_info
+symbol_cache = {}
+# scustat counters of the current heap, a scudo_stat.ChunkStat
+chunk_stat = None
+
+
+def symbol_of(word):
+    if word not in symbol_cache:
+        symbol_cache[word] = parse_symbol(hex(word))
+    return symbol_cache[word]
+
+
+def read_first_words(headers):
+    """read the missing first words of the headers in use in one go"""
+    batch = ReadBatch()
+    dword_size = arch_dword_size()
+    for header in headers:
+        if header.first_word is None and header.in_use():
+            batch.add(int(header.user_addr, 16), dword_size)
+    if batch.requests:
+        batch.execute()
+        for header in headers:
+            if header.first_word is None and header.in_use():
+                try:
+                    header.first_word = dword_in_buf(batch.get(
+                        int(header.user_addr, 16), dword_size))
+                except Exception as e:
+                    continue
 
 
-def parse_chunk_header_from_list(raw_out, addr, use_size=None):
-    class_id = int(utils.read_addr_byte(raw_out, 0), 16)
-    state_origi = int(utils.read_addr_half_byte_l(raw_out, 1), 16)
-    state = None
-    origi = None
+def resolve_symbols(headers):
+    """fill symbol_cache for the first words of headers in one go"""
+    read_first_words(headers)
+    resolve_words(header.first_word for header in headers
+                  if header.first_word is not None and header.in_use())
+
+
+def raw_symbols(words):
+    """{word: mangled symbol or None} for sorted words"""
+    resolver = symbolizer.get_symbolizer()
+    if not resolver.modules:
+        return dict((word, raw_symbol(hex(word))) for word in words)
+    raw = {}
+    for word, sym in zip(words, resolver.lookup_many(words)):
+        if sym:
+            raw[word] = sym[0]
+        elif gdb is not None:
+            raw[word] = gdb_symbol(hex(word))
+        else:
+            raw[word] = None
+    return raw
+
+
+def add_symbols(raw, cache=None):
+    """demangle the symbols of raw_symbols() into cache, by default
+    symbol_cache"""
+    if cache is None:
+        cache = symbol_cache
+    names = demangle.demangle_all(sym for sym in raw.values() if sym)
+    for word, sym in raw.items():
+        cache[word] = names.get(sym) if sym else None
+    logging.info("resolved {} distinct first words".format(len(raw)))
+    demangle.save_cache()
+
+
+def resolve_words(words, cache=None):
+    """fill cache, by default symbol_cache, for words in one go"""
+    if cache is None:
+        cache = symbol_cache
+    words = set(words)
+    words.difference_update(cache)
+    if not words:
+        return
+    add_symbols(raw_symbols(sorted(words)), cache)
 
-    if (state_origi & (1 << 2)) == 0:
-        origi = ORIGI_DICT[ORIGIN_MALLOC]
 
-    if (state_origi >> 2) == 0:
-        state = STATE_DICT[STATE_AVAILABLE]
+def hexadd(addr, offset):
+    return hex(int(addr, 16) + offset)
+
 
-    for k, v in ORIGI_DICT.items():
-        if state_origi & k:
-            origi = v
+def to_addr(addr):
+    if isinstance(addr, str):
+        return int(addr, 16)
+    return addr
 
-    for k, v in STATE_DICT.items():
-        if state_origi & k:
-            state = v
 
-    size_or_unused_bytes_low = utils.read_addr_half_byte_h(raw_out, 1)
-    size_or_unused_bytes_high = utils.read_addr_bytes(raw_out, 2, 2)
-    size_or_unused_bytes = int(
-        size_or_unused_bytes_low, 16) + int(size_or_unused_bytes_high, 16)*16
+def parse_chunk_header_word(addr, header, use_size=None, first_word=None):
+    class_id = header & CLASS_ID_MASK
+    state_origi = header >> STATE_ORIGIN_SHIFT
+    state = STATE_DICT.get(state_origi & STATE_MASK)
+    origi = ORIGI_DICT[state_origi & ORIGIN_MASK]
+
+    size_or_unused_bytes = \
+        (header >> SIZE_OR_UNUSED_SHIFT) & SIZE_OR_UNUSED_MASK
     if use_size:
         used_bytes = use_size - size_or_unused_bytes
     else:
         used_bytes = size_or_unused_bytes
 
-    offset = utils.read_addr_bytes_hex(raw_out, 4, 2)
-    check_sum = utils.read_addr_bytes_hex(raw_out, 6, 2)
+    offset = hex((header >> OFFSET_SHIFT) & OFFSET_MASK)
+    check_sum = hex((header >> CHECKSUM_SHIFT) & CHECKSUM_MASK)
 
     return ChunkHeader(class_id, addr, state, origi,
-                       used_bytes, offset, check_sum)
+                       used_bytes, offset, check_sum, first_word, header)
 
 
 def parse_chunk_header_mem(addr, header_mem, use_size=None):
-    raw_out = [hex(i)[2:] if len(hex(i)) > 3 else "0"+hex(i)[2:]
-               for i in list(header_mem)]
-    return parse_chunk_header_from_list(raw_out, hex(addr), use_size)
+    header = bytes2num(header_mem, CHUNK_HEADER_SIZE)
+    return parse_chunk_header_word(hex(addr), header, use_size)
 
 
 def parse_chunk_header(addr, use_size=None):
-    raw_out = gdb.execute('x/8xb {}'.format(addr), to_string=True)
-    raw_out = [bt[2:] for bt in raw_out.split(":")[1].strip().split()]
-    raw_zero_padding = ['00', '00', '00', '00', '00', '00', '00', '00']
-    if len(raw_out) < 8:
-        raw_out = raw_zero_padding
-
-    return parse_chunk_header_from_list(raw_out, addr, use_size)
+    header_mem = read_bytes(to_addr(addr), CHUNK_HEADER_SIZE)
+    return parse_chunk_header_mem(to_addr(addr), header_mem, use_size)
 
 
 def dump_classid(classid):
@@ -890,164 +1521,187 @@ def dump_classid(classid):
         logging.error("invalid classid {}".format(classid))
 
 
-def dump_hit_stat(sub_arg=None):
-    global d_used_hit_list
+def dump_stat_group(group, sub_arg, detail_max, sep):
+    samples = group.samples(detail_max)
+    if sub_arg == "d":
+        logging.error(group.summary())
+        table = [("class_id", "state", "origi",
+                  "size_or_used_bytes", "addr",
+                  "user_addr_start", "check_sum",
+                  "symbol_addr", "symbol_info")]
+        for header in samples:
+            table.append((header.class_id, header.state, header.origi,
+                          header.used_bytes, header.addr, header.user_addr,
+                          header.check_sum, header.symbol_addr,
+                          header.symbol_info))
+        print(assemble_table(table))
+    else:
+        for header in samples:
+            print("{}".format(header.user_addr), end=sep)
+        print()
+    if group.count > len(samples):
+        logging.error("... {} more, the {} largest are listed".format(
+            group.count - len(samples), len(samples)))
+
+
+def dump_hit_stat(sub_arg=None, detail_max=scudo_stat.DETAIL_MAX):
     logging.error(
         "========================== hit statistics =========================")
-    for it in d_used_hit_list:
-        logging.error("{} hit {}".format(it[0], len(it[1])))
-        if sub_arg == "d":
-            table = [("class_id", "state", "origi",
-                      "size_or_used_bytes", "addr",
-                      "user_addr_start", "check_sum",
-                      "symbol_addr", "symbol_info")]
-            for header in it[1]:
-                table.append((header.class_id, header.state, header.origi,
-                              header.used_bytes, header.addr, header.user_addr,
-                              header.check_sum, header.symbol_addr,
-                              header.symbol_info))
-            print(assemble_table(table))
-        else:
-            for header in it[1]:
-                print("{}".format(header.user_addr), end=' ')
-            print()
+    for group in chunk_stat.by_hits():
+        logging.error("{} hit {}".format(group.name, group.count))
+        dump_stat_group(group, sub_arg, detail_max, ' ')
 
 
-def dump_size_stat(sub_arg=None):
-    global d_used_size_list
+def dump_size_stat(sub_arg=None, detail_max=scudo_stat.DETAIL_MAX):
     logging.error(
         "===================== total used bytes statis===================")
-    for it in d_used_size_list:
+    for group in chunk_stat.by_size():
         logging.error("{} total used_bytes {}".format(
-            it[0], it[1][0].used_bytes * len(it[1])))
-        if sub_arg == "d":
-            table = [("class_id", "state", "origi",
-                      "size_or_used_bytes", "addr",
-                      "user_addr_start", "check_sum",
-                      "symbol_addr", "symbol_info")]
-            for header in it[1]:
-                table.append((header.class_id, header.state,
-                              header.origi, header.used_bytes,
-                              header.addr, header.user_addr,
-                              header.check_sum, header.symbol_addr,
-                              header.symbol_info))
-            print(assemble_table(table))
-        else:
-            for header in it[1]:
-                print("{}".format(header.user_addr), end='  ')
-            print()
+            group.name, group.used_bytes))
+        dump_stat_group(group, sub_arg, detail_max, '  ')
 
 
 def dump_all_chunk_hit_stat(arg):
-    global d_used
-    collect_all_chunk_header()
-    if arg:
-        cmd_list = arg.split()
-        sub_arg = cmd_list[1] if len(cmd_list) == 2 else None
-        if cmd_list[0] == "h":
-            dump_hit_stat(sub_arg)
-        elif cmd_list[0] == "s":
-            dump_size_stat(sub_arg)
+    """scustat [h|s] [d] [N]: N chunks listed per symbol, 0 for all"""
+    args = arg.split() if arg else []
+    detail_max = scudo_stat.DETAIL_MAX
+    if args and args[-1].isdigit():
+        detail_max = int(args.pop()) or None
+    with profiler.phase("stat"):
+        if not collect_all_chunk_header(detail_max):
+            return
+    sub_arg = args[1] if len(args) == 2 else None
+    if not args:
+        dump_hit_stat(None, detail_max)
+        dump_size_stat(None, detail_max)
+    elif args[0] == "h":
+        dump_hit_stat(sub_arg, detail_max)
+    elif args[0] == "s":
+        dump_size_stat(sub_arg, detail_max)
+
+
+def decode_regions(jobs):
+    """decode the regions not decoded yet in jobs processes, 0 for one
+    per cpu; offline cores only"""
+    global scuheap
+    core_path = gdb_common.memory_source.core_path()
+    if gdb is not None or not core_path:
+        logging.warning("parallel decoding needs a core opened offline")
+        return
+    jobs = jobs or multiprocessing.cpu_count()
+    regions = []
+    for class_id in range(1, scuheap.num_classes):
+        region_info = scuheap.region_info_array[class_id]
+        class_size = scuheap.perclass_array[class_id].class_size
+        region_beg = int(region_info.region_beg, 16)
+        allocated_user = int(region_info.allocated_user, 16)
+        if region_info.columns is None and \
+                region_beg and allocated_user and class_size:
+            regions.append((class_id, class_size, region_beg,
+                            allocated_user))
+    start = time.time()
+    decoded, raw, workers = scudo_parallel.decode_regions(
+        regions, jobs, core_path)
+    for class_id, (columns, skipped) in sorted(decoded.items()):
+        if skipped:
+            logging.warning("class_size {}: skipped {} unreadable "
+                            "chunks".format(columns.class_size, skipped))
+        scuheap.region_info_array[class_id].columns = columns
+    add_symbols(dict((word, sym) for word, sym in raw.items()
+                     if word not in symbol_cache))
+    wall = time.time() - start
+    table = [("worker", "tasks", "chunks") +
+             tuple(phase + "_s" for phase in scudo_parallel.PHASES) +
+             ("busy_s",)]
+    for worker in workers:
+        table.append((worker.pid, worker.tasks, worker.chunks) +
+                     tuple("{:.2f}".format(s) for s in worker.seconds) +
+                     ("{:.2f}".format(sum(worker.seconds)),))
+    if workers:
+        print(assemble_table(table))
+    logging.warning("[parser] {} regions decoded by {} workers in "
+                    "{:.2f}s".format(len(regions), len(workers), wall))
+
+
+def region_first_words(columns):
+    """first words of all chunks of a region, 0 where unknown; those of
+    the chunks in use that decoding did not get are read"""
+    if columns.first_word is not None:
+        return columns.first_word
+    in_use = columns.in_use()
+    headers = columns.headers(in_use)
+    read_first_words(headers)
+    if numpy is None:
+        first_word = [0] * len(columns)
+        for i, header in zip(in_use, headers):
+            first_word[i] = header.first_word or 0
     else:
-        dump_hit_stat()
-        dump_size_stat()
+        first_word = numpy.zeros(len(columns), dtype=numpy.uint64)
+        first_word[in_use] = [h.first_word or 0 for h in headers]
+    columns.first_word = first_word
+    return first_word
 
 
-def collect_all_chunk_header():
-    global scuheap
-    global d_used, d_used_size_list, d_used_hit_list
+def collect_all_chunk_header(detail_max=scudo_stat.DETAIL_MAX):
+    """fill chunk_stat a region at a time, keeping detail_max chunks per
+    symbol (None for all); False before scuparse"""
+    global scuheap, chunk_stat
     if not scuheap:
         logging.error("pls run scuparse first")
-        return
+        return False
     print_timestamp()
-    if d_used:
-        return
-    d_used = defaultdict(list)
-    logging.warning("secondary used...")
-    for use_block_item in scuheap.secondary.in_use_blocks_list:
-        use_block = use_block_item.large_block
-        table = [("Prev", "Next", "BlockEnd", "MapBase",
-                  "MapSize", "state", "origi",
-                  "used_bytes", "user_addr_start",
-                  "check_sum", "symbol_addr", "symbol_info")]
-        table.append((use_block_item.l_prev,
-                      use_block_item.l_next,
-                      use_block.block_end,
-                      use_block.map_base,
-                      use_block.map_size,
-                      use_block.chunk_header.state,
-                      use_block.chunk_header.origi,
-                      use_block.chunk_header.used_bytes,
-                      use_block.chunk_header.user_addr,
-                      use_block.chunk_header.check_sum,
-                      use_block.chunk_header.symbol_addr,
-                      use_block.chunk_header.symbol_info))
-        # print(assemble_table(table))
-        if use_block.chunk_header.state == "Allocated" or \
-                use_block.chunk_header.state == "Quarantined":
-            if use_block.chunk_header.symbol_info:
-                d_used[use_block.chunk_header.symbol_info].append(
-                    use_block.chunk_header)
+    if chunk_stat and (chunk_stat.detail_max is None or
+                       detail_max is not None and
+                       chunk_stat.detail_max >= detail_max):
+        return True
+    secondary = [item.large_block.chunk_header
+                 for item in scuheap.secondary.in_use_blocks_list +
+                 scuheap.secondary.cache_entry_list]
+    read_first_words(secondary)
+    # resolve the distinct first words of all chunks in use at once
+    words = set(header.first_word for header in secondary
+                if header.first_word is not None and header.in_use())
+    regions = []
+    for index in range(1, scuheap.num_classes):
+        columns = region_columns(index)
+        if columns is None:
+            continue
+        in_use = columns.in_use()
+        first_word = region_first_words(columns)
+        if numpy is None:
+            words.update(first_word[i] for i in in_use)
+        else:
+            words.update(numpy.unique(first_word[in_use]).tolist())
+        regions.append((columns, in_use))
+    words.discard(0)
+    resolve_words(words)
 
+    stat = scudo_stat.ChunkStat(detail_max)
+    logging.warning("secondary used...")
     logging.warning("secondary cache...")
-    for cache_entry_item in scuheap.secondary.cache_entry_list:
-        cache_entry = cache_entry_item.large_block
-        table = [("BlockAddr", "BlockEnd", "MapBase", "MapSize",
-                  "state", "origi",
-                  "used_bytes", "user_addr_start",
-                  "check_sum", "symbol_addr", "symbol_info")]
-        table.append((cache_entry.block_addr, cache_entry.block_end,
-                      cache_entry.map_base,
-                      cache_entry.map_size,
-                      cache_entry.chunk_header.state,
-                      cache_entry.chunk_header.origi,
-                      cache_entry.chunk_header.used_bytes,
-                      cache_entry.chunk_header.user_addr,
-                      cache_entry.chunk_header.check_sum,
-                      cache_entry.chunk_header.symbol_addr,
-                      cache_entry.chunk_header.symbol_info))
-        # print(assemble_table(table))
-        if cache_entry.chunk_header.state == "Allocated" or \
-                cache_entry.chunk_header.state == "Quarantined":
-            if cache_entry.chunk_header.symbol_info:
-                d_used[cache_entry.chunk_header.symbol_info].append(
-                    cache_entry.chunk_header)
-
+    for header in secondary:
+        name = header.symbol_info if header.in_use() else None
+        if name:
+            stat.add(name, header.used_bytes, 0,
+                     (header.word >> STATE_ORIGIN_SHIFT) & ORIGIN_MASK,
+                     int(header.user_addr, 16), lambda h=header: h)
     logging.warning("primary RegionInfo mapped user...")
-    perclas_array_size = symbol_int_value('Allocator.Primary.NumClasses')
-    for index in range(1, perclas_array_size):
-        class_size = scuheap.perclass_array[index].class_size
-        header_list = parse_allocated_chunks(class_size)
-        for header_index, header in enumerate(header_list):
-            table = [("index", "chunk_addr", "class_size",
-                      "class_id", "state", "origi",
-                      "used_bytes", "user_addr_start",
-                      "check_sum", "symbol_addr", "symbol_info")]
-            table.append((header_index, header.addr, class_size,
-                          header.class_id, header.state, header.origi,
-                          header.used_bytes,
-                          header.user_addr,
-                          header.check_sum,
-                          header.symbol_addr,
-                          header.symbol_info))
-            # print(assemble_table(table))
-            if header.state == "Allocated" or header.state == "Quarantined":
-                if header.symbol_info:
-                    d_used[header.symbol_info].append(header)
+    for columns, in_use in regions:
+        stat.add_region(columns, in_use, symbol_cache)
+    chunk_stat = stat
 
     print_timestamp()
-    d_used_hit_list = sorted(d_used.items(), lambda x,
-                             y: cmp(len(x[1]), len(y[1])), reverse=True)
-    d_used_size_list = sorted(d_used.items(),
-                              lambda x, y:
-                              cmp(len(x[1]) * x[1][0].used_bytes,
-                                  len(y[1]) * y[1][0].used_bytes),
-                              reverse=True)
+    if scuheap.snapshot_path and \
+            scuheap.snapshot_symbols != len(symbol_cache):
+        # keep the symbols just resolved with the snapshot
+        save_snapshot(scuheap.snapshot_path)
+    return True
 
 
 def parse_tls(scuheap):
-    elm_addr = convert2int(get_value("g_thread_list"))
-    if elm_addr == 0:
+    elm_addr = symbol_int_value("g_thread_list")
+    if elm_addr == 0 and gdb is not None:
+        import bss_search
         elm_addr = bss_search.get_g_thread_list()
     tid_infos = {}
     word_size = arch_dword_size()
@@ -1083,9 +1737,11 @@ def parse_tls(scuheap):
 # parse functions
 
 
-def parse():
-    global d_used, d_used_size_list, d_used_hit_list
-    d_used = None
+def parse(jobs=1):
+    """parse the heap; jobs other than 1 decodes the regions of an offline
+    core in that many processes right away, 0 for one per cpu"""
+    global chunk_stat
+    chunk_stat = None
     try:
         global scuheap
         logging.warning('[parser] parsing structures from memory...')
@@ -1093,12 +1749,36 @@ def parse():
     except Exception as e:
         traceback.print_exc()
 
+    reset_page_cache_stats()
+    symbol_cache.clear()
+    symbolizer.reset()
+    load_layout_cache()
     scuheap = ScuMalloc()
-    parse_general_perclass(scuheap)
-    parse_secondary(scuheap)
-    parse_region_infos(scuheap)
-    parse_tls(scuheap)
+    parse_cookie(scuheap)
+    with profiler.phase("perclass"):
+        parse_general_perclass(scuheap)
+    with profiler.phase("secondary"):
+        parse_secondary(scuheap)
+    with profiler.phase("region_info"):
+        parse_region_infos(scuheap)
+    with profiler.phase("tls"):
+        parse_tls(scuheap)
+    with profiler.phase("chunk_index"):
+        scuheap.chunk_index = scudo_index.build(scuheap)
+    scuheap.value_index = load_value_index()
+    if jobs != 1:
+        with profiler.phase("decode_regions"):
+            decode_regions(jobs)
+    # gdb never loads it back, and saving would decode every region now
+    if gdb is None and numpy is not None and \
+            gdb_common.memory_source.core_path():
+        save_snapshot()
+    save_layout_cache()
+    demangle.save_cache()
     logging.warning('[parser] structures parsed')
+    cache_info = page_cache_info()
+    logging.warning('[parser] page cache hits {} misses {} pages {}'.format(
+        cache_info["hits"], cache_info["misses"], cache_info["pages"]))
     print_timestamp()
 
 
@@ -0,0 +1,229 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# A parsed heap as one .npz of columns: the chunk headers of every region
+# as packed words next to their addresses and first user words, the TSD
+# caches and secondary blocks as small tables, the resolved symbols and
+# the layout. Loading rebuilds the ScuMalloc from the arrays without
+# touching target memory, so the scu commands run from the snapshot alone.
+
+import os
+import json
+import struct
+import hashlib
+import gdb_common
+import scudo_columns
+import scudo_parser
+from scudo_class import *
+from gdb_common import numpy
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_DIR = os.path.join(gdb_common.LAYOUT_CACHE_DIR, "snapshots")
+# bytes hashed at each end of a core, headers and notes are at the start
+KEY_BYTES = 1 << 20
+
+
+def core_key(core_path):
+    """hash of the size, head and tail of a core, cheap even for GBs"""
+    h = hashlib.sha1()
+    size = os.path.getsize(core_path)
+    h.update(str(size).encode())
+    with open(core_path, "rb") as f:
+        h.update(f.read(KEY_BYTES))
+        if size > KEY_BYTES:
+            f.seek(max(size - KEY_BYTES, KEY_BYTES))
+            h.update(f.read(KEY_BYTES))
+    return h.hexdigest()
+
+
+def snapshot_path(core_path):
+    return os.path.join(SNAPSHOT_DIR, core_key(core_path) + ".npz")
+
+
+def u64(values):
+    return numpy.array(values, dtype=numpy.uint64)
+
+
+def hex_u64(values):
+    return u64([int(v, 16) for v in values])
+
+
+def header_columns(headers):
+    """word and first word of ChunkHeaders, 0 for an unknown first word"""
+    return (u64([h.word for h in headers]),
+            u64([h.first_word or 0 for h in headers]))
+
+
+def save(scuheap, path, symbol_cache, core_key=None):
+    """write scuheap to path; its regions must be decoded already"""
+    secondary = scuheap.secondary
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "core_key": core_key,
+        "num_classes": scuheap.num_classes,
+        "region_size": scuheap.region_size,
+        "tsdinfo": scuheap.tsdinfo,
+        "cookie": scuheap.cookie,
+        "tid_infos": [(t.tid, t.tsd_addr, t.tsd_ind)
+                      for t in scuheap.tid_infos],
+        "secondary": [secondary.allocated_bytes, secondary.free_bytes,
+                      secondary.largest_size, secondary.number_of_allocs,
+                      secondary.number_of_frees, secondary.max_entry_size,
+                      secondary.max_entries_count],
+        "layout": gdb_common.collect_layout(),
+    }
+    arrays = {"meta": numpy.array(json.dumps(meta))}
+
+    regions = scuheap.region_info_array
+    arrays["region_beg"] = hex_u64(r.region_beg for r in regions)
+    arrays["region_allocated"] = hex_u64(r.allocated_user for r in regions)
+    columns = [r.columns for r in regions]
+    arrays["region_chunks"] = u64([len(c) if c is not None else 0
+                                   for c in columns])
+    columns = [c for c in columns if c is not None]
+    for name, attr in (("chunk_addr", "addr"), ("chunk_word", "words"),
+                       ("chunk_first", "first_word")):
+        arrays[name] = numpy.concatenate(
+            [u64(getattr(c, attr)) for c in columns] + [u64([])])
+
+    perclass = scuheap.perclass_array
+    arrays["pc"] = u64([(pc.class_id, pc.tid, pc.count, pc.max_count,
+                         pc.class_size, len(pc.chunk_list))
+                        for pc in perclass]).reshape(-1, 6)
+    cached = [(i, slot, h) for i, pc in enumerate(perclass)
+              for slot, h in enumerate(pc.chunk_list) if h]
+    arrays["pc_chunk"] = u64([(i, slot, int(h.addr, 16))
+                              for i, slot, h in cached]).reshape(-1, 3)
+    arrays["pc_word"], arrays["pc_first"] = \
+        header_columns([h for _, _, h in cached])
+
+    for name, items, fields in (
+            ("in_use", secondary.in_use_blocks_list,
+             lambda item: (item.block_addr, item.l_prev, item.l_next,
+                           item.large_block.block_end,
+                           item.large_block.map_base,
+                           item.large_block.map_size)),
+            ("cache", secondary.cache_entry_list,
+             lambda item: (item.large_block.block_addr,
+                           item.large_block.block_end,
+                           item.large_block.map_base,
+                           item.large_block.map_size))):
+        arrays[name] = u64([[int(v, 16) for v in fields(item)]
+                            for item in items]).reshape(len(items), -1)
+        arrays[name + "_word"], arrays[name + "_first"] = header_columns(
+            [item.large_block.chunk_header for item in items])
+
+    words = sorted(symbol_cache)
+    arrays["sym_word"] = u64(words)
+    # no symbol is stored as an empty name
+    arrays["sym_name"] = numpy.array([symbol_cache[w] or "" for w in words],
+                                     dtype=str)
+
+    if not os.path.isdir(os.path.dirname(path) or "."):
+        os.makedirs(os.path.dirname(path))
+    with open(path + ".tmp", "wb") as f:
+        numpy.savez(f, **arrays)
+    os.rename(path + ".tmp", path)
+
+
+def header_mem(word):
+    return struct.pack(gdb_common.struct_prefix() + "Q", int(word)) + \
+        b"\0" * (scudo_parser.CHUNK_HEADER_SIZE - 8)
+
+
+def with_first_word(header, first_word):
+    # only the first words of chunks in use are read, 0 is one that was not
+    header.first_word = None
+    if header.in_use():
+        header.first_word = scudo_columns.known_word(first_word)
+    return header
+
+
+def load(path, symbol_cache, layout=True):
+    """ScuMalloc saved at path, filling symbol_cache and, unless layout is
+    False, the layout"""
+    with numpy.load(path) as data:
+        arrays = dict((k, data[k]) for k in data.files)
+    meta = json.loads(str(arrays["meta"]))
+    if meta["version"] != SNAPSHOT_VERSION:
+        raise ValueError("snapshot version {}, expected {}".format(
+            meta["version"], SNAPSHOT_VERSION))
+    if layout:
+        gdb_common.apply_layout(meta["layout"])
+
+    scuheap = ScuMalloc()
+    scuheap.set_num_classes(meta["num_classes"])
+    scuheap.set_region_size(meta["region_size"])
+    scuheap.set_tsd_info(meta["tsdinfo"])
+    scuheap.cookie = meta["cookie"]
+    scuheap.set_tid_infos([TidInfo(*t) for t in meta["tid_infos"]])
+
+    pc_words = arrays["pc_word"].tolist()
+    pc_firsts = arrays["pc_first"].tolist()
+    chunk_lists = []
+    for class_id, tid, count, max_count, class_size, length in \
+            arrays["pc"].tolist():
+        chunk_lists.append([None] * length)
+        scuheap.fill_perclass(PerClass(class_id, tid, count, max_count,
+                                       class_size, chunk_lists[-1]))
+    for k, (i, slot, addr) in enumerate(arrays["pc_chunk"].tolist()):
+        chunk_lists[i][slot] = with_first_word(
+            scudo_parser.parse_chunk_header_word(hex(addr), pc_words[k]),
+            pc_firsts[k])
+
+    regions = []
+    start = 0
+    for class_id, (beg, allocated, count) in enumerate(zip(
+            arrays["region_beg"].tolist(),
+            arrays["region_allocated"].tolist(),
+            arrays["region_chunks"].tolist())):
+        region_info = RegionInfo(class_id, None, 0, hex(beg), hex(allocated),
+                                 None, None, None)
+        if count:
+            end = start + count
+            region_info.columns = scudo_columns.ChunkColumns(
+                class_id, scuheap.perclass_array[class_id].class_size,
+                arrays["chunk_addr"][start:end],
+                arrays["chunk_word"][start:end],
+                arrays["chunk_first"][start:end])
+            start = end
+        regions.append(region_info)
+    scuheap.fill_region_info(regions)
+
+    in_use = []
+    for row, word, first in zip(arrays["in_use"].tolist(),
+                                arrays["in_use_word"].tolist(),
+                                arrays["in_use_first"].tolist()):
+        item = SecondaryInUseBlocksPtr(*([hex(v) for v in row] +
+                                         [header_mem(word)]))
+        with_first_word(item.large_block.chunk_header, first)
+        scuheap.user_addr_map[int(item.large_block.user_start_addr,
+                                  16)] = item
+        in_use.append(item)
+    cache = []
+    for row, word, first in zip(arrays["cache"].tolist(),
+                                arrays["cache_word"].tolist(),
+                                arrays["cache_first"].tolist()):
+        item = SecondaryCacheEntry(*([hex(v) for v in row] +
+                                     [header_mem(word)]))
+        with_first_word(item.large_block.chunk_header, first)
+        scuheap.user_addr_map[int(item.large_block.user_start_addr,
+                                  16)] = item
+        cache.append(item)
+    scuheap.fill_secondary(Secondary(cache, in_use, *meta["secondary"]))
+
+    for word, name in zip(arrays["sym_word"].tolist(),
+                          arrays["sym_name"].tolist()):
+        symbol_cache[word] = name or None
+    return scuheap, meta
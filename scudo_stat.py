@@ -0,0 +1,180 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Statistics of the chunks in use per symbol for scustat. Chunks are fed a
+# region at a time and each group only keeps counters: the number and
+# total used bytes of its chunks, a power of two histogram of the used
+# bytes, the class sizes and origins, and its largest chunks for the
+# detail listing. Memory follows the number of groups, not of chunks.
+
+import heapq
+from gdb_common import numpy
+
+# chunks of a group kept for the detail listing
+DETAIL_MAX = 32
+# histogram bucket i counts the chunks of at most 2**i used bytes, the
+# last one everything larger
+BUCKETS = 24
+ORIGINS = ("Malloc", "New", "NewArray", "Memalign")
+
+
+def bucket(used_bytes):
+    return min(max(used_bytes - 1, 0).bit_length(), BUCKETS - 1)
+
+
+class GroupStat:
+    """Counters of the chunks of one symbol."""
+
+    def __init__(self, name, index, detail_max):
+        self.name = name
+        self.index = index
+        self.count = 0
+        self.used_bytes = 0
+        self.histogram = [0] * BUCKETS
+        self.class_sizes = {}
+        self.origins = [0] * len(ORIGINS)
+        self.detail_max = detail_max
+        # min heap of (used_bytes, -addr, header), the largest chunks
+        self.largest = []
+
+    def add_sample(self, used_bytes, addr, make_header):
+        """keep the chunk if it is among the largest, make_header() gives
+        its ChunkHeader"""
+        key = (used_bytes, -addr)
+        if self.detail_max is None or len(self.largest) < self.detail_max:
+            heapq.heappush(self.largest, key + (make_header(),))
+        elif key > self.largest[0][:2]:
+            heapq.heapreplace(self.largest, key + (make_header(),))
+
+    def samples(self, limit=None):
+        """ChunkHeaders of the limit largest chunks kept, by address"""
+        largest = self.largest
+        if limit is not None and limit < len(largest):
+            largest = heapq.nlargest(limit, largest,
+                                     key=lambda item: item[:2])
+        return [item[2] for item in sorted(largest,
+                                           key=lambda item: -item[1])]
+
+    def summary(self):
+        sizes = " ".join("{}:{}".format(size if size else "secondary",
+                                        self.class_sizes[size])
+                         for size in sorted(self.class_sizes))
+        origins = " ".join("{}:{}".format(name, n)
+                           for name, n in zip(ORIGINS, self.origins) if n)
+        histogram = " ".join("<={}:{}".format(1 << i, n) if i < BUCKETS - 1
+                             else ">{}:{}".format(1 << (i - 1), n)
+                             for i, n in enumerate(self.histogram) if n)
+        return "class_size {}  origin {}  used_bytes {}".format(
+            sizes, origins, histogram)
+
+
+class ChunkStat:
+    """GroupStat of every symbol, in the order the symbols were seen."""
+
+    def __init__(self, detail_max=DETAIL_MAX):
+        self.detail_max = detail_max
+        self.groups = {}
+        self.order = []
+        self.chunks = 0
+
+    def group(self, name):
+        group = self.groups.get(name)
+        if group is None:
+            group = GroupStat(name, len(self.order), self.detail_max)
+            self.groups[name] = group
+            self.order.append(group)
+        return group
+
+    def add(self, name, used_bytes, class_size, origin, addr, make_header):
+        """one chunk; origin is the ORIGI_DICT key"""
+        group = self.group(name)
+        group.count += 1
+        group.used_bytes += used_bytes
+        group.histogram[bucket(used_bytes)] += 1
+        group.class_sizes[class_size] = \
+            group.class_sizes.get(class_size, 0) + 1
+        group.origins[origin >> 2] += 1
+        group.add_sample(used_bytes, addr, make_header)
+        self.chunks += 1
+
+    def add_region(self, columns, indices, symbols):
+        """the chunks indices of a scudo_columns.ChunkColumns whose first
+        word has a name in symbols"""
+        if numpy is None:
+            for i in indices:
+                name = symbols.get(columns.first_word[i])
+                if name:
+                    self.add(name, columns.size_or_unused[i],
+                             columns.class_size, columns.origin[i],
+                             columns.addr[i], lambda i=i: columns.header(i))
+            return
+        if not len(indices):
+            return
+        words, first, inverse = numpy.unique(
+            columns.first_word[indices], return_index=True,
+            return_inverse=True)
+        ids = numpy.full(len(words), -1, dtype=numpy.intp)
+        # new groups in the order of their first chunk
+        for k in numpy.argsort(first, kind="mergesort").tolist():
+            name = symbols.get(int(words[k]))
+            if name:
+                ids[k] = self.group(name).index
+        codes = ids[inverse]
+        keep = codes >= 0
+        codes = codes[keep]
+        indices = numpy.asarray(indices)[keep]
+        if not len(indices):
+            return
+        used = columns.size_or_unused[indices]
+        n = len(self.order)
+        count = numpy.bincount(codes, minlength=n)
+        total = numpy.bincount(codes, used.astype(numpy.float64), minlength=n)
+        buckets = numpy.minimum(
+            numpy.searchsorted(numpy.uint64(1) << numpy.arange(
+                BUCKETS, dtype=numpy.uint64), used), BUCKETS - 1)
+        histogram = numpy.bincount(codes * BUCKETS + buckets,
+                                   minlength=n * BUCKETS).reshape(n, BUCKETS)
+        origins = numpy.bincount(
+            codes * len(ORIGINS) + (columns.origin[indices] >> 2).astype(
+                numpy.intp), minlength=n * len(ORIGINS)).reshape(n, -1)
+        for k in numpy.flatnonzero(count).tolist():
+            group = self.order[k]
+            group.count += int(count[k])
+            group.used_bytes += int(total[k])
+            for b in numpy.flatnonzero(histogram[k]).tolist():
+                group.histogram[b] += int(histogram[k][b])
+            group.class_sizes[columns.class_size] = \
+                group.class_sizes.get(columns.class_size, 0) + int(count[k])
+            for o in range(len(ORIGINS)):
+                group.origins[o] += int(origins[k][o])
+        # the largest chunks of every group: sort by group, used bytes
+        # descending and address, then take the head of each group
+        addrs = columns.addr[indices]
+        order = numpy.lexsort((addrs, -used.astype(numpy.int64), codes))
+        if self.detail_max is not None:
+            starts = numpy.searchsorted(codes[order], numpy.arange(n))
+            rank = numpy.arange(len(order)) - starts[codes[order]]
+            order = order[rank < self.detail_max]
+        for j in order.tolist():
+            i = int(indices[j])
+            self.order[codes[j]].add_sample(
+                int(used[j]), int(addrs[j]), lambda i=i: columns.header(i))
+        self.chunks += len(indices)
+
+    def by_hits(self):
+        return sorted(self.order, key=lambda group: group.count, reverse=True)
+
+    def by_size(self):
+        return sorted(self.order, key=lambda group: group.used_bytes,
+                      reverse=True)
@@ -0,0 +1,372 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Address to symbol lookups without asking gdb. The .symtab and .dynsym of
+# every mapped ELF found under gdb_elf.SYMBOL_ROOT are read once into
+# sorted address arrays, relocated by the load bias of their mapping, and
+# searched with bisect (or numpy.searchsorted for a whole batch).
+#
+#   sym = symbolizer.get_symbolizer()
+#   sym.lookup(0x7a1c2e4010)          -> ("_ZTV3Foo", 16) or None
+#   sym.lookup_many(words)            -> [("_ZTV3Foo", 16), None, ...]
+
+import os
+import mmap
+import struct
+from bisect import bisect_right
+try:
+    import gdb
+except ImportError:
+    gdb = None
+import gdb_common
+import gdb_elf
+from gdb_common import numpy
+
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+SHN_UNDEF = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+PT_LOAD = 1
+PAGE_MASK = ~0xfff
+
+
+class ElfSymbols:
+    """FUNC and OBJECT symbols of one ELF file, sorted by address."""
+
+    def __init__(self, path):
+        self.path = path
+        self.loads = []
+        self.names = {}
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.parse(mm)
+            finally:
+                mm.close()
+
+    def parse(self, mm):
+        if mm[:4] != b"\x7fELF":
+            raise ValueError("{} is not an ELF file".format(self.path))
+        is_64 = bytearray(mm[4:5])[0] == 2
+        prefix = ">" if bytearray(mm[5:6])[0] == 2 else "<"
+        if is_64:
+            e_phoff, e_shoff = struct.unpack_from(prefix + "QQ", mm, 0x20)
+            e_phentsize, e_phnum, e_shentsize, e_shnum = \
+                struct.unpack_from(prefix + "HHHH", mm, 0x36)
+            phdr = struct.Struct(prefix + "IIQQQQQQ")
+            shdr = struct.Struct(prefix + "IIQQQQIIQQ")
+        else:
+            e_phoff, e_shoff = struct.unpack_from(prefix + "II", mm, 0x1c)
+            e_phentsize, e_phnum, e_shentsize, e_shnum = \
+                struct.unpack_from(prefix + "HHHH", mm, 0x2a)
+            phdr = struct.Struct(prefix + "IIIIIIII")
+            shdr = struct.Struct(prefix + "IIIIIIIIII")
+
+        for i in range(e_phnum):
+            ph = phdr.unpack_from(mm, e_phoff + i * e_phentsize)
+            if ph[0] != PT_LOAD:
+                continue
+            if is_64:
+                self.loads.append((ph[2], ph[3]))
+            else:
+                self.loads.append((ph[1], ph[2]))
+
+        sections = [shdr.unpack_from(mm, e_shoff + i * e_shentsize)
+                    for i in range(e_shnum)]
+        tables = []
+        # .dynsym first, so .symtab names win for aliased addresses
+        for sh_type in (SHT_DYNSYM, SHT_SYMTAB):
+            for sh in sections:
+                if sh[1] != sh_type:
+                    continue
+                strtab = sections[sh[6]]
+                tables.append(self.read_table(
+                    mm, sh[4], sh[5], is_64, prefix,
+                    bytes(mm[strtab[4]:strtab[4] + strtab[5]])))
+        self.merge(tables)
+
+    def read_table(self, mm, offset, size, is_64, prefix, strtab):
+        base = len(self.names)
+        self.names[base] = strtab
+        if numpy is not None:
+            if is_64:
+                dtype = numpy.dtype([("name", prefix + "u4"),
+                                     ("info", "u1"), ("other", "u1"),
+                                     ("shndx", prefix + "u2"),
+                                     ("value", prefix + "u8"),
+                                     ("size", prefix + "u8")])
+            else:
+                dtype = numpy.dtype([("name", prefix + "u4"),
+                                     ("value", prefix + "u4"),
+                                     ("size", prefix + "u4"),
+                                     ("info", "u1"), ("other", "u1"),
+                                     ("shndx", prefix + "u2")])
+            syms = numpy.frombuffer(mm[offset:offset + size], dtype=dtype)
+            kind = syms["info"] & 0xf
+            keep = ((kind == STT_FUNC) | (kind == STT_OBJECT)) & \
+                (syms["shndx"] != SHN_UNDEF) & (syms["value"] != 0)
+            syms = syms[keep]
+            return (syms["value"].astype(numpy.uint64),
+                    syms["size"].astype(numpy.uint64),
+                    syms["name"].astype(numpy.int64),
+                    numpy.full(len(syms), base, dtype=numpy.int64))
+        if is_64:
+            sym = struct.Struct(prefix + "IBBHQQ")
+            fields = lambda s: (s[4], s[5], s[0], s[1], s[3])
+        else:
+            sym = struct.Struct(prefix + "IIIBBH")
+            fields = lambda s: (s[1], s[2], s[0], s[3], s[5])
+        result = []
+        for off in range(offset, offset + size - sym.size + 1, sym.size):
+            value, st_size, name, info, shndx = fields(
+                sym.unpack_from(mm, off))
+            if info & 0xf in (STT_FUNC, STT_OBJECT) and \
+                    shndx != SHN_UNDEF and value:
+                result.append((value, st_size, name, base))
+        return result
+
+    def merge(self, tables):
+        if numpy is not None:
+            if not tables:
+                tables = [(numpy.zeros(0, numpy.uint64),) * 2 +
+                          (numpy.zeros(0, numpy.int64),) * 2]
+            value, size, name, table = [numpy.concatenate(col)
+                                        for col in zip(*tables)]
+            # stable, so the last table (.symtab) keeps aliased addresses
+            order = numpy.argsort(value, kind="mergesort")
+            value, size, name, table = \
+                value[order], size[order], name[order], table[order]
+            last = numpy.ones(len(value), dtype=bool)
+            last[:-1] = value[1:] != value[:-1]
+            self.addrs = value[last]
+            self.sizes = size[last]
+            self.name_offs = name[last]
+            self.tables = table[last]
+            return
+        merged = {}
+        for rows in tables:
+            for value, size, name, table in rows:
+                merged[value] = (size, name, table)
+        self.addrs = sorted(merged)
+        self.sizes = [merged[a][0] for a in self.addrs]
+        self.name_offs = [merged[a][1] for a in self.addrs]
+        self.tables = [merged[a][2] for a in self.addrs]
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def name(self, i):
+        strtab = self.names[int(self.tables[i])]
+        off = int(self.name_offs[i])
+        end = strtab.find(b"\0", off)
+        return strtab[off:end if end != -1 else None].decode(
+            "utf-8", "replace")
+
+    def find(self, vaddr):
+        """index of the symbol holding the link time address vaddr"""
+        i = bisect_right(self.addrs, vaddr) - 1
+        if i < 0:
+            return -1
+        size = int(self.sizes[i])
+        # sizeless symbols cover everything up to the next one, like gdb
+        if size and vaddr >= int(self.addrs[i]) + size:
+            return -1
+        return i
+
+    def load_bias(self, start, offset):
+        """bias of a mapping of file offset offset placed at start"""
+        for p_offset, p_vaddr in self.loads:
+            if p_offset & PAGE_MASK == offset:
+                return start - (p_vaddr & PAGE_MASK)
+        if offset == 0 and self.loads:
+            return start - (min(v for _, v in self.loads) & PAGE_MASK)
+        return None
+
+
+class Module:
+    def __init__(self, path, elf, start, end, bias):
+        self.path = path
+        self.elf = elf
+        self.start = start
+        self.end = end
+        self.bias = bias
+
+
+class Symbolizer:
+    def __init__(self, symbol_root=None):
+        self.symbol_root = symbol_root or gdb_elf.SYMBOL_ROOT
+        self.modules = []
+        self.starts = []
+        self.elfs = {}
+        self.name_index = None
+
+    def elf(self, path):
+        if path not in self.elfs:
+            elf_path = os.path.join(self.symbol_root, path.lstrip("/"))
+            elf = None
+            if os.path.isfile(elf_path):
+                try:
+                    elf = ElfSymbols(elf_path)
+                except (IOError, OSError, ValueError, struct.error) as e:
+                    print("[parser] cannot read symbols of {}: {}".format(
+                        elf_path, e))
+            self.elfs[path] = elf
+        return self.elfs[path]
+
+    def add_mappings(self, mappings):
+        """mappings: (start, end, offset, path) of the file backed maps"""
+        ranges = {}
+        for start, end, offset, path in mappings:
+            elf = self.elf(path)
+            if elf is None:
+                continue
+            r = ranges.setdefault(path, [start, end, None])
+            r[0] = min(r[0], start)
+            r[1] = max(r[1], end)
+            if r[2] is None:
+                r[2] = elf.load_bias(start, offset)
+        for path, (start, end, bias) in ranges.items():
+            if bias is not None:
+                self.add_module(path, self.elfs[path], start, end, bias)
+
+    def add_elf(self, path, bias=0):
+        """a statically placed image, e.g. a firmware elf"""
+        elf = ElfSymbols(path)
+        if not len(elf):
+            return
+        start = int(elf.addrs[0]) + bias
+        end = int(elf.addrs[-1]) + max(int(elf.sizes[-1]), 1) + bias
+        self.elfs[path] = elf
+        self.add_module(path, elf, start, end, bias)
+
+    def add_module(self, path, elf, start, end, bias):
+        self.modules.append(Module(path, elf, start, end, bias))
+        self.modules.sort(key=lambda m: m.start)
+        self.starts = [m.start for m in self.modules]
+        self.name_index = None
+
+    def find_module(self, addr):
+        i = bisect_right(self.starts, addr) - 1
+        if i < 0 or addr >= self.modules[i].end:
+            return None
+        return self.modules[i]
+
+    def lookup(self, addr):
+        """(symbol, offset) of the symbol holding addr, None if unknown"""
+        module = self.find_module(addr)
+        if module is None:
+            return None
+        vaddr = addr - module.bias
+        i = module.elf.find(vaddr)
+        if i < 0:
+            return None
+        return (module.elf.name(i), vaddr - int(module.elf.addrs[i]))
+
+    def lookup_array(self, addrs):
+        """module and symbol index plus offset for every address, -1 as
+        module index where nothing matched; needs numpy"""
+        addrs = numpy.asarray(addrs, dtype=numpy.uint64)
+        modules = numpy.full(len(addrs), -1, dtype=numpy.int64)
+        symbols = numpy.full(len(addrs), -1, dtype=numpy.int64)
+        offsets = numpy.zeros(len(addrs), dtype=numpy.uint64)
+        if not self.modules:
+            return modules, symbols, offsets
+        starts = numpy.asarray(self.starts, dtype=numpy.uint64)
+        mod_index = numpy.searchsorted(starts, addrs, side="right") - 1
+        # group the addresses by module once instead of a mask per module
+        order = numpy.argsort(mod_index, kind="mergesort")
+        bounds = numpy.searchsorted(mod_index[order],
+                                    numpy.arange(len(self.modules) + 1))
+        for m, module in enumerate(self.modules):
+            elf = module.elf
+            sel = order[bounds[m]:bounds[m + 1]]
+            sel = sel[addrs[sel] < numpy.uint64(module.end)]
+            if not len(sel) or not len(elf):
+                continue
+            vaddrs = addrs[sel] - numpy.uint64(module.bias)
+            sym = numpy.searchsorted(elf.addrs, vaddrs, side="right") - 1
+            found = sym >= 0
+            sym = numpy.where(found, sym, 0)
+            sizes = elf.sizes[sym]
+            # sizeless symbols cover everything up to the next one
+            found &= (sizes == 0) | (vaddrs < elf.addrs[sym] + sizes)
+            sel = sel[found]
+            modules[sel] = m
+            symbols[sel] = sym[found]
+            offsets[sel] = vaddrs[found] - elf.addrs[sym[found]]
+        return modules, symbols, offsets
+
+    def lookup_many(self, addrs):
+        """lookup() for a batch of addresses, vectorized with numpy"""
+        if numpy is None:
+            return [self.lookup(int(addr)) for addr in addrs]
+        modules, symbols, offsets = self.lookup_array(addrs)
+        result = [None] * len(modules)
+        names = {}
+        for j in numpy.flatnonzero(modules >= 0):
+            key = (int(modules[j]), int(symbols[j]))
+            if key not in names:
+                names[key] = self.modules[key[0]].elf.name(key[1])
+            result[j] = (names[key], int(offsets[j]))
+        return result
+
+    def address_of(self, name):
+        """runtime address of a symbol by name, None if unknown"""
+        if self.name_index is None:
+            self.name_index = {}
+            for module in self.modules:
+                for i in range(len(module.elf)):
+                    self.name_index.setdefault(
+                        module.elf.name(i),
+                        int(module.elf.addrs[i]) + module.bias)
+        return self.name_index.get(name)
+
+
+def target_mappings():
+    """(start, end, offset, path) of the file backed target mappings"""
+    source = gdb_common.get_memory_source()
+    if hasattr(source, "file_mappings"):
+        return source.file_mappings()
+    if gdb is None:
+        return []
+    try:
+        raw_out = gdb_common.gdb_execute("info proc mappings")
+    except Exception as e:
+        return []
+    mappings = []
+    for items in gdb_elf.parse_mapping(raw_out):
+        # start end size offset [perms] objfile
+        if len(items) < 5 or not items[0].startswith("0x") or \
+                not items[-1].startswith("/"):
+            continue
+        mappings.append((int(items[0], 16), int(items[1], 16),
+                         int(items[3], 16), items[-1]))
+    return mappings
+
+
+symbolizer = None
+
+
+def get_symbolizer():
+    global symbolizer
+    if symbolizer is None:
+        symbolizer = Symbolizer()
+        symbolizer.add_mappings(target_mappings())
+    return symbolizer
+
+
+def reset():
+    global symbolizer
+    symbolizer = None
@@ -103,23 +103,28 @@ def to_lendian_list(s):
         result.append(s[i-1:i+1])
     return result
 
-def search_bytes(mem, search_for_bytes, addr_begin, class_size=None):
+def search_bytes(mem, search_for_bytes, addr_begin, class_size=None,
+                 holes=None):
+    # scudsearch uses mem_search, this is the single pattern version
     search_for_len = len(search_for_bytes)
-    off = 0
-    whole_word_len = len(mem)
     matches = []
-    while (off + search_for_len <= whole_word_len):
-        if mem[off:off+search_for_len] == search_for_bytes:
-            found_addr = addr_begin + off
-            if class_size:
-                matches.append((found_addr, addr_begin +
-                                (off//class_size)*class_size))
-                print("found ", hex(found_addr), hex(
-                    addr_begin + (off//class_size)*class_size))
-            else:
-                matches.append((found_addr, addr_begin))
-                print("found ", hex(found_addr), hex(addr_begin))
-            off += search_for_len
+    if not search_for_len:
+        return matches
+    off = mem.find(search_for_bytes)
+    while off >= 0:
+        found_addr = addr_begin + off
+        if holes is not None and \
+                holes.missing(found_addr, search_for_len):
+            # zero filled page of a partial dump
+            off = mem.find(search_for_bytes, off + 1)
+            continue
+        if class_size:
+            matches.append((found_addr, addr_begin +
+                            (off//class_size)*class_size))
+            print("found ", hex(found_addr), hex(
+                addr_begin + (off//class_size)*class_size))
         else:
-            off += 1
+            matches.append((found_addr, addr_begin))
+            print("found ", hex(found_addr), hex(addr_begin))
+        off = mem.find(search_for_bytes, off + search_for_len)
     return matches
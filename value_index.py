@@ -0,0 +1,231 @@
+# Copyright 2016 Xiaomi, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Index of the aligned words of the heap, so repeated scudsearch runs on a
+# core are lookups instead of scans. Every non zero pointer sized word of
+# the searched spans is kept sorted by value next to its position. A
+# pointer range is two binary searches; a byte pattern is looked up by an
+# aligned word it must contain, for each alignment it may start at, and
+# the candidates are checked against memory. The index is saved next to
+# the core and needs numpy.
+
+import os
+import time
+import gdb_common
+import mem_search
+import profiler
+from gdb_common import numpy
+
+INDEX_SUFFIX = ".heapidx.npz"
+FORMAT_VERSION = 1
+
+query_stats = {"queries": 0, "answered": 0, "seconds": 0.0}
+
+
+class ValueIndex:
+    """Non zero aligned words of spans [(addr, size)], sorted by value."""
+
+    def __init__(self, spans, word_size, values, positions):
+        self.spans = numpy.asarray(spans, dtype=numpy.uint64).reshape(-1, 2)
+        self.word_size = word_size
+        self.values = values
+        # word number counted over all spans, see addr_of
+        self.positions = positions
+        first = (-self.spans[:, 0]) % numpy.uint64(word_size)
+        self.first_addr = self.spans[:, 0] + first
+        words = numpy.where(self.spans[:, 1] > first,
+                            (self.spans[:, 1] - first) //
+                            numpy.uint64(word_size), 0)
+        self.first_word = numpy.zeros(len(words), dtype=numpy.uint64)
+        self.first_word[1:] = numpy.cumsum(words)[:-1]
+        self.span_end = self.spans[:, 0] + self.spans[:, 1]
+        self.build_seconds = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def nbytes(self):
+        return self.values.nbytes + self.positions.nbytes
+
+    def addr_of(self, positions):
+        positions = numpy.asarray(positions, dtype=numpy.uint64)
+        span = numpy.searchsorted(self.first_word, positions,
+                                  side="right") - 1
+        return self.first_addr[span] + \
+            (positions - self.first_word[span]) * \
+            numpy.uint64(self.word_size)
+
+    def lookup_range(self, low, high):
+        """sorted addresses of the words in [low, high)"""
+        high = min(high, (1 << 64) - 1)
+        lo = numpy.searchsorted(self.values, numpy.uint64(low))
+        hi = numpy.searchsorted(self.values, numpy.uint64(high))
+        return numpy.sort(self.addr_of(self.positions[lo:hi]))
+
+    def lookup(self, value):
+        return self.lookup_range(value, value + 1)
+
+    def keys(self, pattern):
+        """[(offset, word)]: for every alignment a match can start at, a
+        non zero word the match holds at an aligned offset; None when
+        some alignment has none"""
+        size = self.word_size
+        keys = []
+        for phase in range(size):
+            offset = -phase % size
+            key = None
+            while offset + size <= pattern.size:
+                values = pattern.values[offset:offset + size]
+                if all(mask == 0xff for _, mask in values):
+                    word = gdb_common.bytes2num(
+                        bytearray(v for v, _ in values), size)
+                    if word:
+                        key = (offset, word)
+                        break
+                offset += size
+            if key is None:
+                return None
+            keys.append(key)
+        return keys
+
+    def span_of(self, addr):
+        i = int(numpy.searchsorted(self.spans[:, 0], numpy.uint64(addr),
+                                   side="right")) - 1
+        return i if i >= 0 and addr < int(self.span_end[i]) else -1
+
+    def search(self, pattern):
+        """sorted addresses of the matches of a mem_search.SearchPattern,
+        None when the index cannot answer it"""
+        start = time.time()
+        query_stats["queries"] += 1
+        if pattern.is_range():
+            if pattern.low == 0:
+                # zero words are not kept
+                return None
+            found = self.lookup_range(pattern.low, pattern.high).tolist()
+        else:
+            keys = self.keys(pattern)
+            if keys is None:
+                return None
+            candidates = set()
+            for offset, word in set(keys):
+                candidates.update(
+                    (self.lookup(word) - numpy.uint64(offset)).tolist())
+            found = []
+            next_addr = 0
+            for addr in sorted(candidates):
+                if addr < next_addr:
+                    continue
+                span = self.span_of(addr)
+                if span < 0 or addr + pattern.size > int(self.span_end[span]):
+                    continue
+                try:
+                    buf = gdb_common.read_bytes(addr, pattern.size)
+                except Exception:
+                    continue
+                if pattern.regex.match(buf):
+                    found.append(addr)
+                    next_addr = addr + pattern.size
+        query_stats["answered"] += 1
+        query_stats["seconds"] += time.time() - start
+        return found
+
+    def info(self):
+        return {"entries": len(self),
+                "bytes": self.nbytes(),
+                "spans": len(self.spans),
+                "span_bytes": int(self.spans[:, 1].sum()),
+                "build_seconds": self.build_seconds}
+
+    def matches(self, spans, word_size):
+        spans = numpy.asarray(spans, dtype=numpy.uint64).reshape(-1, 2)
+        return word_size == self.word_size and \
+            numpy.array_equal(spans, self.spans)
+
+    def save(self, path, core_path):
+        meta = numpy.array([FORMAT_VERSION, self.word_size] +
+                           core_stamp(core_path) +
+                           [int((self.build_seconds or 0) * 1000)],
+                           dtype=numpy.uint64)
+        with open(path + ".tmp", "wb") as f:
+            numpy.savez(f, meta=meta, spans=self.spans, values=self.values,
+                        positions=self.positions)
+        os.rename(path + ".tmp", path)
+
+
+def core_stamp(core_path):
+    st = os.stat(core_path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def build(spans, word_size, window=mem_search.WINDOW_SIZE):
+    """ValueIndex of the non zero aligned words of spans"""
+    start = time.time()
+    dtype = numpy.uint64 if word_size == 8 else numpy.uint32
+    values = []
+    positions = []
+    base = 0
+    for addr, size in spans:
+        first = -addr % word_size
+        nwords = max(size - first, 0) // word_size
+        # whole words per window, so windows need no overlap
+        step = max(window // word_size, 1)
+        for w in range(0, nwords, step):
+            count = min(step, nwords - w)
+            buf, holes = gdb_common.read_sparse(
+                addr + first + w * word_size, count * word_size)
+            # holes read as zero, so they drop out with the zero words
+            words = gdb_common.words_array(buf, word_size, count)
+            nonzero = numpy.flatnonzero(words)
+            values.append(words[nonzero].astype(dtype))
+            positions.append(nonzero.astype(numpy.uint64) +
+                             numpy.uint64(base + w))
+        base += nwords
+    values = numpy.concatenate(values) if values else \
+        numpy.zeros(0, dtype=dtype)
+    positions = numpy.concatenate(positions) if positions else \
+        numpy.zeros(0, dtype=numpy.uint64)
+    if base < 1 << 32:
+        positions = positions.astype(numpy.uint32)
+    order = numpy.argsort(values)
+    index = ValueIndex(spans, word_size, values[order], positions[order])
+    index.build_seconds = time.time() - start
+    return index
+
+
+def load(path, core_path):
+    """ValueIndex saved at path, None when it is missing or stale"""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with numpy.load(path) as data:
+            meta = data["meta"].tolist()
+            if meta[0] != FORMAT_VERSION or \
+                    meta[2:4] != core_stamp(core_path):
+                print("[parser] ignore stale heap index {}".format(path))
+                return None
+            index = ValueIndex(data["spans"], int(meta[1]), data["values"],
+                               data["positions"])
+            index.build_seconds = meta[4] / 1000.0
+            return index
+    except (IOError, OSError, ValueError, KeyError, IndexError) as e:
+        print("[parser] ignore heap index {}: {}".format(path, e))
+        return None
+
+
+def index_path(core_path):
+    return core_path + INDEX_SUFFIX
+
+
+profiler.add_counters("value_index", lambda: dict(query_stats))